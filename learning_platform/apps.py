@@ -3,3 +3,14 @@ from django.apps import AppConfig
 
 class LearningPlatformConfig(AppConfig):
     name = 'learning_platform'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from . import signals  # noqa: F401 - registers the signal handlers
+        from .metrics import install_query_counter
+        from .profiling import get_profiling_settings, install_sql_capture
+
+        connection_created.connect(install_query_counter)
+        if get_profiling_settings()['ENABLED']:
+            connection_created.connect(install_sql_capture)
@@ -0,0 +1,476 @@
+"""
+Benchmark suite (see `python manage.py run_benchmarks`).
+
+Every run happens in a throwaway database and media directory, with the
+OpenAI clients replaced by llm_stub clients, the LLM cache and rate limits
+off, so runs are repeatable and never touch real data or the API. The
+synthetic students, scripts and report cards come from synthetic.py.
+
+Each benchmark returns a dict of plain numbers; run_suite collects them
+with some metadata into one JSON-serializable result.
+"""
+import copy
+import math
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from unittest import mock
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import OperationalError, connection, connections, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+from .extraction import extract_text_from_file
+from .jobs import claim_job, claim_next_job, enqueue_script, run_job
+from .llm_stub import AsyncStubOpenAI, StubOpenAI
+from .metrics import reset_metrics
+from .models import ProcessingJob, ReportCard, Student, StudentStats, StudyPlan, UploadedScript
+from .synthetic import SCRIPT_FORMATS, report_card, report_card_pdf, report_cards, script_file
+
+RESULT_VERSION = 1
+
+
+def percentile(sorted_samples, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_samples:
+        return None
+    # Rounded first so float error (0.07 * 100 = 7.000000000000001) can't push it up a rank
+    rank = math.ceil(round(fraction * len(sorted_samples), 9))
+    index = min(len(sorted_samples) - 1, max(0, rank - 1))
+    return sorted_samples[index]
+
+
+def summarize(samples):
+    """Count, mean and percentiles (in milliseconds) of durations in seconds"""
+    ordered = sorted(samples)
+    if not ordered:
+        return {'count': 0}
+    return {
+        'count': len(ordered),
+        'total_s': round(sum(ordered), 4),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3),
+        'p50_ms': round(percentile(ordered, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(ordered, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(ordered, 0.99) * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, timeout=5, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+@contextmanager
+def benchmark_environment(llm_latency=0.0):
+    """
+    A test database, temporary media/index directories, stub OpenAI clients
+    and no LLM cache or rate limits, all undone on exit. Yields the sync
+    stub client so callers can count LLM calls.
+    """
+    stub = StubOpenAI(latency=llm_latency)
+    async_stub = AsyncStubOpenAI(latency=llm_latency)
+    with ExitStack() as stack:
+        directory = stack.enter_context(tempfile.TemporaryDirectory(prefix='benchmarks_'))
+        stack.enter_context(override_settings(
+            MEDIA_ROOT=os.path.join(directory, 'media'),
+            VECTOR_INDEX={**getattr(settings, 'VECTOR_INDEX', {}), 'PATH': os.path.join(directory, 'vector_index')},
+            LLM_CACHE={**getattr(settings, 'LLM_CACHE', {}), 'ENABLED': False},
+            RATE_LIMITS={**getattr(settings, 'RATE_LIMITS', {}), 'ENABLED': False},
+            METRICS={**getattr(settings, 'METRICS', {}), 'PATH': os.path.join(directory, 'metrics')},
+            CAREER_SCORING={**getattr(settings, 'CAREER_SCORING', {}), 'LLM_ENRICHMENT': True},
+        ))
+        reset_metrics()
+        stack.callback(reset_metrics)
+        stack.enter_context(mock.patch('learning_platform.views.get_openai_client', return_value=stub))
+        stack.enter_context(mock.patch('learning_platform.views.get_async_openai_client', return_value=async_stub))
+
+        setup_test_environment()
+        stack.callback(teardown_test_environment)
+        # A file database even for SQLite: the pipeline writes from several threads
+        if connection.vendor == 'sqlite':
+            connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(directory, 'benchmark.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        stack.callback(connection.creation.destroy_test_db, old_name, verbosity=0)
+        yield stub
+
+
+def create_students(count):
+    students = []
+    for i in range(count):
+        user = User.objects.create_user(username=f"bench_student_{i}", password=None)
+        students.append(Student.objects.create(user=user, grade_level='Grade 11'))
+    return students
+
+
+def benchmark_extract_text(rng, formats, pages, files_per_format, directory):
+    """
+    extract_text_from_file on freshly written files of each format, with
+    per-page times for PDFs
+    """
+    results = {}
+    for file_format in formats:
+        durations, chars, page_seconds = [], 0, []
+        for _ in range(files_per_format):
+            name, data, _ = script_file(rng, file_format, pages)
+            path = os.path.join(directory, name)
+            with open(path, 'wb') as f:
+                f.write(data)
+            stats = {}
+            started = time.perf_counter()
+            text = extract_text_from_file(path, stats=stats)
+            durations.append(time.perf_counter() - started)
+            chars += len(text)
+            page_seconds.extend(stats.get('page_seconds', []))
+        summary = summarize(durations)
+        summary['chars_per_s'] = round(chars / summary['total_s']) if summary.get('total_s') else None
+        if page_seconds:
+            summary['page'] = summarize(page_seconds)
+        results[file_format] = summary
+    return results
+
+
+def benchmark_extract_grades(count, seed):
+    """extract_grades_from_text over synthetic report card text"""
+    from .views import extract_grades_from_text
+
+    cards = report_cards(count, seed=seed)
+    durations = []
+    correct = 0
+    for card in cards:
+        started = time.perf_counter()
+        grades = extract_grades_from_text(card['text'])
+        durations.append(time.perf_counter() - started)
+        correct += grades == card['expected']
+    summary = summarize(durations)
+    summary['cards_per_s'] = round(len(cards) / summary['total_s']) if summary.get('total_s') else None
+    summary['exact'] = correct
+    return summary
+
+
+def _run_uploaded_job(response):
+    job_id = response.json()['job_id']
+    job = claim_job(ProcessingJob.objects.values_list('pk', flat=True).get(job_id=job_id))
+    started = time.perf_counter()
+    job = run_job(job)
+    return job, time.perf_counter() - started
+
+
+def benchmark_upload_pipeline(rng, students, scripts_per_student, formats, pages, report_cards_per_student, stub):
+    """
+    Upload scripts and report cards through the views and run their jobs
+    in-process: request latency, processing time and per-stage timings
+    """
+    client = Client(HTTP_ACCEPT='application/json')
+    upload, process, report_upload, report_process = [], [], [], []
+    stages = {}
+    failed = 0
+    calls_before = stub.calls
+    for student in students:
+        client.force_login(student.user)
+        for i in range(scripts_per_student):
+            name, data, _ = script_file(rng, formats[i % len(formats)], pages)
+            started = time.perf_counter()
+            response = client.post(reverse('upload_script'), {
+                'script_file': SimpleUploadedFile(name, data), 'title': name, 'subject': 'Science',
+            })
+            upload.append(time.perf_counter() - started)
+            job, seconds = _run_uploaded_job(response)
+            process.append(seconds)
+            failed += job.status != ProcessingJob.STATUS_DONE
+            for stage, stage_seconds in (job.timings or {}).items():
+                if isinstance(stage_seconds, (int, float)):
+                    stages.setdefault(stage, []).append(stage_seconds)
+
+        for _ in range(report_cards_per_student):
+            card = report_card(rng, layout='table')
+            started = time.perf_counter()
+            response = client.post(reverse('upload_report_card'), {
+                'report_card_file': SimpleUploadedFile('report-card.pdf', report_card_pdf(card)),
+            })
+            report_upload.append(time.perf_counter() - started)
+            job, seconds = _run_uploaded_job(response)
+            report_process.append(seconds)
+            failed += job.status != ProcessingJob.STATUS_DONE
+
+    return {
+        'script_upload': summarize(upload),
+        'script_processing': summarize(process),
+        'script_stages': {stage: summarize(samples) for stage, samples in stages.items()},
+        'report_card_upload': summarize(report_upload),
+        'report_card_processing': summarize(report_process),
+        'failed_jobs': failed,
+        'llm_calls': stub.calls - calls_before,
+    }
+
+
+def benchmark_dashboard(students, repeat):
+    """
+    GET /dashboard/ for every student: the first request after content
+    changed (page cache miss) and `repeat` further requests (cache hits)
+    """
+    client = Client()
+    url = reverse('dashboard')
+    cold, warm = [], []
+    cold_queries, warm_queries = [], []
+    for student in students:
+        client.force_login(student.user)
+        for attempt in range(repeat + 1):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = client.get(url)
+                elapsed = time.perf_counter() - started
+            if response.status_code != 200:
+                raise RuntimeError(f"Dashboard returned {response.status_code}")
+            (cold if attempt == 0 else warm).append(elapsed)
+            (cold_queries if attempt == 0 else warm_queries).append(len(queries))
+    return {
+        'cold': {**summarize(cold), 'queries_mean': round(sum(cold_queries) / len(cold_queries), 2)},
+        'warm': {**summarize(warm), 'queries_mean': round(sum(warm_queries) / len(warm_queries), 2) if warm else None},
+    }
+
+
+def run_suite(students=5, scripts_per_student=4, report_cards_per_student=1, pages=5, formats=SCRIPT_FORMATS,
+              extract_files=10, grade_cards=1000, dashboard_repeat=10, llm_latency=0.0, seed=0, progress=None):
+    """Run every benchmark and return the results with run metadata"""
+    progress = progress or (lambda message: None)
+    rng = random.Random(seed)
+    parameters = {
+        'students': students, 'scripts_per_student': scripts_per_student,
+        'report_cards_per_student': report_cards_per_student, 'pages': pages, 'formats': list(formats),
+        'extract_files': extract_files, 'grade_cards': grade_cards, 'dashboard_repeat': dashboard_repeat,
+        'llm_latency': llm_latency, 'seed': seed,
+    }
+    results = {}
+    started = time.perf_counter()
+    with benchmark_environment(llm_latency) as stub:
+        meta = {
+            'version': RESULT_VERSION,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'git_revision': git_revision(),
+            'python': sys.version.split()[0],
+            'django': django.get_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'database': connection.vendor,
+            'parameters': parameters,
+        }
+
+        progress('extract_text_from_file')
+        with tempfile.TemporaryDirectory(prefix='benchmark_files_') as directory:
+            results['extract_text'] = benchmark_extract_text(rng, formats, pages, extract_files, directory)
+
+        progress('extract_grades_from_text')
+        results['extract_grades'] = benchmark_extract_grades(grade_cards, seed)
+
+        progress('upload pipeline')
+        cohort = create_students(students)
+        results['upload_pipeline'] = benchmark_upload_pipeline(
+            rng, cohort, scripts_per_student, list(formats), pages, report_cards_per_student, stub,
+        )
+
+        progress('dashboard view')
+        results['dashboard'] = benchmark_dashboard(cohort, dashboard_repeat)
+
+    meta['duration_s'] = round(time.perf_counter() - started, 2)
+    return {'meta': meta, 'results': results}
+
+
+def flatten(results, prefix=''):
+    """{'a': {'b': {'p50_ms': 1}}} -> {'a.b.p50_ms': 1}, numbers only"""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(previous, current, metric='p50_ms'):
+    """(name, before, after, change) for every `metric` present in both runs"""
+    before = flatten(previous['results'])
+    after = flatten(current['results'])
+    rows = []
+    for name, value in after.items():
+        if name.endswith(metric) and name in before:
+            old = before[name]
+            rows.append((name[:-len(metric) - 1], old, value, (value - old) / old if old else None))
+    return rows
+
+
+# SQLite write concurrency (see `python manage.py benchmark_sqlite_writes`)
+
+SQLITE_DEFAULT_PROFILE = {'OPTIONS': {}, 'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False}
+
+WRITE_MIX = {'upload': 2, 'claim': 2, 'read': 6}
+
+
+def configured_sqlite_profile():
+    """The connection options of the default database as configured in settings"""
+    database = settings.DATABASES['default']
+    return {
+        'OPTIONS': dict(database.get('OPTIONS', {})),
+        'CONN_MAX_AGE': database.get('CONN_MAX_AGE', 0),
+        'CONN_HEALTH_CHECKS': database.get('CONN_HEALTH_CHECKS', False),
+    }
+
+
+@contextmanager
+def database_profile(profile):
+    """Open new connections to the default database with these options"""
+    saved = {key: connection.settings_dict.get(key) for key in profile}
+    connection.close()
+    connection.settings_dict.update(copy.deepcopy(profile))
+    try:
+        yield
+    finally:
+        connection.close()
+        connection.settings_dict.update(saved)
+
+
+def _upload(student, sequence):
+    """What the upload view writes: the script, its job and the signal updates"""
+    with transaction.atomic():
+        script = UploadedScript.objects.create(
+            student=student, title=f"Write benchmark {sequence}", subject='Science',
+            file=f"scripts/write-benchmark-{sequence}.txt",
+        )
+        enqueue_script(script)
+
+
+def _claim():
+    """What a job worker writes: claim the oldest queued job and finish it"""
+    job = claim_next_job()
+    if job is not None:
+        ProcessingJob.objects.filter(pk=job.pk).update(
+            status=ProcessingJob.STATUS_DONE, finished_at=timezone.now(),
+        )
+
+
+def _read(student):
+    """What the dashboard reads"""
+    StudentStats.objects.filter(student=student).first()
+    list(UploadedScript.objects.filter(student=student).defer('extracted_text_compressed')
+         .order_by('-uploaded_at', '-id')[:20])
+    list(StudyPlan.objects.filter(student=student, is_active=True).order_by('-created_at', '-id')[:20])
+    list(ReportCard.objects.filter(student=student).defer('extracted_text_compressed')
+         .order_by('-uploaded_at', '-id')[:20])
+
+
+def _write_worker(index, students, mix, deadline, seed, samples, errors):
+    rng = random.Random(seed * 1000 + index)
+    operations, weights = zip(*mix.items())
+    sequence = 0
+    try:
+        while time.perf_counter() < deadline:
+            operation = rng.choices(operations, weights)[0]
+            student = rng.choice(students)
+            started = time.perf_counter()
+            try:
+                if operation == 'upload':
+                    sequence += 1
+                    _upload(student, f"{index}-{sequence}")
+                elif operation == 'claim':
+                    _claim()
+                else:
+                    _read(student)
+            except OperationalError as e:
+                errors[operation][str(e)] = errors[operation].get(str(e), 0) + 1
+                continue
+            samples[operation].append(time.perf_counter() - started)
+    finally:
+        connections.close_all()
+
+
+def benchmark_sqlite_writes(profile, workers=8, duration=10.0, students=20, mix=WRITE_MIX, seed=0):
+    """
+    `workers` threads, each with its own connection as in run_workers or a
+    threaded web server, run a mix of uploads, job claims and dashboard
+    reads for `duration` seconds against a fresh database opened with
+    `profile`. Returns per-operation latency, throughput and lock errors.
+    """
+    with database_profile(profile), benchmark_environment():
+        journal_mode = None
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            journal_mode = cursor.fetchone()[0]
+        cohort = create_students(students)
+        connection.close()
+
+        samples = {operation: [] for operation in mix}
+        errors = {operation: {} for operation in mix}
+        deadline = time.perf_counter() + duration
+        threads = [
+            threading.Thread(target=_write_worker, args=(i, cohort, mix, deadline, seed, samples, errors),
+                             name=f"write-benchmark-{i}")
+            for i in range(workers)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        results = {'journal_mode': journal_mode, 'operations': {}}
+        for operation in mix:
+            summary = summarize(samples[operation])
+            summary['throughput_ops'] = round(len(samples[operation]) / elapsed, 2)
+            summary['errors'] = errors[operation]
+            results['operations'][operation] = summary
+        results['total'] = {
+            'ok': sum(len(s) for s in samples.values()),
+            'errors': sum(sum(e.values()) for e in errors.values()),
+            'throughput_ops': round(sum(len(s) for s in samples.values()) / elapsed, 2),
+        }
+        results['rows'] = {
+            'scripts': UploadedScript.objects.count(),
+            'jobs_done': ProcessingJob.objects.filter(status=ProcessingJob.STATUS_DONE).count(),
+        }
+    return results
+
+
+def run_sqlite_write_suite(profiles, workers=8, duration=10.0, students=20, mix=WRITE_MIX, seed=0, progress=None):
+    """benchmark_sqlite_writes for each named profile, with run metadata"""
+    if connection.vendor != 'sqlite':
+        raise ValueError('The default database is not SQLite')
+    progress = progress or (lambda message: None)
+    meta = {
+        'version': RESULT_VERSION,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'git_revision': git_revision(),
+        'python': sys.version.split()[0],
+        'django': django.get_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'parameters': {
+            'profiles': {name: profile['OPTIONS'] for name, profile in profiles.items()},
+            'workers': workers, 'duration': duration, 'students': students, 'mix': dict(mix), 'seed': seed,
+        },
+    }
+    results = {}
+    for name, profile in profiles.items():
+        progress(name)
+        results[name] = benchmark_sqlite_writes(profile, workers, duration, students, mix, seed)
+    return {'meta': meta, 'results': results}
@@ -0,0 +1,205 @@
+"""
+Local career scoring from report card grades.
+
+Careers are scored against a subject -> career affinity matrix loaded from
+a JSON data file (data/career_affinity.json by default; see the
+CAREER_SCORING setting). Each report card becomes a vector of scores out
+of 100 over the matrix's subject columns, and a whole batch of cards is
+scored with a couple of matrix products:
+
+* fit: the card's average grade over a career's subjects, weighted by
+  affinity, plus a bonus for careers built on the student's relatively
+  strong subjects;
+* coverage: the share of a career's affinity the student's subjects cover,
+  so a career is not recommended on the strength of one minor subject.
+
+Strengths and areas for improvement are the subjects furthest above and
+below the student's own average. An LLM can optionally re-rank the local
+shortlist (LLM_ENRICHMENT), but nothing depends on it.
+"""
+import json
+import os
+import threading
+from functools import lru_cache
+
+import numpy as np
+from django.conf import settings
+
+from .grades import normalize_subject, parse_score_text
+
+DEFAULT_CAREER_SCORING = {
+    'AFFINITY_FILE': None,
+    'TOP_CAREERS': 5,
+    'STRENGTHS': 3,
+    'AREAS_FOR_IMPROVEMENT': 2,
+    # Careers whose subjects the student covers less than this are skipped
+    'MIN_COVERAGE': 0.5,
+    # Weight of performance relative to the student's own average
+    'RELATIVE_WEIGHT': 0.5,
+    'LLM_ENRICHMENT': False,
+}
+
+
+def get_career_scoring_settings():
+    options = {**DEFAULT_CAREER_SCORING, **getattr(settings, 'CAREER_SCORING', {})}
+    if options['AFFINITY_FILE'] is None:
+        options['AFFINITY_FILE'] = os.path.join(os.path.dirname(__file__), 'data', 'career_affinity.json')
+    return options
+
+
+def _score_value(value):
+    """Score out of 100 from a stored grades_data value (number, '72%', 'B+', ...)"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value) if 0 <= value <= 100 else None
+    score = parse_score_text(str(value))
+    return float(score) if score is not None else None
+
+
+@lru_cache(maxsize=4096)
+def _canonical_subject(subject):
+    return normalize_subject(subject.split()) or subject.strip()
+
+
+class CareerModel:
+    """
+    The affinity matrix (careers x subject columns) and the mapping from
+    report card subject names to columns
+    """
+
+    def __init__(self, careers, columns, affinity, column_for_subject):
+        self.careers = careers
+        self.columns = columns
+        self.affinity = np.asarray(affinity, dtype=np.float32)
+        self.column_for_subject = column_for_subject
+        self.affinity_totals = self.affinity.sum(axis=1)
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        columns = list(data['subjects'])
+        index = {column: i for i, column in enumerate(columns)}
+        column_for_subject = {}
+        for column, subjects in data['subjects'].items():
+            for subject in [column, *subjects]:
+                column_for_subject[subject.lower()] = index[column]
+        careers = list(data['careers'])
+        affinity = np.zeros((len(careers), len(columns)), dtype=np.float32)
+        for row, weights in enumerate(data['careers'].values()):
+            for column, weight in weights.items():
+                affinity[row, index[column]] = weight
+        return cls(careers, columns, affinity, column_for_subject)
+
+    def _column(self, subject, extra_columns):
+        """Matrix column for a subject; unknown subjects get a column of their own"""
+        canonical = _canonical_subject(subject)
+        column = self.column_for_subject.get(canonical.lower())
+        if column is None:
+            column = extra_columns.setdefault(canonical, len(self.columns) + len(extra_columns))
+        return column
+
+    def grade_matrix(self, grades_list):
+        """
+        Scores (0-1) of each report card per column and the mask of columns
+        each card has a grade for, plus the names of all columns. Subjects
+        outside the matrix get extra columns, with no career affinity, so
+        they still count towards strengths.
+        """
+        extra_columns = {}
+        rows, columns, values = [], [], []
+        for row, grades_data in enumerate(grades_list):
+            for subject, value in (grades_data or {}).items():
+                score = _score_value(value)
+                if score is not None:
+                    rows.append(row)
+                    columns.append(self._column(subject, extra_columns))
+                    values.append(score / 100)
+
+        width = len(self.columns) + len(extra_columns)
+        scores = np.zeros((len(grades_list), width), dtype=np.float32)
+        mask = np.zeros_like(scores, dtype=bool)
+        if rows:
+            index = (np.array(rows), np.array(columns))
+            # Several subjects in one column (English HL and FAL): keep the best
+            np.maximum.at(scores, index, np.array(values, dtype=np.float32))
+            mask[index] = True
+        return scores, mask, self.columns + list(extra_columns)
+
+    def score(self, grades_list, options=None):
+        """
+        Recommendations for a batch of report cards' grades_data, in order:
+        dicts with 'careers', 'strengths' and 'areas_for_improvement'
+        """
+        options = options or get_career_scoring_settings()
+        scores, mask, column_names = self.grade_matrix(grades_list)
+        affinity = self.affinity
+        taken = mask[:, :affinity.shape[1]].astype(np.float32)
+        known_scores = scores[:, :affinity.shape[1]]
+
+        counts = mask.sum(axis=1)
+        means = np.divide(scores.sum(axis=1), counts, out=np.zeros(len(counts), dtype=np.float32), where=counts > 0)
+        relative = np.where(mask, scores - means[:, None], 0.0).astype(np.float32)
+
+        # (cards x subjects) @ (subjects x careers)
+        covered = taken @ affinity.T
+        fit = np.divide(known_scores @ affinity.T, covered, out=np.zeros_like(covered), where=covered > 0)
+        relative_fit = np.divide(relative[:, :affinity.shape[1]] @ affinity.T, covered,
+                                 out=np.zeros_like(covered), where=covered > 0)
+        coverage = covered / self.affinity_totals
+        career_scores = (fit + options['RELATIVE_WEIGHT'] * relative_fit) * np.sqrt(coverage)
+        career_scores[coverage < options['MIN_COVERAGE']] = -np.inf
+
+        top_careers = min(options['TOP_CAREERS'], len(self.careers))
+        ranked = np.argsort(-career_scores, axis=1, kind='stable')[:, :top_careers]
+        by_strength = np.argsort(-np.where(mask, relative, -np.inf), axis=1, kind='stable')
+        by_weakness = np.argsort(np.where(mask, relative, np.inf), axis=1, kind='stable')
+
+        # Plain lists: indexing numpy arrays element by element is slow
+        finite = np.take_along_axis(np.isfinite(career_scores), ranked, axis=1).tolist()
+        above = (relative >= 0) & mask
+        below = (relative < 0) & mask
+        strong = np.take_along_axis(above, by_strength, axis=1).tolist()
+        weak = np.take_along_axis(below, by_weakness, axis=1).tolist()
+        ranked, by_strength, by_weakness = ranked.tolist(), by_strength.tolist(), by_weakness.tolist()
+
+        results = []
+        for row in range(len(grades_list)):
+            careers = [self.careers[c] for c, ok in zip(ranked[row], finite[row]) if ok]
+            strengths = [column_names[c] for c, ok in zip(by_strength[row], strong[row]) if ok]
+            weaknesses = [column_names[c] for c, ok in zip(by_weakness[row], weak[row]) if ok]
+            results.append({
+                'careers': careers,
+                'strengths': strengths[:options['STRENGTHS']],
+                'areas_for_improvement': weaknesses[:options['AREAS_FOR_IMPROVEMENT']],
+            })
+        return results
+
+
+_model_lock = threading.Lock()
+_model = None
+_model_state = None
+
+
+def get_career_model():
+    """The model for the configured affinity file, reloaded when the file changes"""
+    global _model, _model_state
+    path = get_career_scoring_settings()['AFFINITY_FILE']
+    stat = os.stat(path)
+    state = (path, stat.st_mtime_ns, stat.st_size)
+    with _model_lock:
+        if _model is None or _model_state != state:
+            _model = CareerModel.from_file(path)
+            _model_state = state
+        return _model
+
+
+def score_careers_batch(grades_list):
+    """Local recommendations for many report cards' grades_data in one call"""
+    if not grades_list:
+        return []
+    return get_career_model().score(grades_list)
+
+
+def score_careers(grades_data):
+    """Local recommendations for one report card's grades_data"""
+    return score_careers_batch([grades_data])[0]
@@ -0,0 +1,175 @@
+"""
+Map-reduce helpers for analyzing documents longer than one prompt.
+
+A document longer than PROMPT_CHARS, the most a single prompt sends of it,
+is split on page/paragraph boundaries into chunks of at most CHUNK_TOKENS
+(estimated) tokens. Each chunk is analyzed on its own
+(the "map" step, see analyze_chunk in views.py) and the partial results are
+merged into one set of topics and one memorandum (the "reduce" step).
+Chunk summaries that together exceed one chunk are merged in groups first,
+level by level, so the end of a long document is never cut off.
+
+Cost and load are bounded by the CHUNKED_ANALYSIS setting:
+
+* MAX_CHUNKS and MAX_TOKENS_PER_DOCUMENT cap how many chunks of a huge
+  document are sent at all; the chunks kept are spread evenly over the
+  document rather than taken from the front;
+* MAX_CONCURRENCY caps the map calls in flight for one document. Every call
+  also goes through the global OpenAI slots in ratelimit.py, so the
+  process-wide limit still holds when several documents are processed.
+"""
+import re
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+
+
+DEFAULT_CHUNKED_ANALYSIS = {
+    'ENABLED': True,
+    # Characters of a document a single prompt sends; longer ones are chunked
+    'PROMPT_CHARS': 4000,
+    'CHUNK_TOKENS': 3000,
+    'MAX_CHUNKS': 16,
+    'MAX_TOKENS_PER_DOCUMENT': 48000,
+    'MAX_CONCURRENCY': 4,
+    'MAX_TOPICS': 15,
+}
+
+CHARS_PER_TOKEN = 4
+_BLOCK_BOUNDARY = re.compile(r'\n\s*\n')
+_SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+')
+
+
+def get_chunked_analysis_settings():
+    return {**DEFAULT_CHUNKED_ANALYSIS, **getattr(settings, 'CHUNKED_ANALYSIS', {})}
+
+
+def _split_oversized(block, max_chars):
+    """Split a block longer than max_chars on lines, then sentences, then hard"""
+    for pattern in ('\n', _SENTENCE_BOUNDARY):
+        parts = block.split(pattern) if isinstance(pattern, str) else pattern.split(block)
+        if len(parts) > 1:
+            pieces = []
+            for part in parts:
+                if len(part) > max_chars:
+                    pieces.extend(_split_oversized(part, max_chars))
+                elif part.strip():
+                    pieces.append(part)
+            return pieces
+    return [block[i:i + max_chars] for i in range(0, len(block), max_chars)]
+
+
+def split_into_chunks(text, chunk_tokens):
+    """
+    Pack paragraphs (and pages, which extraction separates the same way)
+    into chunks of at most `chunk_tokens` estimated tokens. A single block
+    larger than that is split on lines or sentences.
+    """
+    max_chars = chunk_tokens * CHARS_PER_TOKEN
+    chunks = []
+    current = []
+    size = 0
+    for block in _BLOCK_BOUNDARY.split(text):
+        block = block.strip()
+        if not block:
+            continue
+        pieces = [block] if len(block) <= max_chars else _split_oversized(block, max_chars)
+        for piece in pieces:
+            if current and size + len(piece) + 2 > max_chars:
+                chunks.append("\n\n".join(current))
+                current, size = [], 0
+            current.append(piece)
+            size += len(piece) + 2
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def select_chunks(chunks, max_chunks):
+    """Keep at most `max_chunks`, spread evenly from start to end"""
+    if len(chunks) <= max_chunks:
+        return chunks
+    if max_chunks == 1:
+        return chunks[:1]
+    step = (len(chunks) - 1) / (max_chunks - 1)
+    return [chunks[round(i * step)] for i in range(max_chunks)]
+
+
+def plan_chunks(text, options=None):
+    """
+    Chunks to analyze separately, or None when the text fits in a single
+    prompt (or chunked analysis is disabled).
+    """
+    options = options or get_chunked_analysis_settings()
+    if not options['ENABLED'] or len(text) <= options['PROMPT_CHARS']:
+        return None
+    chunks = split_into_chunks(text, options['CHUNK_TOKENS'])
+    max_chunks = min(
+        options['MAX_CHUNKS'],
+        max(1, options['MAX_TOKENS_PER_DOCUMENT'] // options['CHUNK_TOKENS']),
+    )
+    return select_chunks(chunks, max_chunks)
+
+
+def group_sections(sections, max_chars):
+    """
+    Pack consecutive sections (chunk summaries) into groups of at most
+    `max_chars` joined characters, for merging a level at a time. A section
+    longer than that is cut to `max_chars`.
+    """
+    groups = []
+    current = []
+    size = 0
+    for section in sections:
+        section = section[:max_chars]
+        if current and size + len(section) + 2 > max_chars:
+            groups.append(current)
+            current, size = [], 0
+        current.append(section)
+        size += len(section) + 2
+    if current:
+        groups.append(current)
+    return groups
+
+
+def _call_and_close(func, chunk):
+    try:
+        return func(chunk)
+    finally:
+        connections.close_all()
+
+
+def map_chunks(func, chunks, max_concurrency=None):
+    """Apply `func` to every chunk, at most `max_concurrency` at a time, in order"""
+    if max_concurrency is None:
+        max_concurrency = get_chunked_analysis_settings()['MAX_CONCURRENCY']
+    if len(chunks) == 1 or max_concurrency <= 1:
+        return [func(chunk) for chunk in chunks]
+    with ThreadPoolExecutor(max_workers=min(max_concurrency, len(chunks)), thread_name_prefix='chunk') as pool:
+        return list(pool.map(lambda chunk: _call_and_close(func, chunk), chunks))
+
+
+def _topic_key(topic):
+    return re.sub(r'[^a-z0-9]+', ' ', topic.lower()).strip()
+
+
+def merge_topics(topic_lists, max_topics=None):
+    """
+    Merge per-chunk topic lists, dropping near-duplicates (case and
+    punctuation) and ranking by how many chunks mention each topic, then by
+    first appearance.
+    """
+    if max_topics is None:
+        max_topics = get_chunked_analysis_settings()['MAX_TOPICS']
+    counts = Counter()
+    first_seen = {}
+    for topics in topic_lists:
+        for topic in dict.fromkeys(_topic_key(t) for t in topics):
+            counts[topic] += 1
+        for topic in topics:
+            first_seen.setdefault(_topic_key(topic), topic.strip())
+    order = {key: i for i, key in enumerate(first_seen)}
+    ranked = sorted((key for key in first_seen if key), key=lambda key: (-counts[key], order[key]))
+    return [first_seen[key] for key in ranked[:max_topics]]
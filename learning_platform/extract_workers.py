@@ -0,0 +1,86 @@
+"""
+Process-pool workers for document text extraction.
+
+Runs inside ProcessPoolExecutor children, so it must stay free of Django
+imports: on platforms that spawn rather than fork, each child imports this
+module without a configured Django.
+"""
+import hashlib
+import time
+
+import docx
+import pdfplumber
+
+PAGE_SEPARATOR = "\n\n"
+
+
+def extract_page_range(file_path, start, stop):
+    """
+    Extract pages [start, stop) of a PDF (0-indexed). Returns a list of
+    (text, seconds) tuples, one per page.
+    """
+    results = []
+    with pdfplumber.open(file_path, pages=list(range(start + 1, stop + 1))) as pdf:
+        for page in pdf.pages:
+            started = time.perf_counter()
+            text = page.extract_text() or ""
+            results.append((text, time.perf_counter() - started))
+            # Drop pdfplumber's per-page object cache as we go
+            page.close()
+    return results
+
+
+def extract_pdf_tables(file_path, max_pages=None):
+    """
+    Tables found on the first `max_pages` pages of a PDF, each a list of
+    rows of cell strings (None for empty cells)
+    """
+    tables = []
+    with pdfplumber.open(file_path) as pdf:
+        for page in pdf.pages[:max_pages]:
+            tables.extend(page.extract_tables())
+            page.close()
+    return tables
+
+
+def extract_docx_text(file_path):
+    doc = docx.Document(file_path)
+    return "".join(para.text + "\n" for para in doc.paragraphs)
+
+
+def extract_txt_text(file_path, max_chars=None):
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return f.read(max_chars) if max_chars is not None else f.read()
+
+
+def extract_file_text(file_path):
+    """
+    Extract the whole text of a PDF/DOCX/TXT file in this process, matching
+    extraction.extract_text_from_file. Unknown formats give "".
+    """
+    if file_path.endswith('.pdf'):
+        with pdfplumber.open(file_path) as pdf:
+            page_count = len(pdf.pages)
+        return PAGE_SEPARATOR.join(text for text, _ in extract_page_range(file_path, 0, page_count))
+    if file_path.endswith('.docx'):
+        return extract_docx_text(file_path)
+    if file_path.endswith('.txt'):
+        return extract_txt_text(file_path)
+    return ""
+
+
+def hash_and_extract(file_path):
+    """
+    Return (sha256, size, text, error) for one file. Errors are returned
+    rather than raised so one bad file doesn't abort a whole batch.
+    """
+    sha256 = hashlib.sha256()
+    size = 0
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(chunk)
+            size += len(chunk)
+    try:
+        return sha256.hexdigest(), size, extract_file_text(file_path), None
+    except Exception as e:
+        return sha256.hexdigest(), size, "", f"{type(e).__name__}: {e}"
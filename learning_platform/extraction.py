@@ -0,0 +1,215 @@
+"""
+Text extraction for uploaded documents.
+
+Parsing PDFs with pdfplumber is the most CPU-expensive step we run, so the
+extracted text is stored (zlib-compressed) on the UploadedScript/ReportCard
+row together with the parser version that produced it. Bump PARSER_VERSION
+whenever extract_text_from_file changes its output so stored text is
+re-extracted on next use.
+"""
+import math
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pdfplumber
+from django.conf import settings
+
+from .extract_workers import (
+    PAGE_SEPARATOR, extract_docx_text, extract_page_range, extract_pdf_tables, extract_txt_text,
+)
+from .metrics import observe_extraction
+from .models import UploadedScript
+
+# 2: PDF pages are separated by a blank line instead of run together
+PARSER_VERSION = 2
+
+PDF_MIN_CHUNK_PAGES = 4
+# Report cards put their grades table near the top
+TABLE_MAX_PAGES = 4
+# ...so only the start of their text is extracted and parsed
+REPORT_CARD_MAX_CHARS = 20000
+
+_pdf_pool = None
+_pdf_pool_workers = None
+_pdf_pool_lock = threading.Lock()
+
+
+def process_pool_context():
+    """
+    Start method for extract_workers pools. Never fork: pools are started
+    from worker and pipeline threads, and a forked child would inherit
+    Django's settings and open database connections. extract_workers is
+    import-safe in forkserver/spawn children.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+def _get_pdf_pool(workers):
+    global _pdf_pool, _pdf_pool_workers
+    with _pdf_pool_lock:
+        if _pdf_pool is None or _pdf_pool_workers != workers:
+            if _pdf_pool is not None:
+                _pdf_pool.shutdown(wait=False)
+            _pdf_pool = ProcessPoolExecutor(max_workers=workers, mp_context=process_pool_context())
+            _pdf_pool_workers = workers
+        return _pdf_pool
+
+
+def _reset_pdf_pool():
+    global _pdf_pool
+    with _pdf_pool_lock:
+        _pdf_pool = None
+
+
+def _extract_pdf_serial(file_path, page_count, max_chars):
+    """Extract pages one after another, stopping early once max_chars is reached"""
+    pages = []
+    chars = 0
+    with pdfplumber.open(file_path) as pdf:
+        for page in pdf.pages[:page_count]:
+            started = time.perf_counter()
+            text = page.extract_text() or ""
+            pages.append((text, time.perf_counter() - started))
+            page.close()
+            chars += len(text)
+            if max_chars is not None and chars >= max_chars:
+                break
+    return pages
+
+
+def _extract_pdf_parallel(file_path, page_count, workers):
+    """Split the page range into contiguous chunks and extract them in a process pool"""
+    # A few chunks per worker keeps the pool busy when some pages are slower
+    chunk_size = max(PDF_MIN_CHUNK_PAGES, math.ceil(page_count / (workers * 2)))
+    ranges = [(start, min(start + chunk_size, page_count)) for start in range(0, page_count, chunk_size)]
+
+    pool = _get_pdf_pool(workers)
+    try:
+        futures = [pool.submit(extract_page_range, file_path, start, stop) for start, stop in ranges]
+        pages = []
+        for future in futures:
+            pages.extend(future.result())
+        return pages
+    except BrokenProcessPool:
+        # A crashed child breaks the whole pool; start a fresh one next time
+        _reset_pdf_pool()
+        raise
+
+
+def extract_pdf_text(file_path, max_pages=None, max_chars=None, workers=None, stats=None):
+    """
+    Extract the text of a PDF, one page per paragraph.
+
+    Long PDFs are split into page ranges and parsed in a process pool.
+    max_pages limits how many pages are read; max_chars stops as soon as
+    that much text has been extracted (always read serially, since only
+    the first few pages are needed). If a `stats` dict is passed it is
+    filled with the page count, worker count and per-page seconds.
+    """
+    with pdfplumber.open(file_path) as pdf:
+        page_count = len(pdf.pages)
+    if max_pages is not None:
+        page_count = min(page_count, max_pages)
+
+    if workers is None:
+        workers = getattr(settings, 'PDF_EXTRACT_WORKERS', None) or os.cpu_count() or 1
+    min_pages = getattr(settings, 'PDF_PARALLEL_MIN_PAGES', 20)
+    if max_chars is not None or workers <= 1 or page_count < min_pages:
+        workers = 1
+        pages = _extract_pdf_serial(file_path, page_count, max_chars)
+    else:
+        pages = _extract_pdf_parallel(file_path, page_count, workers)
+
+    if stats is not None:
+        stats['pages'] = len(pages)
+        stats['workers'] = workers
+        stats['page_seconds'] = [round(seconds, 4) for _, seconds in pages]
+
+    text = PAGE_SEPARATOR.join(page_text for page_text, _ in pages)
+    if max_chars is not None:
+        text = text[:max_chars]
+    return text
+
+
+def extract_text_from_file(file_path, max_chars=None, stats=None):
+    """
+    Extract text from various file formats (PDF, DOCX, TXT)
+    """
+    text = ""
+
+    with observe_extraction(file_path) as extracted:
+        if file_path.endswith('.pdf'):
+            text = extract_pdf_text(file_path, max_chars=max_chars, stats=stats)
+        elif file_path.endswith('.docx'):
+            text = extract_docx_text(file_path)
+        elif file_path.endswith('.txt'):
+            text = extract_txt_text(file_path, max_chars)
+
+        if max_chars is not None:
+            text = text[:max_chars]
+        extracted.append(text)
+    return text
+
+
+def extract_tables_from_file(file_path, max_pages=TABLE_MAX_PAGES):
+    """
+    Tables from the first pages of a PDF (rows of cell strings). Other
+    formats, and PDFs pdfplumber can't find tables in, give [].
+    """
+    if not file_path.endswith('.pdf'):
+        return []
+    try:
+        return extract_pdf_tables(file_path, max_pages=max_pages)
+    except Exception as e:
+        print(f"Error extracting tables: {str(e)}")
+        return []
+
+
+def _sibling_text(document, parser_version=PARSER_VERSION):
+    """Text already parsed from another upload of the same file, if any"""
+    if not isinstance(document, UploadedScript) or not document.blob_id:
+        return None
+    siblings = UploadedScript.objects.filter(blob_id=document.blob_id, extracted_text_compressed__isnull=False)
+    if parser_version is not None:
+        siblings = siblings.filter(text_parser_version=parser_version)
+    sibling = siblings.exclude(pk=document.pk).only('extracted_text_compressed').first()
+    return sibling.get_extracted_text() if sibling else None
+
+
+def get_stored_text(document):
+    """
+    Return whatever text is already stored for a document (from any parser
+    version, or another upload of the same file) without extracting it
+    """
+    if document.extracted_text_compressed is not None:
+        return document.get_extracted_text()
+    return _sibling_text(document, parser_version=None)
+
+
+def get_document_text(document, max_chars=None, stats=None):
+    """
+    Return the text of an UploadedScript or ReportCard, extracting and
+    storing it only if no text from the current parser version is stored.
+    max_chars and stats are passed on to extract_text_from_file; stats is
+    left empty when stored text is reused. Documents only ever read up to
+    max_chars (report cards) store just that prefix.
+    """
+    if document.has_extracted_text(PARSER_VERSION):
+        return document.get_extracted_text()
+
+    text = _sibling_text(document)
+    if text is None:
+        text = extract_text_from_file(document.file.path, max_chars=max_chars, stats=stats)
+
+    document.set_extracted_text(text, PARSER_VERSION)
+    if document.pk:
+        type(document).objects.filter(pk=document.pk).update(
+            extracted_text_compressed=document.extracted_text_compressed,
+            text_parser_version=document.text_parser_version,
+        )
+    return text
@@ -0,0 +1,351 @@
+"""
+Report card parser.
+
+Text is scanned once by a single regex tokenizer and fed through a small
+state machine: subject words accumulate until a score token arrives and
+the pair is recorded. When a header line ("Subject  Term 1  Final Mark")
+precedes the rows, the column it names is used instead of the first score
+on the line. Tabular PDFs are read from the table cells pdfplumber
+extracts, picking the subject and final-score columns the same way.
+
+Subjects are normalized to canonical names ("maths" -> "Mathematics") and
+scores to numbers out of 100 (percentages, fractions such as 42/50, and
+letter grades on a standard scale). Lines that name something other than a
+subject (student name, term, attendance, averages) are ignored.
+
+Kept free of Django imports so it can run in worker processes and be
+benchmarked on its own.
+"""
+import re
+from functools import lru_cache
+
+TOKEN_RE = re.compile(r"""
+    (?P<newline>\n)
+  | (?P<fraction>(?P<numerator>\d{1,3}(?:\.\d+)?)\s*/\s*(?P<denominator>\d{1,3})(?![\d/]))
+  | (?P<percent>\d{1,3}(?:\.\d+)?)\s*%
+  | (?P<noise>\d{4,}|\d+(?:[/.-]\d+){2,})
+  | (?P<number>\d{1,3}(?:\.\d+)?)(?![\d%])
+  | (?P<letter>\b[A-F][+-]?)(?![A-Za-z0-9])
+  | (?P<words>[A-Za-z][A-Za-z'&.]*(?:[ \t]+(?![A-F][+-]?(?![A-Za-z0-9]))[A-Za-z][A-Za-z'&.]*)*)
+  | (?P<stop>[,;])
+""", re.VERBOSE)
+
+LETTER_SCORES = {
+    'A+': 97, 'A': 93, 'A-': 90,
+    'B+': 87, 'B': 83, 'B-': 80,
+    'C+': 77, 'C': 73, 'C-': 70,
+    'D+': 67, 'D': 63, 'D-': 60,
+    'E': 55, 'F': 45,
+}
+
+# Bare numbers below this are term numbers, achievement levels or codes,
+# not marks; they end the current subject without recording anything
+MIN_BARE_SCORE = 10
+
+MAX_SUBJECT_WORDS = 5
+
+CANONICAL_SUBJECTS = [
+    'Mathematics', 'Mathematical Literacy', 'English', 'English Home Language',
+    'English First Additional Language', 'Afrikaans', 'Afrikaans Home Language',
+    'Afrikaans First Additional Language', 'IsiZulu', 'IsiXhosa', 'Sesotho', 'Setswana', 'French',
+    'Spanish', 'German', 'Physical Sciences', 'Life Sciences', 'Natural Sciences', 'Biology',
+    'Chemistry', 'Physics', 'Science', 'Geography', 'History', 'Social Sciences', 'Accounting',
+    'Business Studies', 'Economics', 'Economic and Management Sciences', 'Computer Science',
+    'Information Technology', 'Computer Applications Technology', 'Engineering Graphics and Design',
+    'Technology', 'Life Orientation', 'Physical Education', 'Visual Arts', 'Music', 'Dramatic Arts',
+    'Creative Arts', 'Art', 'Drama', 'Consumer Studies', 'Tourism', 'Agricultural Sciences',
+    'Religious Studies', 'Literature', 'Statistics', 'Calculus', 'Algebra', 'Geometry',
+]
+
+SUBJECT_ALIASES = {
+    **{name.lower(): name for name in CANONICAL_SUBJECTS},
+    'math': 'Mathematics', 'maths': 'Mathematics', 'mathematic': 'Mathematics',
+    'math lit': 'Mathematical Literacy', 'maths lit': 'Mathematical Literacy',
+    'maths literacy': 'Mathematical Literacy', 'math literacy': 'Mathematical Literacy',
+    'eng': 'English', 'english language': 'English', 'english hl': 'English Home Language',
+    'english fal': 'English First Additional Language',
+    'afr': 'Afrikaans', 'afrikaans hl': 'Afrikaans Home Language',
+    'afrikaans fal': 'Afrikaans First Additional Language',
+    'phys sci': 'Physical Sciences', 'physical science': 'Physical Sciences',
+    'life science': 'Life Sciences', 'natural science': 'Natural Sciences',
+    'social science': 'Social Sciences', 'bio': 'Biology', 'chem': 'Chemistry',
+    'geo': 'Geography', 'hist': 'History', 'ems': 'Economic and Management Sciences',
+    'comp sci': 'Computer Science', 'computing': 'Computer Science', 'ict': 'Information Technology',
+    'cat': 'Computer Applications Technology', 'egd': 'Engineering Graphics and Design',
+    'lo': 'Life Orientation', 'pe': 'Physical Education', 'phys ed': 'Physical Education',
+    'business': 'Business Studies', 'econ': 'Economics', 'arts and culture': 'Creative Arts',
+}
+
+# A subject whose words include any of these is a header or summary line
+NON_SUBJECT_WORDS = frozenset("""
+absent age aggregate attendance average birth card class code comment comments date days dob exam
+examination final gpa grade id learner level mark marks max maximum name no number overall page percent
+percentage phone position present principal promoted rank report result results school score scores
+semester signature student subject subjects symbol teacher term total year quarter weight
+""".split())
+
+# Leading words dropped from subject names ("in Mathematics", "the History")
+LEADING_NOISE = frozenset("a an and for in of on the to".split())
+LOWERCASE_WORDS = frozenset("and of for in the".split())
+
+
+def normalize_subject(words):
+    """Canonical subject name for a run of words (see _normalize_subject)"""
+    return _normalize_subject(tuple(words))
+
+
+# The same few subject names repeat across every report card
+@lru_cache(maxsize=4096)
+def _normalize_subject(words):
+    """
+    Canonical subject name for a run of words, or None if it doesn't look
+    like a subject. The longest trailing phrase that is a known subject or
+    alias wins, so "performed well in maths" gives "Mathematics". Anything
+    else must be short, capitalized and free of header words.
+    """
+    words = [word.strip(".'&") for word in words]
+    words = [word for word in words if word]
+    if not words:
+        return None
+    lowered = [word.lower() for word in words]
+    for size in range(min(len(words), MAX_SUBJECT_WORDS), 0, -1):
+        canonical = SUBJECT_ALIASES.get(" ".join(lowered[-size:]))
+        if canonical:
+            return canonical
+
+    while lowered and lowered[0] in LEADING_NOISE:
+        words, lowered = words[1:], lowered[1:]
+    if not words or len(words) > 4 or any(word in NON_SUBJECT_WORDS for word in lowered):
+        return None
+    if len(words) == 1 and len(words[0]) < 3:
+        return None
+    # Report cards capitalize subject names; lower-case words are prose
+    if any(word[0].islower() for word, low in zip(words, lowered) if low not in LOWERCASE_WORDS):
+        return None
+    return " ".join(low if i and low in LOWERCASE_WORDS else low.capitalize() for i, low in enumerate(lowered))
+
+
+def _number(value):
+    value = round(float(value), 1)
+    return int(value) if value.is_integer() else value
+
+
+def score_from_match(match):
+    """Score out of 100 for a score token, or None if it isn't a plausible mark"""
+    kind = match.lastgroup
+    if kind == 'percent':
+        value = float(match.group('percent'))
+    elif kind == 'fraction':
+        numerator, denominator = float(match.group('numerator')), float(match.group('denominator'))
+        if not denominator or numerator > denominator:
+            return None
+        value = numerator * 100 / denominator
+    elif kind == 'number':
+        value = float(match.group('number'))
+        if value < MIN_BARE_SCORE:
+            return None
+    elif kind == 'letter':
+        return LETTER_SCORES.get(match.group('letter'))
+    else:
+        return None
+    return _number(value) if 0 <= value <= 100 else None
+
+
+SCORE_KINDS = frozenset(['percent', 'fraction', 'number', 'letter'])
+
+# A line starting with one of these is a table header ("Subject  Term 1  Final")
+SUBJECT_HEADER_WORDS = frozenset(['subject', 'subjects', 'learning', 'course', 'courses', 'module', 'modules'])
+# Preferred score columns, best first
+SCORE_HEADERS = ('final', 'year', 'average', 'total', '%', 'percent', 'mark', 'score', 'result', 'grade', 'symbol')
+# Header words that qualify the label before them ("Exam Mark" is one column)
+LABEL_SUFFIXES = frozenset(['mark', 'marks', 'score', 'result', 'grade', 'percent', 'percentage'])
+
+
+def _add_header_word(labels, word):
+    word = word.lower()
+    if word in SUBJECT_HEADER_WORDS or word == 'area':
+        return
+    if word in LABEL_SUFFIXES and labels and labels[-1][-1] not in LABEL_SUFFIXES:
+        labels[-1].append(word)
+    else:
+        labels.append([word])
+
+
+def _add_header_label(labels, match):
+    """Group a header line's tokens into column labels"""
+    kind = match.lastgroup
+    if kind == 'words':
+        for word in match.group('words').split():
+            _add_header_word(labels, word)
+    elif kind in SCORE_KINDS and labels:
+        # "Term 1", "Paper 2"
+        labels[-1].append(match.group(0))
+
+
+def preferred_column(labels):
+    """Index of the best score column among header labels, or None"""
+    for header in SCORE_HEADERS:
+        for i, label in enumerate(labels):
+            if header in label:
+                return i
+    return None
+
+
+def parse_grades_text(text):
+    """
+    Single pass over report card text. Returns {subject: score}, keeping the
+    first score seen for each subject.
+
+    Each line is subject words followed by score columns. Under a header
+    line the column it names (final, average, ...) is used, falling back to
+    the first score on the line; otherwise the first score is used.
+    """
+    grades = {}
+    words = []
+    subject = None          # subject whose score columns are being read
+    recorded = False
+    column = 0
+    fallback = None
+    header_labels = None    # column labels while reading a header line
+    score_column = None     # column chosen by the last header line
+    line_start = True
+    previous = None
+    for match in TOKEN_RE.finditer(text):
+        kind = match.lastgroup
+        if header_labels is not None and kind != 'newline':
+            _add_header_label(header_labels, match)
+            continue
+
+        if kind == 'words':
+            run = match.group('words').split()
+            if subject is not None:
+                if not recorded and fallback is not None:
+                    grades[subject] = fallback
+                subject = None
+            elif line_start and not words and run[0].lower() in SUBJECT_HEADER_WORDS:
+                header_labels = []
+                for word in run[1:]:
+                    _add_header_word(header_labels, word)
+                continue
+            words.extend(run)
+            if len(words) > 2 * MAX_SUBJECT_WORDS:
+                # Running prose: only the last few words can name a subject
+                words = words[-MAX_SUBJECT_WORDS:]
+        elif kind in SCORE_KINDS:
+            if subject is None:
+                if not words:
+                    continue
+                subject = normalize_subject(words)
+                words = []
+                if subject is None:
+                    continue
+                recorded = subject in grades
+                column, fallback = 0, None
+            else:
+                column += 1
+            if recorded:
+                continue
+            score = score_from_match(match)
+            if score is None:
+                continue
+            if score_column is None or column == score_column:
+                grades[subject] = score
+                recorded = True
+            elif fallback is None:
+                fallback = score
+        elif kind == 'noise' and subject is None:
+            # Dates and ids aren't part of a subject name
+            words = []
+        elif kind in ('newline', 'stop'):
+            if subject is not None and not recorded and fallback is not None:
+                grades[subject] = fallback
+            subject = None
+            words = []
+            if kind == 'newline':
+                if header_labels is not None:
+                    score_column = preferred_column([" ".join(label) for label in header_labels])
+                    header_labels = None
+                elif previous == 'newline':
+                    # A blank line ends the table the header belonged to
+                    score_column = None
+        line_start = kind == 'newline'
+        previous = kind
+
+    if subject is not None and not recorded and fallback is not None:
+        grades[subject] = fallback
+    return grades
+
+
+def parse_score_text(text):
+    """First score in a table cell, or None"""
+    for match in TOKEN_RE.finditer(text or ''):
+        if match.lastgroup in SCORE_KINDS:
+            score = score_from_match(match)
+            if score is not None:
+                return score
+    return None
+
+
+def _cell_words(text):
+    return [word for m in TOKEN_RE.finditer(text or '') if m.lastgroup == 'words' for word in m.group('words').split()]
+
+
+SUBJECT_HEADERS = ('subject', 'learning area', 'course', 'module')
+
+
+def _header_columns(row):
+    """(subject column, score column) if `row` is a header row, else None"""
+    cells = [(cell or '').strip().lower() for cell in row]
+    subject_col = next((i for i, cell in enumerate(cells) if any(h in cell for h in SUBJECT_HEADERS)), None)
+    if subject_col is None:
+        return None
+    others = [i for i in range(len(cells)) if i != subject_col]
+    best = preferred_column([cells[i] for i in others])
+    return subject_col, others[best] if best is not None else None
+
+
+def parse_grades_tables(tables):
+    """
+    {subject: score} from tables extracted from a PDF (lists of rows of
+    cell strings). Uses the header row to find the subject and score
+    columns; without one, the first cell naming a subject and the first
+    score after it.
+    """
+    grades = {}
+    for table in tables:
+        columns = None
+        for row in table:
+            if not row:
+                continue
+            header = _header_columns(row)
+            if header is not None:
+                columns = header
+                continue
+
+            if columns is not None and columns[1] is not None and max(columns) < len(row):
+                subject = normalize_subject(_cell_words(row[columns[0]]))
+                score = parse_score_text(row[columns[1]])
+            else:
+                start = columns[0] if columns is not None else 0
+                subject, score = None, None
+                for i in range(start, len(row)):
+                    if subject is None:
+                        subject = normalize_subject(_cell_words(row[i]))
+                    else:
+                        score = parse_score_text(row[i])
+                        if score is not None:
+                            break
+            if subject is not None and score is not None:
+                grades.setdefault(subject, score)
+    return grades
+
+
+def parse_report_card(text, tables=None):
+    """
+    Grades from a report card: table cells when the PDF had usable tables,
+    topped up with anything else found in the text
+    """
+    grades = parse_grades_tables(tables) if tables else {}
+    for subject, score in parse_grades_text(text or '').items():
+        grades.setdefault(subject, score)
+    return grades
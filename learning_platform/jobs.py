@@ -0,0 +1,151 @@
+"""
+Persistent background job queue for script and report card processing.
+
+Uploads are turned into ProcessingJob rows and drained by the
+`manage.py run_workers` command, so the upload views never block on text
+extraction or OpenAI calls.
+"""
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.db import OperationalError, close_old_connections, connections
+from django.db.models import F
+from django.utils import timezone
+
+from .metrics import record_job
+from .models import ProcessingJob
+
+
+def enqueue_script(script):
+    """Queue an uploaded script for background processing"""
+    return ProcessingJob.objects.create(
+        student=script.student,
+        kind=ProcessingJob.KIND_SCRIPT,
+        script=script,
+    )
+
+
+def enqueue_report_card(report_card):
+    """Queue an uploaded report card for background processing"""
+    return ProcessingJob.objects.create(
+        student=report_card.student,
+        kind=ProcessingJob.KIND_REPORT_CARD,
+        report_card=report_card,
+    )
+
+
+def claim_next_job():
+    """
+    Atomically move the oldest queued job to running and return it.
+    Returns None when the queue is empty. Safe to call from several threads
+    and processes at once: a job is only claimed by whoever flips its status.
+    """
+    candidates = (ProcessingJob.objects
+                  .filter(status=ProcessingJob.STATUS_QUEUED)
+                  .order_by('created_at')
+                  .values_list('pk', flat=True)[:5])
+    for pk in candidates:
+        job = claim_job(pk)
+        if job:
+            return job
+    return None
+
+
+def claim_job(pk):
+    """Move one queued job to running, or return None if someone else got it"""
+    claimed = ProcessingJob.objects.filter(pk=pk, status=ProcessingJob.STATUS_QUEUED).update(
+        status=ProcessingJob.STATUS_RUNNING,
+        started_at=timezone.now(),
+        attempts=F('attempts') + 1,
+    )
+    if claimed:
+        return ProcessingJob.objects.select_related('script', 'report_card').get(pk=pk)
+    return None
+
+
+def run_job(job):
+    """
+    Run a claimed job and record its outcome
+    """
+    from .views import process_uploaded_script, process_report_card
+
+    try:
+        if job.kind == ProcessingJob.KIND_SCRIPT:
+            job.timings = process_uploaded_script(job.script) or {}
+        elif job.kind == ProcessingJob.KIND_REPORT_CARD:
+            process_report_card(job.report_card)
+        else:
+            raise ValueError(f"Unknown job kind: {job.kind}")
+    except Exception as e:
+        job.status = ProcessingJob.STATUS_FAILED
+        job.error = traceback.format_exc()
+        job.timings = getattr(e, 'timings', {})
+    else:
+        job.status = ProcessingJob.STATUS_DONE
+        job.error = ''
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'timings', 'finished_at'])
+    record_job(job.kind, job.status, job.timings)
+    return job
+
+
+def requeue_stale_jobs(stale_after):
+    """
+    Put jobs left in the running state by a crashed worker back on the queue
+    """
+    cutoff = timezone.now() - timedelta(seconds=stale_after)
+    return ProcessingJob.objects.filter(
+        status=ProcessingJob.STATUS_RUNNING,
+        started_at__lt=cutoff,
+    ).update(status=ProcessingJob.STATUS_QUEUED, started_at=None)
+
+
+def worker_loop(stop_event, poll_interval=1.0, exit_when_empty=False):
+    """
+    Drain the queue until stop_event is set. Each worker thread runs one of
+    these loops with its own database connection.
+    """
+    try:
+        while not stop_event.is_set():
+            try:
+                job = claim_next_job()
+            except OperationalError:
+                # SQLite raises "database is locked" under write contention
+                stop_event.wait(poll_interval)
+                continue
+            if job is None:
+                if exit_when_empty:
+                    break
+                stop_event.wait(poll_interval)
+                continue
+            run_job(job)
+            close_old_connections()
+    finally:
+        connections.close_all()
+
+
+def run_worker_pool(workers=4, poll_interval=1.0, exit_when_empty=False, stop_event=None):
+    """
+    Start `workers` threads draining the queue and wait for them to finish
+    """
+    stop_event = stop_event or threading.Event()
+    threads = [
+        threading.Thread(
+            target=worker_loop,
+            args=(stop_event, poll_interval, exit_when_empty),
+            name=f"job-worker-{i}",
+            daemon=True,
+        )
+        for i in range(workers)
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        while any(thread.is_alive() for thread in threads):
+            time.sleep(0.2)
+    except KeyboardInterrupt:
+        stop_event.set()
+    for thread in threads:
+        thread.join()
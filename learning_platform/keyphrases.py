@@ -0,0 +1,254 @@
+"""
+Local key-phrase extraction (TF-IDF over n-gram candidates).
+
+Used as the topic extractor when no OpenAI key is configured, and as a cheap
+pre-pass that picks the most relevant passages of a document to send to the
+LLM instead of blindly sending the first few thousand characters.
+
+Text is tokenized with a single regex and the tokens mapped to integer ids;
+candidates are runs of up to MAX_NGRAM non-stopword tokens that don't cross
+punctuation. N-grams are encoded as integers and counted with np.unique, so
+a 500-page document is scored in a fraction of a second. Inverse document
+frequencies come from a corpus table built from every uploaded script's
+extracted text (`python manage.py rebuild_keyphrase_corpus`); without one,
+phrases are ranked by term frequency alone.
+"""
+import math
+import re
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+
+from .models import KeyphraseFrequencies
+
+DEFAULT_KEYPHRASES = {
+    'PREPASS': True,
+    'MAX_NGRAM': 3,
+    'MAX_TERMS': 200000,
+    'CORPUS_RELOAD_INTERVAL': 300,
+}
+
+STOPWORDS = frozenset("""
+a about above after again against all also although am an and any are aren't as at be because been before
+being below between both but by can can't cannot could couldn't did didn't do does doesn't doing don't down
+during each either etc even ever every few for from further get gets got had hadn't has hasn't have haven't
+having he her here hers herself him himself his how however i if in into is isn't it it's its itself just
+let's like made make makes many may me might more most much must my myself no nor not now of off often on
+once one only or other otherwise our ours ourselves out over own per rather same shall she should shouldn't
+since so some such than that that's the their theirs them themselves then there there's therefore these
+they this those though through thus to too two under until up upon us use used uses using very via was
+wasn't we well were weren't what when where whether which while who whom whose why will with within without
+would wouldn't yet you your yours yourself yourselves
+answer answers chapter example examples figure fig give given marks page pages question questions section
+show shown table unit write
+""".split())
+
+_TOKEN_RE = re.compile(r"[a-z][a-z0-9]*(?:['-][a-z0-9]+)*|[.,;:!?()\[\]{}\"|]|\n\s*\n")
+_BLOCK_BOUNDARY = re.compile(r'\n\s*\n')
+# Longer phrases are rarer, so give them a head start over single words
+NGRAM_BOOST = {1: 1.0, 2: 1.6, 3: 1.9}
+# Candidates whose upper-bound score is too low are never looked up
+MAX_CANDIDATES = 4000
+
+
+def get_keyphrase_settings():
+    return {**DEFAULT_KEYPHRASES, **getattr(settings, 'KEYPHRASES', {})}
+
+
+def tokenize(text):
+    """Lower-cased word tokens, with punctuation and blank lines kept as breaks"""
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _is_content_word(token):
+    return len(token) > 2 and token[0].isalpha() and token not in STOPWORDS
+
+
+def count_ngrams(text, max_ngram=3):
+    """
+    Count candidate phrases in `text`. Returns (words, counts) where words
+    maps token id to token and counts maps n to a (codes, counts) pair of
+    arrays; an n-gram's code is its token ids as digits in base len(words).
+    """
+    vocab = {}
+    tokens = tokenize(text)
+    ids = np.fromiter((vocab.setdefault(t, len(vocab)) for t in tokens), dtype=np.int64, count=len(tokens))
+    words = list(vocab)
+    if not words:
+        return words, {}
+    content = np.fromiter((_is_content_word(w) for w in words), dtype=bool, count=len(words))[ids]
+
+    base = len(words)
+    max_ngram = max(1, min(max_ngram, int(math.log(2 ** 62, base)) if base > 1 else max_ngram))
+    counts = {}
+    for n in range(1, max_ngram + 1):
+        if len(ids) < n:
+            break
+        size = len(ids) - n + 1
+        valid = content[:size].copy()
+        codes = ids[:size].copy()
+        for k in range(1, n):
+            valid &= content[k:k + size]
+            codes = codes * base + ids[k:k + size]
+        counts[n] = np.unique(codes[valid], return_counts=True)
+    return words, counts
+
+
+def _decode(code, n, words):
+    base = len(words)
+    parts = []
+    for _ in range(n):
+        code, index = divmod(int(code), base)
+        parts.append(words[index])
+    return " ".join(reversed(parts))
+
+
+def document_phrases(text, max_ngram=3):
+    """The distinct candidate phrases in `text`, for document frequencies"""
+    words, counts = count_ngrams(text, max_ngram)
+    return {_decode(code, n, words) for n, (codes, _) in counts.items() for code in codes}
+
+
+def build_frequencies(texts, max_ngram=None, max_terms=None):
+    """
+    Count how many of `texts` contain each candidate phrase. Returns
+    (document_count, {phrase: df}). Phrases found in a single document are
+    left out, since they score almost the same as unseen ones, and only the
+    `max_terms` most common phrases are kept.
+    """
+    options = get_keyphrase_settings()
+    max_ngram = max_ngram or options['MAX_NGRAM']
+    max_terms = max_terms or options['MAX_TERMS']
+    frequencies = Counter()
+    document_count = 0
+    for text in texts:
+        if text:
+            frequencies.update(document_phrases(text, max_ngram))
+            document_count += 1
+    common = [(phrase, df) for phrase, df in frequencies.most_common(max_terms) if df > 1]
+    return document_count, dict(common)
+
+
+class KeyphraseCorpus:
+    """Document frequencies of candidate phrases, with smoothed IDF"""
+
+    def __init__(self, document_count=0, frequencies=None):
+        self.document_count = document_count
+        self.frequencies = frequencies or {}
+
+    def idf(self, phrase):
+        if not self.document_count:
+            return 1.0
+        return math.log((1 + self.document_count) / (1 + self.frequencies.get(phrase, 0))) + 1.0
+
+
+_corpus_lock = threading.Lock()
+_corpus = None
+_corpus_checked = 0.0
+_corpus_version = None
+
+
+def get_corpus():
+    """
+    The stored corpus table, re-checked for a newer build at most every
+    CORPUS_RELOAD_INTERVAL seconds
+    """
+    global _corpus, _corpus_checked, _corpus_version
+    interval = get_keyphrase_settings()['CORPUS_RELOAD_INTERVAL']
+    if _corpus is not None and time.monotonic() - _corpus_checked < interval:
+        return _corpus
+    with _corpus_lock:
+        if _corpus is None or time.monotonic() - _corpus_checked >= interval:
+            built_at = KeyphraseFrequencies.objects.values_list('built_at', flat=True).first()
+            if _corpus is None or built_at != _corpus_version:
+                row = KeyphraseFrequencies.objects.first() if built_at else None
+                _corpus = KeyphraseCorpus(row.document_count, row.get_frequencies()) if row else KeyphraseCorpus()
+                _corpus_version = built_at
+            _corpus_checked = time.monotonic()
+    return _corpus
+
+
+def reset_corpus():
+    """Forget the loaded corpus so it is read again on next use"""
+    global _corpus, _corpus_version
+    with _corpus_lock:
+        _corpus = None
+        _corpus_version = None
+
+
+def extract_keyphrases(text, top_k=10, corpus=None, max_ngram=None):
+    """
+    Return up to `top_k` key phrases from `text`, best first. Scores are
+    (1 + log tf) * idf * an n-gram length boost; phrases that repeat half
+    or more of the words of a better one are dropped.
+    """
+    if max_ngram is None:
+        max_ngram = get_keyphrase_settings()['MAX_NGRAM']
+    words, counts = count_ngrams(text, max_ngram)
+    if not counts:
+        return []
+    if corpus is None:
+        corpus = get_corpus()
+
+    # Multi-word phrases seen once in a long document are mostly noise
+    min_count = 2 if sum(len(codes) for codes, _ in counts.values()) > 500 else 1
+    ns, codes, weights = [], [], []
+    for n, (ngram_codes, ngram_counts) in counts.items():
+        keep = ngram_counts >= (min_count if n > 1 else 1)
+        ns.append(np.full(keep.sum(), n))
+        codes.append(ngram_codes[keep])
+        weights.append((1 + np.log(ngram_counts[keep])) * NGRAM_BOOST.get(n, NGRAM_BOOST[3]))
+    ns, codes, weights = np.concatenate(ns), np.concatenate(codes), np.concatenate(weights)
+
+    if len(weights) > MAX_CANDIDATES:
+        top = np.argpartition(-weights, MAX_CANDIDATES)[:MAX_CANDIDATES]
+        ns, codes, weights = ns[top], codes[top], weights[top]
+
+    phrases = [_decode(code, n, words) for code, n in zip(codes, ns)]
+    scores = weights * np.fromiter((corpus.idf(p) for p in phrases), dtype=np.float64, count=len(phrases))
+
+    selected = []
+    selected_words = []
+    for index in np.lexsort((np.arange(len(scores)), -scores)):
+        phrase = phrases[index]
+        phrase_words = set(phrase.split())
+        # Skip phrases sharing half or more of their words with a better one
+        if any(len(phrase_words & other) * 2 >= len(phrase_words) for other in selected_words):
+            continue
+        selected.append(phrase)
+        selected_words.append(phrase_words)
+        if len(selected) == top_k:
+            break
+    return selected
+
+
+def condense_text(text, max_chars, top_k=20):
+    """
+    Shrink `text` to at most `max_chars` by keeping the paragraphs with the
+    most key phrases, in their original order. Short text is returned as is.
+    """
+    if max_chars is None or len(text) <= max_chars:
+        return text
+    phrases = extract_keyphrases(text, top_k=top_k)
+    blocks = [block.strip() for block in _BLOCK_BOUNDARY.split(text) if block.strip()]
+    if not phrases or len(blocks) < 2:
+        return text[:max_chars]
+
+    pattern = re.compile(r'\b(?:' + '|'.join(re.escape(p) for p in phrases) + r')\b')
+    # Phrase hits per 1000 characters, so long paragraphs don't win by size alone
+    density = [len(pattern.findall(block.lower())) * 1000 / (len(block) + 200) for block in blocks]
+
+    chosen = set()
+    used = 0
+    for index in sorted(range(len(blocks)), key=lambda i: (-density[i], i)):
+        size = len(blocks[index]) + 2
+        if used + size > max_chars:
+            continue
+        chosen.add(index)
+        used += size
+    if not chosen:
+        return text[:max_chars]
+    return "\n\n".join(blocks[i] for i in sorted(chosen))
@@ -0,0 +1,235 @@
+"""
+Content-addressed cache for OpenAI chat completion responses.
+
+Responses are keyed on a hash of (model, messages, params), so identical
+prompts - e.g. a whole class uploading the same handout - are only sent to
+the API once. The cache is made of tiers (an in-process LRU in front of a
+Django cache, which is SQLite-backed by default) configured through the
+LLM_CACHE setting.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+from .metrics import LLM_CACHE_EVICTIONS, LLM_CACHE_LOOKUPS, async_observe_llm_call, observe_llm_call
+from .ratelimit import async_llm_slot, llm_slot
+
+DEFAULT_LLM_CACHE = {
+    'ENABLED': True,
+    'TTL': 60 * 60 * 24 * 7,
+    'MAX_ENTRIES': 1024,
+    'DJANGO_CACHE_ALIAS': 'llm',
+    'BACKENDS': [
+        'learning_platform.llm_cache.LRUCacheBackend',
+        'learning_platform.llm_cache.DjangoCacheBackend',
+    ],
+}
+
+
+def make_cache_key(model, messages, params):
+    """Stable sha256 over the request that produced a completion"""
+    payload = json.dumps(
+        {'model': model, 'messages': messages, 'params': params},
+        sort_keys=True, separators=(',', ':'), default=str,
+    )
+    return 'llm:' + hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LRUCacheBackend:
+    """
+    In-process LRU with per-entry TTL. Bounded by MAX_ENTRIES; the least
+    recently used entry is evicted when full.
+    """
+    name = 'lru'
+
+    def __init__(self, options):
+        self.max_entries = options['MAX_ENTRIES']
+        self.ttl = options['TTL']
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                value, expires_at = item
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    LLM_CACHE_LOOKUPS.inc(tier=self.name, result='hit')
+                    return value
+                del self._data[key]
+                LLM_CACHE_EVICTIONS.inc(tier=self.name, reason='expired')
+        LLM_CACHE_LOOKUPS.inc(tier=self.name, result='miss')
+        return None
+
+    def set(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                LLM_CACHE_EVICTIONS.inc(tier=self.name, reason='full')
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DjangoCacheBackend:
+    """
+    Shared tier on top of a Django cache alias. With the default
+    DatabaseCache this persists across restarts and worker processes;
+    TIMEOUT/MAX_ENTRIES on the alias handle expiry and culling.
+    """
+    name = 'django'
+
+    def __init__(self, options):
+        self.alias = options['DJANGO_CACHE_ALIAS']
+        self.ttl = options['TTL']
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get(self, key):
+        try:
+            value = self.cache.get(key)
+        except Exception as e:
+            # A missing cache table must never break the request
+            print(f"LLM cache read failed ({self.alias}): {str(e)}")
+            value = None
+        LLM_CACHE_LOOKUPS.inc(tier=self.name, result='hit' if value is not None else 'miss')
+        return value
+
+    def set(self, key, value):
+        try:
+            self.cache.set(key, value, timeout=self.ttl or None)
+        except Exception as e:
+            print(f"LLM cache write failed ({self.alias}): {str(e)}")
+
+    def clear(self):
+        self.cache.clear()
+
+
+class TieredCache:
+    """
+    Look up each tier in order. A hit in a slower tier is copied into the
+    faster tiers above it.
+    """
+
+    def __init__(self, backends):
+        self.backends = backends
+
+    def get(self, key):
+        for i, backend in enumerate(self.backends):
+            value = backend.get(key)
+            if value is not None:
+                for faster in self.backends[:i]:
+                    faster.set(key, value)
+                LLM_CACHE_LOOKUPS.inc(tier='all', result='hit')
+                return value
+        LLM_CACHE_LOOKUPS.inc(tier='all', result='miss')
+        return None
+
+    def set(self, key, value):
+        for backend in self.backends:
+            backend.set(key, value)
+
+    def clear(self):
+        for backend in self.backends:
+            backend.clear()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache():
+    """
+    Return the process-wide cache built from the LLM_CACHE setting, or None
+    when caching is disabled
+    """
+    global _cache
+    options = {**DEFAULT_LLM_CACHE, **getattr(settings, 'LLM_CACHE', {})}
+    if not options['ENABLED']:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = TieredCache([import_string(path)(options) for path in options['BACKENDS']])
+    return _cache
+
+
+def reset_llm_cache():
+    """Drop the process-wide cache so it is rebuilt from settings on next use"""
+    global _cache
+    with _cache_lock:
+        _cache = None
+
+
+def cached_chat_completion(client, model, messages, admission_timeout=None, **params):
+    """
+    Return the text of a chat completion, serving it from the cache when
+    the exact same model/messages/params were sent before. Cache misses
+    wait up to `admission_timeout` seconds for a global OpenAI slot.
+    """
+    cache = get_llm_cache()
+    key = make_cache_key(model, messages, params) if cache else None
+    if cache:
+        content = cache.get(key)
+        if content is not None:
+            return content
+
+    with llm_slot(admission_timeout), observe_llm_call(model) as call:
+        response = client.chat.completions.create(model=model, messages=messages, **params)
+        call.usage = response.usage
+    content = response.choices[0].message.content
+
+    if cache and content is not None:
+        cache.set(key, content)
+    return content
+
+
+async def stream_chat_completion(client, model, messages, admission_timeout=None, **params):
+    """
+    Async generator yielding the text of a chat completion as it arrives.
+    `client` is an AsyncOpenAI client. A cached response is yielded in one
+    piece; a streamed response is cached once it completes.
+    """
+    cache = get_llm_cache()
+    key = make_cache_key(model, messages, params) if cache else None
+    if cache:
+        content = await sync_to_async(cache.get)(key)
+        if content is not None:
+            yield content
+            return
+
+    parts = []
+    async with async_llm_slot(admission_timeout), async_observe_llm_call(model, 'chat_stream') as call:
+        stream = await client.chat.completions.create(
+            model=model, messages=messages, stream=True, stream_options={'include_usage': True}, **params
+        )
+        async for chunk in stream:
+            # With include_usage the last chunk has the token counts and no choices
+            if chunk.usage is not None:
+                call.usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield delta
+
+    if cache and parts:
+        await sync_to_async(cache.set)(key, "".join(parts))
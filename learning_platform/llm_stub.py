@@ -0,0 +1,300 @@
+"""
+Stand-in for the OpenAI chat API in benchmarks and load tests.
+
+StubOpenAI and AsyncStubOpenAI look like the OpenAI and AsyncOpenAI clients
+as far as this app uses them (chat.completions.create, optionally
+streamed). Replies are instant apart from a configurable latency, shaped
+like the prompt asks for (topic lists, "SUMMARY:" sections, one career per
+line), and deterministic, so timings measure our own code rather than the
+network or the model.
+
+StubServer serves the same replies over HTTP as an OpenAI-compatible API
+(`python manage.py run_llm_stub`), for load tests against a running site:
+point OPENAI_BASE_URL at it. Its latency follows a log-normal distribution
+and a share of requests can fail like the real API does (429/500/503).
+"""
+import asyncio
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+from .ratelimit import estimate_tokens
+
+STUB_MODEL = 'stub'
+STUB_TOPICS = ['Key Concepts', 'Definitions', 'Worked Examples', 'Problem Solving', 'Applications']
+_WORD = re.compile(r'[A-Za-z][A-Za-z-]{3,}')
+
+
+def _topics_from(text, count=5):
+    """A few capitalized words from the prompt, so replies vary with the input"""
+    seen = []
+    for word in _WORD.findall(text[:2000]):
+        word = word.capitalize()
+        if word not in seen:
+            seen.append(word)
+        if len(seen) == count:
+            break
+    return seen or STUB_TOPICS[:count]
+
+
+def stub_reply(messages):
+    """Deterministic reply text for a list of chat messages"""
+    system = next((m['content'] for m in messages if m['role'] == 'system'), '')
+    user = messages[-1]['content'] if messages else ''
+    if "SUMMARY:" in system:
+        topics = _topics_from(user)
+        return "\n".join(f"- {topic}" for topic in topics) + f"\nSUMMARY: Covers {', '.join(topics)}."
+    if "Shortlisted careers:" in user:
+        shortlist = user.split("Shortlisted careers:\n", 1)[1].split("\n\n", 1)[0]
+        return shortlist
+    if "topics" in system.lower() or "topics" in user.lower():
+        return "\n".join(f"- {topic}" for topic in _topics_from(user))
+    return f"Stub reply about {', '.join(_topics_from(user, 3))}. " * 4
+
+
+def _usage(messages, content):
+    prompt_tokens = estimate_tokens(*(m['content'] for m in messages))
+    completion_tokens = estimate_tokens(content)
+    return {
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': completion_tokens,
+        'total_tokens': prompt_tokens + completion_tokens,
+    }
+
+
+def completion(messages, model=STUB_MODEL, content=None):
+    """A ChatCompletion for `messages`, as the API would return it"""
+    content = stub_reply(messages) if content is None else content
+    return ChatCompletion.model_validate({
+        'id': f"chatcmpl-{uuid.uuid4().hex}",
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': model,
+        'choices': [{
+            'index': 0,
+            'finish_reason': 'stop',
+            'message': {'role': 'assistant', 'content': content},
+        }],
+        'usage': _usage(messages, content),
+    })
+
+
+def completion_chunks(messages, model=STUB_MODEL, content=None, chunk_chars=16, include_usage=False):
+    """
+    The reply to `messages` split into ChatCompletionChunks, as streamed by
+    the API; with include_usage a last chunk carries the token counts
+    """
+    content = stub_reply(messages) if content is None else content
+    chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+    pieces = [content[i:i + chunk_chars] for i in range(0, len(content), chunk_chars)]
+    for i, piece in enumerate(pieces):
+        yield ChatCompletionChunk.model_validate({
+            'id': chunk_id,
+            'object': 'chat.completion.chunk',
+            'created': created,
+            'model': model,
+            'choices': [{
+                'index': 0,
+                'delta': {'role': 'assistant', 'content': piece} if i == 0 else {'content': piece},
+                'finish_reason': 'stop' if i == len(pieces) - 1 else None,
+            }],
+        })
+    if include_usage:
+        yield ChatCompletionChunk.model_validate({
+            'id': chunk_id,
+            'object': 'chat.completion.chunk',
+            'created': created,
+            'model': model,
+            'choices': [],
+            'usage': _usage(messages, content),
+        })
+
+
+def _include_usage(params):
+    return bool((params.get('stream_options') or {}).get('include_usage'))
+
+
+class _Namespace:
+    def __init__(self, **attrs):
+        self.__dict__.update(attrs)
+
+
+class StubOpenAI:
+    """Synchronous client; every call sleeps `latency` seconds before replying"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+        self.chat = _Namespace(completions=_Namespace(create=self._create))
+
+    def _create(self, model, messages, stream=False, **params):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if stream:
+            return completion_chunks(messages, model, include_usage=_include_usage(params))
+        return completion(messages, model)
+
+
+class AsyncStubOpenAI:
+    """Async client; streamed replies are yielded chunk by chunk"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+        self.chat = _Namespace(completions=_Namespace(create=self._create))
+
+    async def _create(self, model, messages, stream=False, **params):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if stream:
+            return self._stream(messages, model, _include_usage(params))
+        return completion(messages, model)
+
+    async def _stream(self, messages, model, include_usage):
+        for chunk in completion_chunks(messages, model, include_usage=include_usage):
+            yield chunk
+
+
+ERROR_STATUSES = (429, 500, 503)
+
+
+class StubProfile:
+    """
+    How the stub server behaves: a log-normal latency with the given median
+    and spread (sigma 0 for a fixed latency), the share of requests that
+    fail, and the delay between streamed chunks
+    """
+
+    def __init__(self, latency=0.0, sigma=0.0, error_rate=0.0, chunk_delay=0.0, seed=None):
+        self.latency = latency
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.chunk_delay = chunk_delay
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self):
+        if not self.latency:
+            return 0.0
+        with self._lock:
+            return self.latency * math.exp(self._rng.gauss(0, self.sigma)) if self.sigma else self.latency
+
+    def error_status(self):
+        """An HTTP error status for this request, or None to reply normally"""
+        with self._lock:
+            if self.error_rate and self._rng.random() < self.error_rate:
+                return self._rng.choice(ERROR_STATUSES)
+        return None
+
+
+def embeddings(inputs, model, dimensions=None):
+    """An embeddings response body, from the local hashing embedder"""
+    from .vector_index import DEFAULT_VECTOR_INDEX, HashingEmbedder, normalize
+
+    inputs = [inputs] if isinstance(inputs, str) else list(inputs)
+    embedder = HashingEmbedder({**DEFAULT_VECTOR_INDEX, 'DIMENSIONS': dimensions or 1536})
+    vectors = normalize(embedder.embed([(text, []) for text in inputs]))
+    tokens = estimate_tokens(*inputs)
+    return {
+        'object': 'list',
+        'model': model,
+        'data': [{'object': 'embedding', 'index': i, 'embedding': v.tolist()} for i, v in enumerate(vectors)],
+        'usage': {'prompt_tokens': tokens, 'total_tokens': tokens},
+    }
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'StubOpenAI/1.0'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status, message):
+        error_type = 'rate_limit_error' if status == 429 else 'server_error'
+        headers = {'retry-after-ms': '200'} if status == 429 else {}
+        self._send_json(status, {'error': {'message': message, 'type': error_type, 'code': None}}, headers)
+
+    def _path(self):
+        path = self.path.split('?', 1)[0].rstrip('/')
+        return path[3:] if path.startswith('/v1/') else path
+
+    def do_GET(self):
+        if self._path() == '/models':
+            self._send_json(200, {'object': 'list', 'data': [
+                {'id': STUB_MODEL, 'object': 'model', 'created': 0, 'owned_by': 'stub'},
+            ]})
+        else:
+            self._send_error(404, f"Unknown path {self.path}")
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return self._send_error(400, 'Invalid JSON body')
+
+        profile = self.server.profile
+        delay = profile.delay()
+        if delay:
+            time.sleep(delay)
+        status = profile.error_status()
+        if status:
+            return self._send_error(status, 'Stub failure')
+
+        path = self._path()
+        model = body.get('model', STUB_MODEL)
+        if path == '/chat/completions':
+            messages = body.get('messages') or []
+            if body.get('stream'):
+                return self._stream(messages, model, profile.chunk_delay, _include_usage(body))
+            return self._send_json(200, completion(messages, model).model_dump(exclude_none=True))
+        if path == '/embeddings':
+            return self._send_json(200, embeddings(body.get('input') or [], model, body.get('dimensions')))
+        self._send_error(404, f"Unknown path {self.path}")
+
+    def _stream(self, messages, model, chunk_delay, include_usage):
+        # No Content-Length: the stream ends when the connection closes
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        for chunk in completion_chunks(messages, model, include_usage=include_usage):
+            if chunk_delay:
+                time.sleep(chunk_delay)
+            self.wfile.write(f"data: {chunk.model_dump_json(exclude_none=True)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+
+
+class StubServer(ThreadingHTTPServer):
+    """OpenAI-compatible HTTP server, one thread per connection"""
+    daemon_threads = True
+
+    def __init__(self, address, profile=None, verbose=False):
+        self.profile = profile or StubProfile()
+        self.verbose = verbose
+        super().__init__(address, StubRequestHandler)
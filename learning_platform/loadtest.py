@@ -0,0 +1,242 @@
+"""
+HTTP load generator for a running site (see `python manage.py load_test`).
+
+Logged-in sessions send a weighted mix of requests (login, dashboard,
+script upload, chat, streamed chat) at a fixed target rate. The schedule is
+open-loop: request i is due at start + i / rps whether or not earlier ones
+have finished, and latency is measured from when it was due, so a slow
+server shows up as high latency instead of quietly lowering the load.
+Service time (from when the request was actually sent) is reported too.
+
+Run the site against the stub API (`python manage.py run_llm_stub` and
+OPENAI_BASE_URL) to load-test uploads and chat without API quota.
+"""
+import queue
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+from .benchmarks import summarize
+from .synthetic import script_file
+
+SCENARIOS = ('login', 'dashboard', 'upload', 'chat', 'chat_stream')
+DEFAULT_MIX = {'login': 1, 'dashboard': 6, 'upload': 1, 'chat': 2}
+CHAT_MESSAGES = [
+    'Explain photosynthesis in simple terms.',
+    'How do I solve a quadratic equation?',
+    'Give me three quiz questions about the French Revolution.',
+    'What is the difference between speed and velocity?',
+    'Any tips for studying for a maths exam?',
+]
+# Synthetic scripts generated up front and uploaded in turn
+UPLOAD_FILES = 8
+
+
+def parse_mix(value, names=SCENARIOS):
+    """'dashboard=6,chat=2' -> {'dashboard': 6.0, 'chat': 2.0}"""
+    mix = {}
+    for part in value.split(','):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in names:
+            raise ValueError(f"Unknown scenario '{name}' (expected one of: {', '.join(names)})")
+        mix[name] = float(weight) if weight else 1.0
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError('The request mix needs at least one scenario with a positive weight')
+    return mix
+
+
+class LoginFailed(Exception):
+    pass
+
+
+class Session:
+    """One browser: an HTTP client holding a user's session and CSRF cookies"""
+
+    def __init__(self, base_url, username, password, timeout):
+        self.username = username
+        self.password = password
+        self.client = httpx.Client(base_url=base_url, timeout=timeout, follow_redirects=False)
+
+    def login(self):
+        """GET the login page for a CSRF cookie, then POST the credentials"""
+        self.client.cookies.clear()
+        self.client.get('/login/').raise_for_status()
+        response = self.client.post('/login/', data={
+            'username': self.username,
+            'password': self.password,
+            'csrfmiddlewaretoken': self.client.cookies.get('csrftoken', ''),
+        }, headers=self.referer())
+        if response.status_code != 302:
+            raise LoginFailed(f"Login as {self.username} failed ({response.status_code})")
+        return response
+
+    def referer(self):
+        # Django checks the Referer of HTTPS form posts
+        return {'Referer': str(self.client.base_url)}
+
+    def csrf_headers(self):
+        return {'X-CSRFToken': self.client.cookies.get('csrftoken', ''), **self.referer()}
+
+    def close(self):
+        self.client.close()
+
+
+class LoadTest:
+    def __init__(self, base_url, usernames, password, rps=5.0, duration=60.0, mix=None,
+                 upload_format='txt', upload_pages=2, timeout=120.0, seed=0):
+        self.base_url = base_url.rstrip('/')
+        self.usernames = list(usernames)
+        self.password = password
+        self.rps = rps
+        self.duration = duration
+        self.mix = mix or DEFAULT_MIX
+        self.upload_format = upload_format
+        self.upload_pages = upload_pages
+        self.timeout = timeout
+        self.rng = random.Random(seed)
+        self.sessions = queue.Queue()
+        self._lock = threading.Lock()
+        self._latency = {name: [] for name in self.mix}
+        self._service = {name: [] for name in self.mix}
+        self._first_byte = []
+        self._errors = {name: Counter() for name in self.mix}
+        self._upload_files = []
+        self._upload_index = 0
+
+    def prepare(self, progress=None):
+        """Log every user in and generate the upload files"""
+        progress = progress or (lambda message: None)
+        if 'upload' in self.mix:
+            self._upload_files = [
+                script_file(self.rng, self.upload_format, self.upload_pages)[:2] for _ in range(UPLOAD_FILES)
+            ]
+        for username in self.usernames:
+            session = Session(self.base_url, username, self.password, self.timeout)
+            session.login()
+            self.sessions.put(session)
+        progress(f"Logged in {len(self.usernames)} session(s)")
+
+    def close(self):
+        while not self.sessions.empty():
+            self.sessions.get_nowait().close()
+
+    # Scenarios: each returns the response; a status other than `expected` is an error
+
+    def scenario_login(self, session):
+        return session.login(), 302
+
+    def scenario_dashboard(self, session):
+        return session.client.get('/dashboard/'), 200
+
+    def scenario_upload(self, session):
+        with self._lock:
+            name, data = self._upload_files[self._upload_index % len(self._upload_files)]
+            self._upload_index += 1
+        response = session.client.post(
+            '/upload-script/',
+            data={'title': name, 'subject': 'Science'},
+            files={'script_file': (name, data)},
+            headers={'Accept': 'application/json', **session.csrf_headers()},
+        )
+        return response, 202
+
+    def scenario_chat(self, session):
+        return session.client.post('/api/chatbot/', data={'message': self.rng.choice(CHAT_MESSAGES)}), 200
+
+    def scenario_chat_stream(self, session):
+        started = time.perf_counter()
+        first_byte = None
+        with session.client.stream('POST', '/api/chatbot/stream/',
+                                   data={'message': self.rng.choice(CHAT_MESSAGES)}) as response:
+            for line in response.iter_lines():
+                if first_byte is None and line.startswith('data:'):
+                    first_byte = time.perf_counter() - started
+                if line == 'data: [DONE]':
+                    break
+        if first_byte is not None and response.status_code == 200:
+            with self._lock:
+                self._first_byte.append(first_byte)
+        return response, 200
+
+    def _request(self, name, due):
+        session = self.sessions.get()
+        sent = time.perf_counter()
+        try:
+            response, expected = getattr(self, f"scenario_{name}")(session)
+            outcome = None if response.status_code == expected else str(response.status_code)
+        except LoginFailed:
+            outcome = 'login_failed'
+        except httpx.HTTPError as e:
+            outcome = type(e).__name__
+        finally:
+            self.sessions.put(session)
+        finished = time.perf_counter()
+        with self._lock:
+            if outcome is None:
+                self._latency[name].append(finished - due)
+                self._service[name].append(finished - sent)
+            else:
+                self._errors[name][outcome] += 1
+
+    def run(self, progress=None):
+        """Send requests at the target rate for `duration` seconds; returns the results"""
+        progress = progress or (lambda message: None)
+        names = list(self.mix)
+        weights = [self.mix[name] for name in names]
+        total = int(self.rps * self.duration)
+        # Logged-in sessions bound the concurrency; extra requests wait for one
+        with ThreadPoolExecutor(max_workers=max(1, self.sessions.qsize())) as executor:
+            started = time.perf_counter()
+            for i in range(total):
+                due = started + i / self.rps
+                wait = due - time.perf_counter()
+                if wait > 0:
+                    time.sleep(wait)
+                executor.submit(self._request, self.rng.choices(names, weights)[0], due)
+                if i and i % max(1, int(self.rps * 10)) == 0:
+                    progress(f"{i}/{total} requests sent")
+        elapsed = time.perf_counter() - started
+        return self.results(elapsed)
+
+    def results(self, elapsed):
+        scenarios = {}
+        completed = failed = 0
+        for name in self.mix:
+            ok = len(self._latency[name])
+            errors = sum(self._errors[name].values())
+            completed += ok
+            failed += errors
+            scenarios[name] = {
+                **summarize(self._latency[name]),
+                'service': summarize(self._service[name]),
+                'errors': dict(self._errors[name]),
+                'error_rate': round(errors / (ok + errors), 4) if ok + errors else 0.0,
+                'throughput_rps': round(ok / elapsed, 2),
+            }
+        if self._first_byte:
+            scenarios['chat_stream']['first_byte'] = summarize(self._first_byte)
+        all_latency = [sample for samples in self._latency.values() for sample in samples]
+        return {
+            'meta': {
+                'base_url': self.base_url,
+                'target_rps': self.rps,
+                'duration_s': round(elapsed, 2),
+                'sessions': len(self.usernames),
+                'mix': self.mix,
+            },
+            'results': {
+                'total': {
+                    **summarize(all_latency),
+                    'errors': failed,
+                    'throughput_rps': round(completed / elapsed, 2),
+                },
+                'scenarios': scenarios,
+            },
+        }
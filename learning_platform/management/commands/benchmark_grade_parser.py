@@ -0,0 +1,98 @@
+import os
+import re
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from learning_platform.extract_workers import extract_file_text, extract_pdf_tables
+from learning_platform.grades import parse_grades_text, parse_report_card
+from learning_platform.synthetic import report_card_pdf, report_cards
+
+# The regex extract_grades_from_text used before grades.py, for comparison
+LEGACY_PATTERN = re.compile(r'([A-Za-z\s]+?)\s*:?\s*([A-D][+-]?|F|[0-9]{1,3}%|[0-9]{1,3})', re.IGNORECASE)
+
+
+def legacy_extract_grades(content):
+    grades = {}
+    for subject, grade in LEGACY_PATTERN.findall(content):
+        subject, grade = subject.strip(), grade.strip()
+        if subject and grade:
+            grades[subject] = grade
+    return grades
+
+
+def _legacy_correct(found, expected):
+    """Legacy output keeps raw subject names and grade strings; compare loosely"""
+    found = {subject.lower(): grade.rstrip('%') for subject, grade in found.items()}
+    return all(found.get(subject.lower()) == str(score) for subject, score in expected.items())
+
+
+def _time(func, inputs, repeat):
+    """Best-of-`repeat` seconds for one pass of func over inputs, and the last results"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        results = [func(item) for item in inputs]
+        timings.append(time.perf_counter() - started)
+    return min(timings), results
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark report card grade parsing on synthetic report cards: throughput and '
+        'accuracy of the grades.py parser against the old regex, and PDF table extraction.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=2000, help='Synthetic report cards to parse')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the synthetic data')
+        parser.add_argument('--repeat', type=int, default=3, help='Timed passes (best is reported)')
+        parser.add_argument('--comment-lines', type=int, default=2,
+                            help='Teacher comment lines per card; raise to simulate long transcripts')
+        parser.add_argument('--pdfs', type=int, default=50,
+                            help='Cards rendered to PDF for the extraction benchmark (0 to skip)')
+
+    def handle(self, *args, **options):
+        cards = report_cards(options['count'], seed=options['seed'], comment_lines=options['comment_lines'])
+        texts = [card['text'] for card in cards]
+        size = sum(len(text) for text in texts)
+        self.stdout.write(f"{len(cards)} report cards, {size / 1024:.0f} KiB of text")
+
+        for name, func, correct in (
+            ('legacy regex', legacy_extract_grades, _legacy_correct),
+            ('grades.py', parse_grades_text, lambda found, expected: found == expected),
+        ):
+            seconds, results = _time(func, texts, options['repeat'])
+            accurate = sum(correct(found, card['expected']) for found, card in zip(results, cards))
+            self.stdout.write(
+                f"{name:>14}: {seconds * 1000:8.1f} ms  {len(cards) / seconds:9.0f} cards/s  "
+                f"{size / seconds / 1024 / 1024:6.1f} MiB/s  exact {accurate}/{len(cards)}"
+            )
+
+        if options['pdfs']:
+            self._benchmark_pdfs(cards[:options['pdfs']])
+
+    def _benchmark_pdfs(self, cards):
+        text_seconds, table_seconds = [], []
+        accurate = 0
+        with tempfile.TemporaryDirectory() as directory:
+            for index, card in enumerate(cards):
+                path = os.path.join(directory, f"card{index}.pdf")
+                with open(path, 'wb') as f:
+                    f.write(report_card_pdf(card))
+
+                started = time.perf_counter()
+                text = extract_file_text(path)
+                text_seconds.append(time.perf_counter() - started)
+                started = time.perf_counter()
+                tables = extract_pdf_tables(path)
+                table_seconds.append(time.perf_counter() - started)
+
+                accurate += parse_report_card(text, tables) == card['expected']
+        self.stdout.write(
+            f"{len(cards)} PDFs: text {statistics.median(text_seconds) * 1000:.1f} ms/card, "
+            f"tables {statistics.median(table_seconds) * 1000:.1f} ms/card (median), "
+            f"exact {accurate}/{len(cards)}"
+        )
@@ -0,0 +1,74 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from learning_platform.benchmarks import (
+    SQLITE_DEFAULT_PROFILE, WRITE_MIX, configured_sqlite_profile, run_sqlite_write_suite,
+)
+from learning_platform.loadtest import parse_mix
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure SQLite write concurrency: several worker threads upload scripts, claim jobs and '
+        'read dashboards at once in a throwaway database, once with stock SQLite settings and once '
+        'with the configured profile (SQLITE_PROFILE), and report throughput, latency and '
+        '"database is locked" errors.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Concurrent worker threads')
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds to run each profile for')
+        parser.add_argument('--students', type=int, default=20, help='Synthetic students')
+        parser.add_argument('--mix', default=','.join(f'{name}={weight}' for name, weight in WRITE_MIX.items()),
+                            help='Weighted operations: upload, claim, read (default: %(default)s)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Also write the results as JSON to this file')
+
+    def handle(self, *args, **options):
+        try:
+            mix = parse_mix(options['mix'], WRITE_MIX)
+        except ValueError as e:
+            raise CommandError(str(e))
+        if options['workers'] < 1 or options['duration'] <= 0:
+            raise CommandError('--workers must be at least 1 and --duration positive')
+
+        profiles = {'default': SQLITE_DEFAULT_PROFILE, 'configured': configured_sqlite_profile()}
+        try:
+            results = run_sqlite_write_suite(
+                profiles, workers=options['workers'], duration=options['duration'],
+                students=options['students'], mix=mix, seed=options['seed'],
+                progress=lambda name: self.stderr.write(
+                    f"Running the {name} profile with {options['workers']} worker(s) for {options['duration']:g}s..."
+                ),
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.report(results)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+                f.write('\n')
+            self.stdout.write(self.style.SUCCESS(f"Wrote results to {options['output']}"))
+
+    def report(self, results):
+        self.stdout.write(
+            f"\n{'profile':<11} {'operation':<9} {'ok':>7} {'errors':>6} {'ops/s':>8} "
+            f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+        )
+        for name, result in results['results'].items():
+            for operation, row in result['operations'].items():
+                self.stdout.write(
+                    f"{name:<11} {operation:<9} {row['count']:>7} {sum(row['errors'].values()):>6} "
+                    f"{row['throughput_ops']:>8.1f} {row.get('p50_ms', 0):>8.1f} "
+                    f"{row.get('p95_ms', 0):>8.1f} {row.get('p99_ms', 0):>8.1f}"
+                )
+            total = result['total']
+            self.stdout.write(
+                f"{name:<11} {'total':<9} {total['ok']:>7} {total['errors']:>6} {total['throughput_ops']:>8.1f}"
+                f"   (journal_mode={result['journal_mode']})"
+            )
+            for operation, row in result['operations'].items():
+                if row['errors']:
+                    self.stdout.write(self.style.WARNING(f"  {operation} errors: {row['errors']}"))
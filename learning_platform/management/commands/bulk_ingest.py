@@ -0,0 +1,297 @@
+import csv
+import os
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from learning_platform.extract_workers import hash_and_extract
+from learning_platform.extraction import PARSER_VERSION, process_pool_context
+from learning_platform.jobs import claim_job, requeue_stale_jobs, run_job
+from learning_platform.models import (
+    DocumentBlob, IngestRecord, ProcessingJob, ReportCard, SearchDocument, Student, StudentStats, UploadedScript,
+)
+from learning_platform.page_cache import bump_page_version
+from learning_platform.search import script_document
+
+KIND_SCRIPT = ProcessingJob.KIND_SCRIPT
+KIND_REPORT_CARD = ProcessingJob.KIND_REPORT_CARD
+
+
+class ManifestEntry:
+    def __init__(self, row, root):
+        self.file = row['file'].strip()
+        self.path = os.path.join(root, self.file)
+        self.username = row['username'].strip()
+        self.kind = (row.get('kind') or KIND_SCRIPT).strip()
+        self.title = (row.get('title') or '').strip() or os.path.basename(self.file)
+        self.subject = (row.get('subject') or '').strip()
+        self.grade_level = (row.get('grade_level') or '').strip()
+        self.grade = (row.get('grade') or '').strip()
+        self.term = (row.get('term') or '').strip()
+
+    @property
+    def key(self):
+        return f"{self.kind}:{self.username}:{self.file}"
+
+
+class Command(BaseCommand):
+    help = (
+        'Import a directory or zip of scripts and report cards described by a CSV manifest '
+        '(columns: file, username, kind, title, subject, grade_level, grade, term). '
+        'Safe to re-run: entries already imported from the same source are skipped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Directory or .zip file containing the documents')
+        parser.add_argument('--manifest', default='manifest.csv',
+                            help='Manifest CSV, relative to the source (default: manifest.csv)')
+        parser.add_argument('--source-name',
+                            help='Name used to track progress for resuming (default: absolute path)')
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Documents written per transaction')
+        parser.add_argument('--extract-workers', type=int, default=os.cpu_count() or 1,
+                            help='Processes used for text extraction')
+        parser.add_argument('--concurrency', type=int, default=4,
+                            help='Documents analyzed at the same time')
+        parser.add_argument('--create-students', action='store_true',
+                            help='Create accounts for usernames that do not exist yet')
+        parser.add_argument('--no-analyze', action='store_true',
+                            help='Only import; leave analysis jobs queued for run_workers. Scripts are '
+                                 'searchable at once but only appear in related material once analyzed '
+                                 '(or after rebuild_vector_index)')
+
+    def handle(self, *args, **options):
+        path = os.path.abspath(options['path'])
+        if not os.path.exists(path):
+            raise CommandError(f'{path} does not exist')
+        source = options['source_name'] or path
+
+        started = time.perf_counter()
+        with self.open_source(path) as root:
+            manifest_path = os.path.join(root, options['manifest'])
+            if not os.path.exists(manifest_path):
+                raise CommandError(f'Manifest {options["manifest"]} not found in {path}')
+            entries = self.read_manifest(manifest_path, root)
+
+            imported = set(IngestRecord.objects.filter(source=source).values_list('entry_key', flat=True))
+            pending = [entry for entry in entries if entry.key not in imported]
+            self.stdout.write(f'{len(entries)} manifest entries, {len(entries) - len(pending)} already imported')
+
+            students = self.resolve_students({entry.username for entry in pending}, options['create_students'])
+            ingested, failed = self.ingest(source, pending, students, options)
+        ingest_seconds = time.perf_counter() - started
+
+        analyze_seconds = 0
+        analyzed = 0
+        if not options['no_analyze']:
+            analyze_started = time.perf_counter()
+            analyzed = self.analyze(source, options['concurrency'])
+            analyze_seconds = time.perf_counter() - analyze_started
+
+        total_seconds = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {ingested} document(s) in {ingest_seconds:.1f}s '
+            f'({ingested / ingest_seconds if ingest_seconds else 0:.1f} docs/sec), {failed} failed'
+        ))
+        if not options['no_analyze']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Analyzed {analyzed} document(s) in {analyze_seconds:.1f}s '
+                f'({analyzed / analyze_seconds if analyze_seconds else 0:.1f} docs/sec)'
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f'Total {total_seconds:.1f}s ({(ingested + analyzed) / total_seconds if total_seconds else 0:.1f} docs/sec overall)'
+        ))
+
+    @contextmanager
+    def open_source(self, path):
+        if os.path.isdir(path):
+            yield path
+            return
+        if not zipfile.is_zipfile(path):
+            raise CommandError(f'{path} is neither a directory nor a zip file')
+        with tempfile.TemporaryDirectory(prefix='bulk_ingest_') as tmp:
+            with zipfile.ZipFile(path) as archive:
+                archive.extractall(tmp)
+            yield tmp
+
+    def read_manifest(self, manifest_path, root):
+        with open(manifest_path, newline='', encoding='utf-8-sig') as f:
+            reader = csv.DictReader(f)
+            missing = {'file', 'username'} - set(reader.fieldnames or [])
+            if missing:
+                raise CommandError(f'Manifest is missing column(s): {", ".join(sorted(missing))}')
+            entries = [ManifestEntry(row, root) for row in reader if row.get('file')]
+
+        for entry in entries:
+            if entry.kind not in (KIND_SCRIPT, KIND_REPORT_CARD):
+                raise CommandError(f'Unknown kind "{entry.kind}" for {entry.file}')
+        return entries
+
+    def resolve_students(self, usernames, create):
+        students = {s.user.username: s for s in Student.objects.select_related('user').filter(user__username__in=usernames)}
+        for username in sorted(usernames - students.keys()):
+            if not create:
+                continue
+            user = User.objects.filter(username=username).first()
+            if user is None:
+                user = User(username=username)
+                user.set_unusable_password()
+                user.save()
+            students[username] = Student.objects.create(user=user)
+        return students
+
+    def ingest(self, source, pending, students, options):
+        """Extract text in a process pool and write documents batch by batch"""
+        ready = []
+        failed = 0
+        for entry in pending:
+            if entry.username not in students:
+                self.stderr.write(f'Skipping {entry.file}: unknown student "{entry.username}"')
+                failed += 1
+            elif not os.path.isfile(entry.path):
+                self.stderr.write(f'Skipping {entry.file}: file not found')
+                failed += 1
+            else:
+                ready.append(entry)
+
+        ingested = 0
+        batch_size = options['batch_size']
+        with ProcessPoolExecutor(max_workers=options['extract_workers'], mp_context=process_pool_context()) as pool:
+            results = pool.map(hash_and_extract, [entry.path for entry in ready], chunksize=4)
+            pairs = zip(ready, results)
+            while True:
+                batch = list(islice(pairs, batch_size))
+                if not batch:
+                    break
+                good = []
+                for entry, (sha256, size, text, error) in batch:
+                    if error:
+                        self.stderr.write(f'Skipping {entry.file}: {error}')
+                        failed += 1
+                    else:
+                        good.append((entry, sha256, size, text))
+                self.write_batch(source, good, students)
+                ingested += len(good)
+                self.stdout.write(f'  imported {ingested}/{len(ready)}')
+        return ingested, failed
+
+    def write_batch(self, source, batch, students):
+        if not batch:
+            return
+        # Files written for this batch, deleted again if the transaction rolls back
+        saved = []
+        try:
+            with transaction.atomic():
+                self.write_rows(source, batch, students, saved)
+        except Exception:
+            for storage, name in saved:
+                storage.delete(name)
+            raise
+
+    def write_rows(self, source, batch, students, saved):
+        shas = {sha256 for entry, sha256, _, _ in batch if entry.kind == KIND_SCRIPT}
+        blobs = DocumentBlob.objects.in_bulk(shas, field_name='sha256')
+        new_blobs = []
+        for entry, sha256, size, _ in batch:
+            if entry.kind == KIND_SCRIPT and sha256 not in blobs:
+                blob = DocumentBlob(sha256=sha256, size=size)
+                extension = os.path.splitext(entry.file)[1].lower()
+                with open(entry.path, 'rb') as f:
+                    blob.file.save(f"{sha256}{extension}", File(f), save=False)
+                saved.append((blob.file.storage, blob.file.name))
+                blobs[sha256] = blob
+                new_blobs.append(blob)
+        # Another import or upload may have stored the same content meanwhile:
+        # keep its row and drop our copy of the file
+        DocumentBlob.objects.bulk_create(new_blobs, ignore_conflicts=True)
+        blobs = DocumentBlob.objects.in_bulk(shas, field_name='sha256')
+        for blob in new_blobs:
+            if blobs[blob.sha256].file.name != blob.file.name:
+                saved.remove((blob.file.storage, blob.file.name))
+                blob.file.storage.delete(blob.file.name)
+
+        scripts = []
+        report_cards = []
+        for entry, sha256, _, text in batch:
+            student = students[entry.username]
+            if entry.kind == KIND_SCRIPT:
+                blob = blobs[sha256]
+                document = UploadedScript(
+                    student=student, title=entry.title, subject=entry.subject,
+                    grade_level=entry.grade_level, file=blob.file.name, blob=blob,
+                )
+                scripts.append((entry, document))
+            else:
+                with open(entry.path, 'rb') as f:
+                    name = default_storage.save(f"report_cards/{os.path.basename(entry.file)}", File(f))
+                saved.append((default_storage, name))
+                document = ReportCard(student=student, file=name, grade=entry.grade, term=entry.term)
+                report_cards.append((entry, document))
+            document.set_extracted_text(text, PARSER_VERSION)
+
+        UploadedScript.objects.bulk_create([document for _, document in scripts])
+        ReportCard.objects.bulk_create([document for _, document in report_cards])
+        # bulk_create skips the signals that keep the search index up to date
+        SearchDocument.objects.bulk_create([
+            SearchDocument(kind=SearchDocument.KIND_SCRIPT, object_id=document.pk, **script_document(document))
+            for _, document in scripts
+        ], ignore_conflicts=True)
+
+        jobs = [
+            (entry, ProcessingJob(student=document.student, kind=KIND_SCRIPT, script=document))
+            for entry, document in scripts
+        ] + [
+            (entry, ProcessingJob(student=document.student, kind=KIND_REPORT_CARD, report_card=document))
+            for entry, document in report_cards
+        ]
+        ProcessingJob.objects.bulk_create([job for _, job in jobs])
+        IngestRecord.objects.bulk_create([
+            IngestRecord(source=source, entry_key=entry.key, job=job) for entry, job in jobs
+        ])
+
+        # bulk_create skips signals, so refresh dashboard counters and page
+        # caches with the batch: an interrupted run leaves them consistent
+        for student in {students[entry.username] for entry, *_ in batch}:
+            StudentStats.rebuild(student)
+            transaction.on_commit(lambda user_id=student.user_id: bump_page_version(user_id))
+
+    def analyze(self, source, concurrency):
+        """Run this source's queued jobs with at most `concurrency` at a time"""
+        requeue_stale_jobs(getattr(settings, 'JOB_STALE_AFTER', 900))
+        pks = list(ProcessingJob.objects.filter(
+            ingestrecord__source=source, status=ProcessingJob.STATUS_QUEUED,
+        ).order_by('pk').values_list('pk', flat=True))
+        if not pks:
+            return 0
+        self.stdout.write(f'Analyzing {len(pks)} document(s) with concurrency {concurrency}')
+
+        done = 0
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='ingest') as pool:
+            for status in pool.map(self.run_one, pks):
+                if status == ProcessingJob.STATUS_FAILED:
+                    self.stderr.write('  a document failed to process; see its ProcessingJob.error')
+                if status is not None:
+                    done += 1
+                if done and done % 25 == 0:
+                    self.stdout.write(f'  analyzed {done}/{len(pks)}')
+        return done
+
+    def run_one(self, pk):
+        try:
+            job = claim_job(pk)
+            if job is None:
+                # Picked up by a run_workers process in the meantime
+                return None
+            return run_job(job).status
+        finally:
+            connections.close_all()
@@ -0,0 +1,109 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from learning_platform.loadtest import DEFAULT_MIX, LoadTest, LoginFailed, parse_mix
+from learning_platform.models import Student
+from learning_platform.synthetic import SCRIPT_FORMATS
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive logged-in sessions against a running site at a target request rate '
+        '(login, dashboard, upload, chat) and report latency percentiles and throughput. '
+        'Run the site with OPENAI_BASE_URL pointing at `run_llm_stub` to spare API quota, '
+        'and with rate limits raised or disabled.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000', help='Site to load (default: %(default)s)')
+        parser.add_argument('--rps', type=float, default=5.0, help='Target requests per second')
+        parser.add_argument('--duration', type=float, default=60.0, help='Seconds to send requests for')
+        parser.add_argument('--users', type=int, default=10,
+                            help='Concurrent logged-in sessions (also the maximum requests in flight)')
+        parser.add_argument('--username-prefix', default='loadtest_',
+                            help='Sessions log in as PREFIX0, PREFIX1, ...')
+        parser.add_argument('--password', default='loadtest-password')
+        parser.add_argument('--create-users', action='store_true',
+                            help='Create the load test users and students in this database first '
+                                 '(only useful when the site uses the same database)')
+        parser.add_argument('--mix', default=','.join(f'{name}={weight}' for name, weight in DEFAULT_MIX.items()),
+                            help='Weighted scenarios: login, dashboard, upload, chat, chat_stream '
+                                 '(default: %(default)s)')
+        parser.add_argument('--upload-format', choices=SCRIPT_FORMATS, default='txt')
+        parser.add_argument('--upload-pages', type=int, default=2)
+        parser.add_argument('--timeout', type=float, default=120.0, help='Seconds before a request fails')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Also write the results as JSON to this file')
+
+    def handle(self, *args, **options):
+        try:
+            mix = parse_mix(options['mix'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        if options['rps'] <= 0 or options['users'] < 1:
+            raise CommandError('--rps must be positive and --users at least 1')
+
+        usernames = [f"{options['username_prefix']}{i}" for i in range(options['users'])]
+        if options['create_users']:
+            self.create_users(usernames, options['password'])
+
+        load_test = LoadTest(
+            options['base_url'], usernames, options['password'],
+            rps=options['rps'], duration=options['duration'], mix=mix,
+            upload_format=options['upload_format'], upload_pages=options['upload_pages'],
+            timeout=options['timeout'], seed=options['seed'],
+        )
+        progress = lambda message: self.stdout.write(f'  {message}')
+        try:
+            try:
+                load_test.prepare(progress)
+            except LoginFailed as e:
+                raise CommandError(f'{e}. Create the users with --create-users or check --password.')
+            self.stdout.write(
+                f"Sending {options['rps']:g} requests/sec for {options['duration']:g}s "
+                f"to {options['base_url']} from {len(usernames)} session(s)..."
+            )
+            results = load_test.run(progress)
+        finally:
+            load_test.close()
+
+        self.report(results)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+                f.write('\n')
+            self.stdout.write(self.style.SUCCESS(f"Wrote results to {options['output']}"))
+
+    def create_users(self, usernames, password):
+        for username in usernames:
+            user, created = User.objects.get_or_create(username=username)
+            if created or not user.check_password(password):
+                user.set_password(password)
+                user.save()
+            Student.objects.get_or_create(user=user, defaults={'grade_level': 'Grade 11'})
+        self.stdout.write(f'Load test users ready: {usernames[0]} .. {usernames[-1]}')
+
+    def report(self, results):
+        meta = results['meta']
+        self.stdout.write(
+            f"\n{'scenario':<12} {'ok':>6} {'errors':>6} {'rps':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+        )
+        rows = list(results['results']['scenarios'].items()) + [('total', results['results']['total'])]
+        for name, row in rows:
+            errors = row['errors'] if isinstance(row['errors'], int) else sum(row['errors'].values())
+            self.stdout.write(
+                f"{name:<12} {row['count']:>6} {errors:>6} {row['throughput_rps']:>7.2f} "
+                f"{row.get('p50_ms', 0):>9.1f} {row.get('p95_ms', 0):>9.1f} {row.get('p99_ms', 0):>9.1f}"
+            )
+        for name, row in results['results']['scenarios'].items():
+            if row['errors']:
+                self.stdout.write(self.style.WARNING(f"  {name} errors: {row['errors']}"))
+            if 'first_byte' in row:
+                self.stdout.write(f"  {name} first byte p50/p95: "
+                                  f"{row['first_byte']['p50_ms']:.1f}/{row['first_byte']['p95_ms']:.1f} ms")
+        self.stdout.write(
+            f"Target {meta['target_rps']:g} requests/sec, achieved "
+            f"{results['results']['total']['throughput_rps']:.2f} over {meta['duration_s']}s"
+        )
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from learning_platform.keyphrases import build_frequencies, reset_corpus
+from learning_platform.models import KeyphraseFrequencies, UploadedScript
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the corpus-wide key phrase document frequencies used by the local '
+        'topic extractor from the extracted text of every uploaded script'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-terms', type=int, help='Keep at most this many phrases (default: KEYPHRASES MAX_TERMS)')
+
+    def handle(self, *args, **options):
+        document_count, frequencies = build_frequencies(self.script_texts(), max_terms=options['max_terms'])
+
+        row = KeyphraseFrequencies.objects.first() or KeyphraseFrequencies()
+        row.document_count = document_count
+        row.set_frequencies(frequencies)
+        row.save()
+        KeyphraseFrequencies.objects.exclude(pk=row.pk).delete()
+        reset_corpus()
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {len(frequencies)} phrase(s) from {document_count} document(s)'
+        ))
+
+    def script_texts(self):
+        """Extracted text of each distinct document; copies of one blob count once"""
+        seen_blobs = set()
+        scripts = (
+            UploadedScript.objects.filter(extracted_text_compressed__isnull=False)
+            .only('extracted_text_compressed', 'blob_id').order_by('pk')
+        )
+        for script in scripts.iterator(chunk_size=200):
+            if script.blob_id is not None:
+                if script.blob_id in seen_blobs:
+                    continue
+                seen_blobs.add(script.blob_id)
+            yield script.get_extracted_text()
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from learning_platform.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Re-create the full-text search index for every script, memorandum and study plan'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            indexed = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} document(s)'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from learning_platform.models import Student, StudentStats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized dashboard counters (StudentStats) for every student'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--student', help='Only rebuild stats for this username')
+
+    def handle(self, *args, **options):
+        students = Student.objects.all()
+        if options['student']:
+            students = students.filter(user__username=options['student'])
+
+        rebuilt = 0
+        for student in students.iterator(chunk_size=500):
+            StudentStats.rebuild(student)
+            rebuilt += 1
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt stats for {rebuilt} student(s)'))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from learning_platform.models import UploadedScript
+from learning_platform.vector_index import get_vector_index_settings, rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the related-material embedding index from every uploaded script. '
+        'Needed after changing VECTOR_INDEX BACKEND or DIMENSIONS, and compacts re-analyzed scripts.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=64, help='Scripts embedded per batch')
+
+    def handle(self, *args, **options):
+        scripts = UploadedScript.objects.order_by('pk').iterator(chunk_size=200)
+        indexed = rebuild(scripts, batch_size=options['batch_size'])
+        index_options = get_vector_index_settings()
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {indexed} script(s) with the {index_options["BACKEND"]} backend '
+            f'({index_options["DIMENSIONS"]} dimensions) in {index_options["PATH"]}'
+        ))
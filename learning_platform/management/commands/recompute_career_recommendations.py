@@ -0,0 +1,113 @@
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from learning_platform.careers import get_career_scoring_settings, score_careers_batch
+from learning_platform.models import CareerRecommendation, ProcessingJob, ReportCard, Student
+from learning_platform.page_cache import bump_page_version
+
+# Rows per UPDATE statement: bulk_update builds one CASE per field, which
+# gets slow to compile for thousands of rows
+UPDATE_BATCH_SIZE = 250
+
+RESULT_FIELDS = {
+    'recommended_careers': 'careers',
+    'strengths': 'strengths',
+    'areas_for_improvement': 'areas_for_improvement',
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute career recommendations for every report card from its stored grades, '
+        'e.g. after editing the career affinity file. Updates the latest recommendation of '
+        'each report card in place and creates missing ones. Report cards still being processed, '
+        'or without grades, are skipped. Rankings are local only: with CAREER_LLM_ENRICHMENT on, '
+        'an LLM re-ranked order is replaced by the local one.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Report cards scored and written per transaction')
+        parser.add_argument('--student', help='Only recompute report cards of this username')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Score everything and report what would change, without writing')
+
+    def handle(self, *args, **options):
+        # Their job will write the recommendation (and may still change the grades)
+        report_cards = ReportCard.objects.exclude(
+            processingjob__status__in=[ProcessingJob.STATUS_QUEUED, ProcessingJob.STATUS_RUNNING],
+        ).order_by('pk')
+        if options['student']:
+            report_cards = report_cards.filter(student__user__username=options['student'])
+        total = report_cards.count()
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+
+        if get_career_scoring_settings()['LLM_ENRICHMENT']:
+            self.stdout.write(self.style.WARNING(
+                'LLM_ENRICHMENT is on, but recomputed rankings are local only.'
+            ))
+
+        started = time.perf_counter()
+        processed = created = updated = skipped = 0
+        # Only the columns scoring needs: stored text and files are never loaded
+        rows = report_cards.values_list('pk', 'student_id', 'grades_data').iterator(chunk_size=batch_size)
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            processed += len(batch)
+            # No grades: processing failed, or the card predates grade extraction
+            graded = [row for row in batch if row[2]]
+            skipped += len(batch) - len(graded)
+            batch_created, batch_updated = self.recompute_batch(graded, dry_run) if graded else (0, 0)
+            created += batch_created
+            updated += batch_updated
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'  {processed}/{total} report cards ({processed / elapsed if elapsed else 0:.0f}/sec), '
+                f'{created} new, {updated} changed'
+            )
+
+        prefix = 'Dry run: would have' if dry_run else 'Recomputed recommendations:'
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix} created {created} and updated {updated}; '
+            f'{processed - created - updated - skipped} of {processed} report card(s) unchanged, '
+            f'{skipped} without grades skipped, in {time.perf_counter() - started:.1f}s'
+        ))
+
+    def recompute_batch(self, batch, dry_run):
+        """Score one batch and write the differences. Returns (created, updated)."""
+        results = score_careers_batch([grades_data for _, _, grades_data in batch])
+
+        # A report card can have several recommendations; the newest is the one shown
+        latest = {}
+        existing = CareerRecommendation.objects.filter(
+            report_card_id__in=[pk for pk, _, _ in batch],
+        ).only('pk', 'report_card_id', 'student_id', *RESULT_FIELDS).order_by('pk')
+        for recommendation in existing:
+            latest[recommendation.report_card_id] = recommendation
+
+        to_create, to_update = [], []
+        for (pk, student_id, _), result in zip(batch, results):
+            values = {field: result[key] for field, key in RESULT_FIELDS.items()}
+            recommendation = latest.get(pk)
+            if recommendation is None:
+                to_create.append(CareerRecommendation(student_id=student_id, report_card_id=pk, **values))
+            elif any(getattr(recommendation, field) != value for field, value in values.items()):
+                for field, value in values.items():
+                    setattr(recommendation, field, value)
+                to_update.append(recommendation)
+
+        if not dry_run and (to_create or to_update):
+            with transaction.atomic():
+                CareerRecommendation.objects.bulk_create(to_create)
+                CareerRecommendation.objects.bulk_update(to_update, list(RESULT_FIELDS), batch_size=UPDATE_BATCH_SIZE)
+            # bulk_create/bulk_update skip signals, so refresh the cached pages here
+            student_ids = {r.student_id for r in to_create} | {r.student_id for r in to_update}
+            for user_id in Student.objects.filter(pk__in=student_ids).values_list('user_id', flat=True):
+                bump_page_version(user_id)
+        return len(to_create), len(to_update)
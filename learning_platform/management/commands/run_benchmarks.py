@@ -0,0 +1,72 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from learning_platform.benchmarks import compare, run_suite
+from learning_platform.synthetic import SCRIPT_FORMATS
+
+
+class Command(BaseCommand):
+    help = (
+        'Run the performance benchmarks (text extraction, grade parsing, the upload pipeline '
+        'with a stub LLM, and the dashboard view) on synthetic data in a throwaway database, '
+        'and write the results as JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=5, help='Synthetic students')
+        parser.add_argument('--scripts', type=int, default=4, help='Scripts uploaded per student')
+        parser.add_argument('--report-cards', type=int, default=1, help='Report cards uploaded per student')
+        parser.add_argument('--pages', type=int, default=5, help='Approximate pages per script')
+        parser.add_argument('--formats', default=','.join(SCRIPT_FORMATS),
+                            help='Comma-separated script formats (default: pdf,docx,txt)')
+        parser.add_argument('--extract-files', type=int, default=10,
+                            help='Files per format for the extraction benchmark')
+        parser.add_argument('--grade-cards', type=int, default=1000,
+                            help='Report card texts for the grade parsing benchmark')
+        parser.add_argument('--dashboard-repeat', type=int, default=10,
+                            help='Cached dashboard requests per student after the first')
+        parser.add_argument('--llm-latency', type=float, default=0.0,
+                            help='Seconds the stub LLM waits before each reply')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the synthetic data')
+        parser.add_argument('--output', help='Write the JSON results to this file instead of stdout')
+        parser.add_argument('--compare', help='Earlier results file to compare p50 latencies against')
+
+    def handle(self, *args, **options):
+        formats = [f.strip() for f in options['formats'].split(',') if f.strip()]
+        unknown = set(formats) - set(SCRIPT_FORMATS)
+        if unknown or not formats:
+            raise CommandError(f'Formats must be some of: {", ".join(SCRIPT_FORMATS)}')
+        previous = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as f:
+                previous = json.load(f)
+
+        results = run_suite(
+            students=options['students'],
+            scripts_per_student=options['scripts'],
+            report_cards_per_student=options['report_cards'],
+            pages=options['pages'],
+            formats=formats,
+            extract_files=options['extract_files'],
+            grade_cards=options['grade_cards'],
+            dashboard_repeat=options['dashboard_repeat'],
+            llm_latency=options['llm_latency'],
+            seed=options['seed'],
+            progress=lambda name: self.stderr.write(f'Running {name}...'),
+        )
+
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output + '\n')
+            self.stderr.write(self.style.SUCCESS(f'Wrote results to {options["output"]}'))
+        else:
+            self.stdout.write(output)
+
+        if previous is not None:
+            revision = previous['meta'].get('git_revision') or options['compare']
+            self.stderr.write(f'\np50 latency compared with {revision}:')
+            for name, before, after, change in compare(previous, results):
+                delta = f'{change:+.1%}' if change is not None else 'n/a'
+                self.stderr.write(f'  {name:<50} {before:>10.3f} -> {after:>10.3f} ms  {delta}')
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+
+from learning_platform.llm_stub import StubProfile, StubServer
+
+
+class Command(BaseCommand):
+    help = (
+        'Serve an OpenAI-compatible stub API (chat completions, streamed or not, and embeddings) '
+        'for load tests without API quota or network. Point the site at it with '
+        'OPENAI_BASE_URL=http://HOST:PORT/v1.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8001)
+        parser.add_argument('--latency', type=float, default=0.5,
+                            help='Median seconds before each reply (default: 0.5)')
+        parser.add_argument('--latency-sigma', type=float, default=0.3,
+                            help='Spread of the log-normal latency; 0 for a fixed latency')
+        parser.add_argument('--chunk-delay', type=float, default=0.02,
+                            help='Seconds between streamed chunks')
+        parser.add_argument('--error-rate', type=float, default=0.0,
+                            help='Share of requests answered with a 429, 500 or 503 (0-1)')
+        parser.add_argument('--seed', type=int, help='Random seed for latencies and failures')
+        parser.add_argument('--verbose', action='store_true', help='Log every request')
+
+    def handle(self, *args, **options):
+        profile = StubProfile(
+            latency=options['latency'],
+            sigma=options['latency_sigma'],
+            error_rate=options['error_rate'],
+            chunk_delay=options['chunk_delay'],
+            seed=options['seed'],
+        )
+        server = StubServer((options['host'], options['port']), profile, verbose=options['verbose'])
+        host, port = server.server_address[:2]
+        self.stdout.write(
+            f"Stub OpenAI API on http://{host}:{port}/v1 (median latency {profile.latency}s, "
+            f"error rate {profile.error_rate:.0%}). Press Ctrl+C to stop."
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        self.stdout.write(self.style.SUCCESS('Stub stopped.'))
@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from learning_platform.jobs import requeue_stale_jobs, run_worker_pool
+
+
+class Command(BaseCommand):
+    help = 'Run a pool of worker threads that process queued script and report card uploads'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=getattr(settings, 'JOB_WORKERS', 4),
+            help='Number of worker threads (default: JOB_WORKERS setting)',
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=getattr(settings, 'JOB_POLL_INTERVAL', 1.0),
+            help='Seconds to sleep when the queue is empty',
+        )
+        parser.add_argument(
+            '--stale-after', type=int, default=getattr(settings, 'JOB_STALE_AFTER', 900),
+            help='Requeue jobs that have been running for longer than this many seconds',
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Drain the queue and exit instead of polling forever',
+        )
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale_jobs(options['stale_after'])
+        if requeued:
+            self.stdout.write(self.style.WARNING(f'Requeued {requeued} stale job(s)'))
+
+        self.stdout.write(f"Starting {options['workers']} worker(s). Press Ctrl+C to stop.")
+        run_worker_pool(
+            workers=options['workers'],
+            poll_interval=options['poll_interval'],
+            exit_when_empty=options['once'],
+        )
+        self.stdout.write(self.style.SUCCESS('Workers stopped.'))
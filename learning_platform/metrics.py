@@ -0,0 +1,603 @@
+"""
+Request, LLM and extraction metrics in the Prometheus text format.
+
+Metrics are aggregated in memory in each process: recording one is a dict
+update under a lock. A background thread writes the process's totals to
+METRICS['PATH']/<pid>.json every FLUSH_INTERVAL seconds (when anything
+changed) and at exit, and `/metrics` adds up the files of all processes
+(web workers, `run_workers`, ...) on the host, so any of them can answer a
+scrape. Totals of processes that have exited are folded into
+archive.json, so counters only go down when the directory is cleared.
+
+What is recorded:
+
+* every request: latency and database queries per view (MetricsMiddleware);
+* every OpenAI call: latency, tokens and failures per model (observe_llm_call);
+* LLM response cache hits, misses and evictions per tier;
+* text extraction time per file type;
+* pipeline stage times per job kind, and errors the pipeline recovers from.
+"""
+import asyncio
+import atexit
+import glob
+import hmac
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+DEFAULT_METRICS = {
+    'ENABLED': True,
+    'PATH': None,
+    'FLUSH_INTERVAL': 5.0,
+    'NAMESPACE': 'school_app',
+    # Besides staff users, /metrics is readable with this bearer token...
+    'TOKEN': '',
+    # ...or from these addresses. Behind a reverse proxy on the same host
+    # every request comes from 127.0.0.1, so never list the proxy's address.
+    'ALLOWED_IPS': [],
+}
+
+ARCHIVE_FILE = 'archive.json'
+LOCK_FILE = '.lock'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+LLM_LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def get_metrics_settings():
+    options = {**DEFAULT_METRICS, **getattr(settings, 'METRICS', {})}
+    if options['PATH'] is None:
+        options['PATH'] = os.path.join(settings.BASE_DIR, 'metrics')
+    return options
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels[label]) for label in self.labels)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if not _enabled():
+            return
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        _mark_dirty()
+
+    @staticmethod
+    def merge(total, value):
+        return (total or 0) + value
+
+    def samples(self, key, value):
+        yield self.name, key, value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        if not _enabled():
+            return
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with _lock:
+            # [count per bucket (not cumulative), +Inf, sum]
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+        _mark_dirty()
+
+    @staticmethod
+    def merge(total, value):
+        if total is None:
+            return list(value)
+        return [a + b for a, b in zip(total, value)]
+
+    def samples(self, key, value):
+        cumulative = 0
+        for bound, count in zip(self.buckets, value):
+            cumulative += count
+            yield f"{self.name}_bucket", key + (('le', _format_value(bound)),), cumulative
+        cumulative += value[len(self.buckets)]
+        yield f"{self.name}_bucket", key + (('le', '+Inf'),), cumulative
+        yield f"{self.name}_sum", key, value[-1]
+        yield f"{self.name}_count", key, cumulative
+
+
+REGISTRY = {}
+
+
+def _register(metric):
+    REGISTRY[metric.name] = metric
+    return metric
+
+
+REQUEST_LATENCY = _register(Histogram(
+    'http_request_duration_seconds', 'Time to produce a response, by view',
+    ('view', 'method', 'status'),
+))
+REQUEST_QUERIES = _register(Histogram(
+    'http_request_db_queries', 'Database queries run while handling a request, by view',
+    ('view',), QUERY_BUCKETS,
+))
+LLM_LATENCY = _register(Histogram(
+    'llm_request_duration_seconds', 'Time of OpenAI API calls (to the last token when streamed)',
+    ('model', 'endpoint', 'outcome'), LLM_LATENCY_BUCKETS,
+))
+LLM_TOKENS = _register(Counter(
+    'llm_tokens_total', 'Tokens used by OpenAI API calls as reported by the API',
+    ('model', 'type'),
+))
+LLM_FAILURES = _register(Counter(
+    'llm_request_failures_total', 'OpenAI API calls that raised, by exception type',
+    ('model', 'endpoint', 'error'),
+))
+LLM_CACHE_LOOKUPS = _register(Counter(
+    'llm_cache_lookups_total', 'LLM response cache lookups, by tier ("all" for the whole cache) and result',
+    ('tier', 'result'),
+))
+LLM_CACHE_EVICTIONS = _register(Counter(
+    'llm_cache_evictions_total', 'Entries dropped from the in-process LLM response cache, by reason',
+    ('tier', 'reason'),
+))
+EXTRACTION_LATENCY = _register(Histogram(
+    'text_extraction_duration_seconds', 'Time to extract text from an uploaded file, by file type',
+    ('file_type',),
+))
+EXTRACTED_CHARACTERS = _register(Counter(
+    'text_extraction_characters_total', 'Characters of text extracted, by file type',
+    ('file_type',),
+))
+JOB_STAGE_LATENCY = _register(Histogram(
+    'job_stage_duration_seconds', 'Time of each processing pipeline stage, by job kind',
+    ('kind', 'stage'), LLM_LATENCY_BUCKETS,
+))
+JOBS = _register(Counter(
+    'jobs_total', 'Processing jobs run, by kind and final status',
+    ('kind', 'status'),
+))
+PIPELINE_ERRORS = _register(Counter(
+    'pipeline_errors_total', 'Errors the processing pipeline recovered from, by step and exception type',
+    ('step', 'error'),
+))
+
+
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_options = None
+# Set by every recording; the flusher thread writes the totals when set
+_dirty = False
+_flusher_started = False
+_flushed_once = False
+
+
+def _settings():
+    global _options
+    if _options is None:
+        _options = get_metrics_settings()
+    return _options
+
+
+def _enabled():
+    return _settings()['ENABLED']
+
+
+def reset_metrics():
+    """Forget recorded values and re-read settings (tests and benchmarks)"""
+    global _options, _dirty, _flushed_once
+    with _lock:
+        for metric in REGISTRY.values():
+            metric.values.clear()
+        _options = None
+        _dirty = _flushed_once = False
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+# Cross-process aggregation
+
+@contextmanager
+def _locked(path):
+    """Exclusive lock on the metrics directory, shared by every process"""
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, LOCK_FILE), 'a+b') as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        else:
+            lock.seek(0)
+            msvcrt.locking(lock.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+            else:
+                lock.seek(0)
+                msvcrt.locking(lock.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _snapshot():
+    with _lock:
+        return {name: [[list(key), list(value) if isinstance(value, list) else value]
+                       for key, value in metric.values.items()]
+                for name, metric in REGISTRY.items() if metric.values}
+
+
+def _read(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write(path, data):
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(temporary, path)
+
+
+def _merge_into(totals, data):
+    for name, entries in data.items():
+        metric = REGISTRY.get(name)
+        if metric is None:
+            continue
+        values = totals.setdefault(name, {})
+        for key, value in entries:
+            key = tuple(key)
+            values[key] = metric.merge(values.get(key), value)
+    return totals
+
+
+def _as_entries(totals):
+    return {name: [[list(key), value] for key, value in values.items()] for name, values in totals.items()}
+
+
+def _archive(directory, paths):
+    """Fold the files of exited processes into archive.json (caller holds the lock)"""
+    archive_path = os.path.join(directory, ARCHIVE_FILE)
+    totals = _merge_into({}, _read(archive_path))
+    for path in paths:
+        _merge_into(totals, _read(path))
+    _write(archive_path, _as_entries(totals))
+    for path in paths:
+        os.remove(path)
+
+
+def _process_file(directory, pid=None):
+    return os.path.join(directory, f"{pid or os.getpid()}.json")
+
+
+def flush():
+    """Write this process's totals for other processes to read"""
+    global _flushed_once
+    options = _settings()
+    if not options['ENABLED']:
+        return
+    with _flush_lock:
+        directory = options['PATH']
+        path = _process_file(directory)
+        if not _flushed_once:
+            # A file with our pid is left over from an earlier process
+            # (_locked creates the directory)
+            with _locked(directory):
+                if os.path.exists(path):
+                    _archive(directory, [path])
+            _flushed_once = True
+        _write(path, _snapshot())
+
+
+def _flush_periodically():
+    global _dirty
+    while True:
+        time.sleep(_settings()['FLUSH_INTERVAL'])
+        if _dirty:
+            _dirty = False
+            try:
+                flush()
+            except OSError as e:
+                print(f"Error writing metrics: {str(e)}")
+
+
+def _mark_dirty():
+    global _dirty, _flusher_started
+    _dirty = True
+    if not _flusher_started:
+        with _flush_lock:
+            if not _flusher_started:
+                threading.Thread(target=_flush_periodically, name='metrics-flush', daemon=True).start()
+                _flusher_started = True
+
+
+def _after_fork():
+    """A forked worker starts from zero rather than repeating its parent's totals"""
+    global _lock, _flush_lock, _dirty, _flusher_started, _flushed_once
+    _lock = threading.Lock()
+    _flush_lock = threading.Lock()
+    for metric in REGISTRY.values():
+        metric.values.clear()
+    _dirty = _flusher_started = _flushed_once = False
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+atexit.register(lambda: _dirty and flush())
+
+
+def _alive(pid):
+    if fcntl is None:
+        # os.kill(pid, 0) would terminate the process on Windows
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def collect():
+    """Totals over every process: {metric name: {label values: value}}"""
+    flush()
+    directory = _settings()['PATH']
+    files = {}
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        stem = os.path.basename(path)[:-len('.json')]
+        if stem.isdigit():
+            files[int(stem)] = path
+    exited = [path for pid, path in files.items() if pid != os.getpid() and not _alive(pid)]
+    if exited:
+        with _locked(directory):
+            _archive(directory, [path for path in exited if os.path.exists(path)])
+
+    totals = _merge_into({}, _read(os.path.join(directory, ARCHIVE_FILE)))
+    for path in files.values():
+        if path not in exited:
+            _merge_into(totals, _read(path))
+    return totals
+
+
+def render(totals=None):
+    """The Prometheus text exposition of `totals` (default: collect())"""
+    totals = collect() if totals is None else totals
+    namespace = _settings()['NAMESPACE']
+    lines = []
+    for name, metric in REGISTRY.items():
+        full_name = f"{namespace}_{name}" if namespace else name
+        lines.append(f"# HELP {full_name} {metric.documentation}")
+        lines.append(f"# TYPE {full_name} {metric.kind}")
+        for key, value in sorted(totals.get(name, {}).items()):
+            labels = tuple(zip(metric.labels, key))
+            for sample, sample_labels, sample_value in metric.samples(labels, value):
+                sample_name = f"{namespace}_{sample}" if namespace else sample
+                label_text = ','.join(f'{label}="{_escape(str(v))}"' for label, v in sample_labels)
+                label_text = f"{{{label_text}}}" if label_text else ''
+                lines.append(f"{sample_name}{label_text} {_format_value(sample_value)}")
+    return '\n'.join(lines) + '\n'
+
+
+# Database queries per request
+
+_query_count = ContextVar('query_count', default=None)
+
+
+def count_queries(execute, sql, params, many, context):
+    """Connection execute wrapper counting queries for the current request"""
+    counter = _query_count.get()
+    if counter is not None:
+        counter[0] += 1
+    return execute(sql, params, many, context)
+
+
+def install_query_counter(sender, connection, **kwargs):
+    """connection_created receiver: count queries on every new connection"""
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+@contextmanager
+def counting_queries():
+    """Count the queries run in this context (and sync_to_async calls from it)"""
+    counter = [0]
+    token = _query_count.set(counter)
+    try:
+        yield counter
+    finally:
+        _query_count.reset(token)
+
+
+class MetricsMiddleware:
+    """
+    Latency and database queries of each request, labelled with the URL
+    name of the view. For streamed responses the latency is the time to the
+    first byte. Works under both WSGI and ASGI without adapting the stack.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not _enabled():
+            return self.get_response(request)
+        started = time.perf_counter()
+        with counting_queries() as queries:
+            response = self.get_response(request)
+        self.record(request, response, time.perf_counter() - started, queries[0])
+        return response
+
+    async def __acall__(self, request):
+        if not _enabled():
+            return await self.get_response(request)
+        started = time.perf_counter()
+        with counting_queries() as queries:
+            response = await self.get_response(request)
+        self.record(request, response, time.perf_counter() - started, queries[0])
+        return response
+
+    @staticmethod
+    def view_name(request):
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            # Unmatched paths are not labelled individually
+            return 'unmatched'
+        return match.view_name or match._func_path
+
+    def record(self, request, response, elapsed, queries):
+        view = self.view_name(request)
+        REQUEST_LATENCY.observe(elapsed, view=view, method=request.method, status=response.status_code)
+        REQUEST_QUERIES.observe(queries, view=view)
+
+
+# OpenAI calls
+
+def record_llm_usage(model, usage):
+    if usage is None:
+        return
+    LLM_TOKENS.inc(getattr(usage, 'prompt_tokens', 0) or 0, model=model, type='prompt')
+    LLM_TOKENS.inc(getattr(usage, 'completion_tokens', 0) or 0, model=model, type='completion')
+
+
+class LLMCall:
+    """Handed out by observe_llm_call; set `usage` from the API response"""
+
+    def __init__(self, model, endpoint):
+        self.model = model
+        self.endpoint = endpoint
+        self.usage = None
+        self.started = time.perf_counter()
+
+    def _finish(self, error=None):
+        elapsed = time.perf_counter() - self.started
+        if error is None:
+            outcome = 'ok'
+        elif isinstance(error, (GeneratorExit, asyncio.CancelledError)):
+            # The caller stopped reading a stream (e.g. the browser went away)
+            outcome = 'cancelled'
+        else:
+            outcome = 'error'
+            LLM_FAILURES.inc(model=self.model, endpoint=self.endpoint, error=type(error).__name__)
+        LLM_LATENCY.observe(elapsed, model=self.model, endpoint=self.endpoint, outcome=outcome)
+        record_llm_usage(self.model, self.usage)
+
+
+@contextmanager
+def observe_llm_call(model, endpoint='chat'):
+    """
+    Time an OpenAI call and count its tokens and failures:
+
+        with observe_llm_call(model) as call:
+            response = client.chat.completions.create(...)
+            call.usage = response.usage
+    """
+    call = LLMCall(model, endpoint)
+    try:
+        yield call
+    except BaseException as e:
+        call._finish(e)
+        raise
+    call._finish()
+
+
+@asynccontextmanager
+async def async_observe_llm_call(model, endpoint='chat'):
+    call = LLMCall(model, endpoint)
+    try:
+        yield call
+    except BaseException as e:
+        call._finish(e)
+        raise
+    call._finish()
+
+
+# Extraction and pipeline
+
+def can_read_metrics(request):
+    """Staff users, the bearer of METRICS['TOKEN'] and METRICS['ALLOWED_IPS']"""
+    options = get_metrics_settings()
+    if request.user.is_staff:
+        return True
+    token = options['TOKEN']
+    authorization = request.headers.get('authorization', '')
+    if token and hmac.compare_digest(authorization.encode(), f"Bearer {token}".encode()):
+        return True
+    return request.META.get('REMOTE_ADDR') in options['ALLOWED_IPS']
+
+
+def file_type(file_path):
+    extension = os.path.splitext(file_path)[1].lower().lstrip('.')
+    return extension if extension in ('pdf', 'docx', 'txt') else 'other'
+
+
+@contextmanager
+def observe_extraction(file_path):
+    """Time a text extraction; yields a list to append the extracted text to"""
+    started = time.perf_counter()
+    result = []
+    try:
+        yield result
+    finally:
+        kind = file_type(file_path)
+        EXTRACTION_LATENCY.observe(time.perf_counter() - started, file_type=kind)
+        if result:
+            EXTRACTED_CHARACTERS.inc(len(result[0]), file_type=kind)
+
+
+def record_job(kind, status, timings):
+    JOBS.inc(kind=kind, status=status)
+    for stage, seconds in (timings or {}).items():
+        # Skips 'total' and the page statistics of 'extract_pages'
+        if stage != 'total' and isinstance(seconds, (int, float)):
+            JOB_STAGE_LATENCY.observe(seconds, kind=kind, stage=stage)
+
+
+def record_error(step, error):
+    """Count an error the pipeline handled (and printed) instead of raising"""
+    PIPELINE_ERRORS.inc(step=step, error=type(error).__name__)
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-18 10:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learning_platform', '0004_processingjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processingjob',
+            name='timings',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 6.0.1 on 2026-10-18 12:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learning_platform', '0006_documentblob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reportcard',
+            name='extracted_text_compressed',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='reportcard',
+            name='text_parser_version',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='uploadedscript',
+            name='extracted_text_compressed',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='uploadedscript',
+            name='text_parser_version',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 6.0.1 on 2026-10-18 13:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learning_platform', '0007_extracted_text'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scripts_count', models.PositiveIntegerField(default=0)),
+                ('plans_count', models.PositiveIntegerField(default=0)),
+                ('reports_count', models.PositiveIntegerField(default=0)),
+                ('topics_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('student', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='learning_platform.student')),
+            ],
+        ),
+    ]
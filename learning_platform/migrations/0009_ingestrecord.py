@@ -0,0 +1,27 @@
+# Generated by Django 6.0.1 on 2026-10-18 15:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learning_platform', '0008_studentstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255)),
+                ('entry_key', models.CharField(max_length=500)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('job', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='learning_platform.processingjob')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('source', 'entry_key'), name='unique_ingest_entry')],
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 6.0.1 on 2026-10-18 20:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learning_platform', '0009_ingestrecord'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KeyphraseFrequencies',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('document_count', models.PositiveIntegerField(default=0)),
+                ('frequencies_compressed', models.BinaryField()),
+                ('built_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
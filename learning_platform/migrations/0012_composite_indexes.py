@@ -0,0 +1,36 @@
+# Generated by Django 6.0.1 on 2026-10-18 20:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learning_platform', '0011_searchdocument'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='reportcard',
+            name='student',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='learning_platform.student'),
+        ),
+        migrations.AlterField(
+            model_name='uploadedscript',
+            name='student',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='learning_platform.student'),
+        ),
+        migrations.AddIndex(
+            model_name='reportcard',
+            index=models.Index(fields=['student', 'uploaded_at', 'id'], name='learning_pl_student_b698f2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studyplan',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['student', 'created_at', 'id'], name='studyplan_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='uploadedscript',
+            index=models.Index(fields=['student', 'uploaded_at', 'id'], name='learning_pl_student_64aa67_idx'),
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 6.0.1 on 2026-10-18 21:35
+
+import zlib
+
+from django.db import migrations
+from django.urls import reverse
+
+CHUNK_SIZE = 200
+
+
+def script_text(script):
+    if script.extracted_text_compressed is None:
+        return ''
+    return zlib.decompress(bytes(script.extracted_text_compressed)).decode('utf-8')
+
+
+def backfill_search_documents(apps, schema_editor):
+    """
+    Index the scripts, memorandums and study plans saved before 0011. The
+    FTS5 triggers (or the PostgreSQL index) pick up the rows as they are
+    inserted. Mirrors the builders in learning_platform.search.
+    """
+    SearchDocument = apps.get_model('learning_platform', 'SearchDocument')
+    UploadedScript = apps.get_model('learning_platform', 'UploadedScript')
+    Memorandum = apps.get_model('learning_platform', 'Memorandum')
+    StudyPlan = apps.get_model('learning_platform', 'StudyPlan')
+
+    def script_document(script):
+        return {
+            'student_id': script.student_id,
+            'title': script.title,
+            'body': "\n".join(filter(None, [
+                script.subject, ", ".join(script.processed_topics or []), script_text(script),
+            ])),
+            'url': reverse('view_memorandum', args=[script.pk]),
+        }
+
+    def memorandum_document(memorandum):
+        script = memorandum.script
+        return {
+            'student_id': script.student_id,
+            'title': f"Memorandum: {script.title}",
+            'body': memorandum.content,
+            'url': reverse('view_memorandum', args=[script.pk]),
+        }
+
+    def study_plan_document(plan):
+        return {
+            'student_id': plan.student_id,
+            'title': plan.title,
+            'body': plan.content,
+            'url': reverse('view_study_plan', args=[plan.pk]),
+        }
+
+    sources = [
+        ('script', UploadedScript.objects.all(), script_document),
+        ('memorandum', Memorandum.objects.select_related('script'), memorandum_document),
+        ('study_plan', StudyPlan.objects.all(), study_plan_document),
+    ]
+    for kind, queryset, build in sources:
+        batch = []
+        for obj in queryset.iterator(chunk_size=CHUNK_SIZE):
+            batch.append(SearchDocument(kind=kind, object_id=obj.pk, **build(obj)))
+            if len(batch) >= CHUNK_SIZE:
+                SearchDocument.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        SearchDocument.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learning_platform', '0012_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_search_documents, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import User
+import json
 import uuid
+import zlib
 
 
 class Student(models.Model):
@@ -13,16 +15,73 @@ class Student(models.Model):
         return f"{self.user.username} - {self.grade_level}"
 
 
-class UploadedScript(models.Model):
-    student = models.ForeignKey(Student, on_delete=models.CASCADE)
+class ExtractedTextMixin(models.Model):
+    """
+    Stores the text extracted from an uploaded file, zlib-compressed, so the
+    file never has to be parsed twice by the same parser version
+    """
+    extracted_text_compressed = models.BinaryField(null=True, blank=True, editable=False)
+    text_parser_version = models.PositiveSmallIntegerField(null=True, blank=True)
+
+    class Meta:
+        abstract = True
+
+    def has_extracted_text(self, parser_version):
+        return self.extracted_text_compressed is not None and self.text_parser_version == parser_version
+
+    def get_extracted_text(self):
+        if self.extracted_text_compressed is None:
+            return None
+        return zlib.decompress(bytes(self.extracted_text_compressed)).decode('utf-8')
+
+    def set_extracted_text(self, text, parser_version):
+        self.extracted_text_compressed = zlib.compress(text.encode('utf-8'), 6)
+        self.text_parser_version = parser_version
+
+
+def blob_upload_to(instance, filename):
+    # Shard by hash prefix so no single directory grows too large
+    return f"blobs/{instance.sha256[:2]}/{filename}"
+
+
+class DocumentBlob(models.Model):
+    """A stored file shared by every upload with the same content"""
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to=blob_upload_to)
+    size = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Analysis shared by all scripts with this content
+    processed_topics = models.JSONField(default=list, blank=True)
+    challenging_topics = models.JSONField(default=list, blank=True)
+    memorandum = models.TextField(blank=True)
+    analyzed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Blob {self.sha256[:12]} ({self.size} bytes)"
+
+    @property
+    def is_analyzed(self):
+        return self.analyzed_at is not None
+
+
+class UploadedScript(ExtractedTextMixin):
+    # Indexed by the composite index below, which starts with student
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, db_index=False)
     title = models.CharField(max_length=200)
     subject = models.CharField(max_length=100, blank=True)
     grade_level = models.CharField(max_length=20, blank=True)
     file = models.FileField(upload_to='scripts/')
+    blob = models.ForeignKey(DocumentBlob, on_delete=models.SET_NULL, null=True, blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     processed_topics = models.JSONField(default=list, blank=True)  # Topics extracted from the script
     challenging_topics = models.JSONField(default=list, blank=True)  # Topics the student finds difficult
 
+    class Meta:
+        indexes = [
+            # A student's scripts, newest first
+            models.Index(fields=['student', 'uploaded_at', 'id']),
+        ]
+
     def __str__(self):
         return f"{self.title} - {self.student.user.username}"
 
@@ -43,18 +102,32 @@ class StudyPlan(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [
+            # A student's active plans, newest first. Partial because Django
+            # filters booleans as a bare column, which SQLite can't match to
+            # a column in the middle of an index
+            models.Index(fields=['student', 'created_at', 'id'], condition=models.Q(is_active=True),
+                         name='studyplan_active_idx'),
+        ]
+
     def __str__(self):
         return f"Study Plan for {self.student.user.username}"
 
 
-class ReportCard(models.Model):
-    student = models.ForeignKey(Student, on_delete=models.CASCADE)
+class ReportCard(ExtractedTextMixin):
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, db_index=False)
     file = models.FileField(upload_to='report_cards/')
     grade = models.CharField(max_length=20, blank=True)
     term = models.CharField(max_length=20, blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     grades_data = models.JSONField(default=dict, blank=True)  # Extracted grades data
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['student', 'uploaded_at', 'id']),
+        ]
+
     def __str__(self):
         return f"Report Card for {self.student.user.username} - Grade {self.grade} Term {self.term}"
 
@@ -69,3 +142,146 @@ class CareerRecommendation(models.Model):
 
     def __str__(self):
         return f"Career Recommendation for {self.student.user.username}"
+
+
+class StudentStats(models.Model):
+    """
+    Denormalized dashboard counters, kept up to date by the signals in
+    signals.py. Rebuild with `python manage.py rebuild_student_stats`.
+    """
+    student = models.OneToOneField(Student, on_delete=models.CASCADE, related_name='stats')
+    scripts_count = models.PositiveIntegerField(default=0)
+    plans_count = models.PositiveIntegerField(default=0)  # Active study plans only
+    reports_count = models.PositiveIntegerField(default=0)
+    topics_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Stats for {self.student.user.username}"
+
+    @classmethod
+    def rebuild(cls, student):
+        """Recompute every counter for one student from scratch"""
+        topics_count = 0
+        for topics in UploadedScript.objects.filter(student=student).values_list('processed_topics', flat=True).iterator():
+            topics_count += len(topics) if isinstance(topics, list) else 0
+
+        stats, _ = cls.objects.update_or_create(student=student, defaults={
+            'scripts_count': UploadedScript.objects.filter(student=student).count(),
+            'plans_count': StudyPlan.objects.filter(student=student, is_active=True).count(),
+            'reports_count': ReportCard.objects.filter(student=student).count(),
+            'topics_count': topics_count,
+        })
+        return stats
+
+
+class ProcessingJob(models.Model):
+    KIND_SCRIPT = 'script'
+    KIND_REPORT_CARD = 'report_card'
+    KIND_CHOICES = [
+        (KIND_SCRIPT, 'Script'),
+        (KIND_REPORT_CARD, 'Report Card'),
+    ]
+
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    job_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    student = models.ForeignKey(Student, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    script = models.ForeignKey(UploadedScript, on_delete=models.CASCADE, null=True, blank=True)
+    report_card = models.ForeignKey(ReportCard, on_delete=models.CASCADE, null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    timings = models.JSONField(default=dict, blank=True)  # Seconds spent in each pipeline stage
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} job {self.job_id} ({self.status})"
+
+
+class IngestRecord(models.Model):
+    """
+    One manifest entry imported by `manage.py bulk_ingest`. Written in the
+    same transaction as the rows it created, so an interrupted import can be
+    resumed without duplicating anything.
+    """
+    source = models.CharField(max_length=255)
+    entry_key = models.CharField(max_length=500)
+    job = models.ForeignKey(ProcessingJob, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'entry_key'], name='unique_ingest_entry'),
+        ]
+
+    def __str__(self):
+        return f"{self.source}: {self.entry_key}"
+
+
+class KeyphraseFrequencies(models.Model):
+    """
+    Corpus-wide document frequencies of candidate key phrases, used for the
+    IDF in keyphrases.py. A single row, rebuilt from every script's extracted
+    text with `python manage.py rebuild_keyphrase_corpus`.
+    """
+    document_count = models.PositiveIntegerField(default=0)
+    frequencies_compressed = models.BinaryField(editable=False)  # zlib-compressed JSON {phrase: df}
+    built_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Key phrase frequencies over {self.document_count} documents"
+
+    def get_frequencies(self):
+        return json.loads(zlib.decompress(bytes(self.frequencies_compressed)))
+
+    def set_frequencies(self, frequencies):
+        self.frequencies_compressed = zlib.compress(json.dumps(frequencies, separators=(',', ':')).encode('utf-8'), 6)
+
+
+class SearchDocument(models.Model):
+    """
+    Searchable copy of a script, memorandum or study plan, indexed by the
+    database's full-text engine (see search.py). Kept in sync by signals.
+    """
+    KIND_SCRIPT = 'script'
+    KIND_MEMORANDUM = 'memorandum'
+    KIND_STUDY_PLAN = 'study_plan'
+    KIND_CHOICES = [
+        (KIND_SCRIPT, 'Script'),
+        (KIND_MEMORANDUM, 'Memorandum'),
+        (KIND_STUDY_PLAN, 'Study Plan'),
+    ]
+
+    student = models.ForeignKey(Student, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    title = models.CharField(max_length=255)
+    body = models.TextField(blank=True)
+    url = models.CharField(max_length=255)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='unique_search_document'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()}: {self.title}"
@@ -0,0 +1,106 @@
+"""
+Process-wide OpenAI clients.
+
+Creating an OpenAI object sets up a new HTTP connection pool, so every call
+paid for a fresh TCP/TLS handshake. The clients here are created once per
+process (the async client once per event loop) and keep connections alive
+between calls. Timeouts and pool sizes come from settings:
+
+    OPENAI_TIMEOUT, OPENAI_CONNECT_TIMEOUT, OPENAI_MAX_CONNECTIONS,
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS, OPENAI_MAX_RETRIES
+
+OPENAI_BASE_URL points the clients at another OpenAI-compatible API, such
+as the load-test stub (`python manage.py run_llm_stub`).
+"""
+import asyncio
+import threading
+import weakref
+
+import httpx
+from django.conf import settings
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
+
+_lock = threading.Lock()
+_sync_clients = {}
+# AsyncOpenAI's connection pool is bound to the loop that created it
+_async_clients = weakref.WeakKeyDictionary()
+
+
+# Local OpenAI-compatible servers don't check the key, but the client needs one
+PLACEHOLDER_API_KEY = 'not-needed'
+
+
+def _base_url():
+    return getattr(settings, 'OPENAI_BASE_URL', '') or None
+
+
+def _api_key():
+    api_key = getattr(settings, 'OPENAI_API_KEY', '')
+    if not api_key or api_key == 'your-openai-api-key-here':
+        return PLACEHOLDER_API_KEY if _base_url() else None
+    return api_key
+
+
+def _client_options():
+    """Settings that identify a client; a change builds a new one"""
+    return (
+        _api_key(),
+        float(getattr(settings, 'OPENAI_TIMEOUT', 60.0)),
+        float(getattr(settings, 'OPENAI_CONNECT_TIMEOUT', 5.0)),
+        int(getattr(settings, 'OPENAI_MAX_CONNECTIONS', 20)),
+        int(getattr(settings, 'OPENAI_MAX_KEEPALIVE_CONNECTIONS', 10)),
+        int(getattr(settings, 'OPENAI_MAX_RETRIES', 2)),
+        _base_url(),
+    )
+
+
+def _http_settings(options):
+    _, timeout, connect_timeout, max_connections, max_keepalive, _, _ = options
+    return {
+        'timeout': httpx.Timeout(timeout, connect=connect_timeout),
+        'limits': httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive),
+    }
+
+
+def get_openai_client():
+    """Get the shared OpenAI client, or None if no API key is configured"""
+    options = _client_options()
+    if options[0] is None:
+        return None
+    client = _sync_clients.get(options)
+    if client is None:
+        with _lock:
+            client = _sync_clients.get(options)
+            if client is None:
+                client = OpenAI(
+                    api_key=options[0],
+                    base_url=options[6],
+                    max_retries=options[5],
+                    http_client=DefaultHttpxClient(**_http_settings(options)),
+                )
+                _sync_clients.clear()
+                _sync_clients[options] = client
+    return client
+
+
+def get_async_openai_client():
+    """
+    Get the shared AsyncOpenAI client for the running event loop, or None if
+    no API key is configured. Must be called from async code.
+    """
+    options = _client_options()
+    if options[0] is None:
+        return None
+    loop = asyncio.get_running_loop()
+    with _lock:
+        cached = _async_clients.get(loop)
+        if cached is None or cached[0] != options:
+            client = AsyncOpenAI(
+                api_key=options[0],
+                base_url=options[6],
+                max_retries=options[5],
+                http_client=DefaultAsyncHttpxClient(**_http_settings(options)),
+            )
+            cached = (options, client)
+            _async_clients[loop] = cached
+    return cached[1]
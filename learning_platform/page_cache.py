@@ -0,0 +1,99 @@
+"""
+Per-student versioned cache for rendered pages.
+
+Every student has a version token that is bumped (by the signals in
+signals.py) whenever one of their scripts, study plans, report cards,
+memorandums or career recommendations changes. Rendered pages are cached
+under that version, so a bump invalidates all of them at once, and the
+version doubles as the page's ETag/Last-Modified so browsers can
+revalidate with a 304.
+
+Versions must be visible to the web and worker processes alike, so the
+'pages' cache alias should be a shared backend (database, Redis, ...).
+"""
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from .models import Student
+
+
+def _cache():
+    return caches[getattr(settings, 'PAGE_CACHE_ALIAS', 'pages')]
+
+
+def _version_key(user_id):
+    return f"pagever:{user_id}"
+
+
+def get_page_version(user_id):
+    """Return (version, last_modified timestamp) for a user's pages"""
+    cache = _cache()
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        version = (time.time_ns(), time.time())
+        # add() so a concurrent bump is not overwritten
+        if not cache.add(_version_key(user_id), version, timeout=None):
+            version = cache.get(_version_key(user_id), version)
+    return version
+
+
+def bump_page_version(user_id):
+    _cache().set(_version_key(user_id), (time.time_ns(), time.time()), timeout=None)
+
+
+def bump_student_page_version(student_id):
+    user_id = Student.objects.filter(pk=student_id).values_list('user_id', flat=True).first()
+    if user_id is not None:
+        bump_page_version(user_id)
+
+
+def student_page_cache(view):
+    """
+    Cache a login-required view's rendered response per user and page
+    version, and answer conditional requests with 304 Not Modified
+    """
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return view(request, *args, **kwargs)
+
+        user_id = request.user.pk
+        version, last_modified = get_page_version(user_id)
+        etag = f'"{view.__name__}-{user_id}-{version}"'
+
+        not_modified = get_conditional_response(request, etag=etag, last_modified=int(last_modified))
+        if not_modified is not None:
+            return _add_validators(not_modified, etag, last_modified)
+
+        cache = _cache()
+        key = f"page:{user_id}:{version}:{request.get_full_path()}"
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            response = HttpResponse(content, content_type=content_type)
+        else:
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming:
+                if hasattr(response, 'render') and callable(response.render):
+                    response.render()
+                cache.set(key, (response.content, response['Content-Type']),
+                          timeout=getattr(settings, 'PAGE_CACHE_TIMEOUT', 3600))
+            else:
+                return response
+        return _add_validators(response, etag, last_modified)
+
+    return wrapped
+
+
+def _add_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    # Personal pages: browsers may keep them but must revalidate every time
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
@@ -0,0 +1,82 @@
+"""
+Keyset pagination for a student's scripts, study plans and report cards.
+
+Lists are shown newest first, ordered by (timestamp, id). The cursor is
+the key of the last row shown. The next page is the rows with a smaller
+key, so the database seeks to the cursor in the composite indexes on
+(student, timestamp, id) and reads one page, whatever the position. An
+OFFSET would read and throw away every earlier row. Rows added meanwhile
+don't shift a page already shown either.
+"""
+import base64
+import binascii
+from datetime import datetime
+
+from django.db.models import Q
+
+PAGE_SIZE = 10
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(timestamp, pk):
+    raw = f"{timestamp.isoformat()}|{pk}".encode('ascii')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(timestamp, pk) from a cursor made by encode_cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('ascii')
+        timestamp, _, pk = raw.partition('|')
+        return datetime.fromisoformat(timestamp), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor[:50]!r}") from e
+
+
+class KeysetPage:
+    """One page of rows and the cursor for the next (None on the last page)"""
+
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+
+def keyset_page(queryset, field, after=None, page_size=PAGE_SIZE):
+    """
+    The page of `queryset` after cursor `after` (the first page when None),
+    newest first by (`field`, id). Raises InvalidCursor for a malformed
+    cursor.
+    """
+    queryset = queryset.order_by(f'-{field}', '-pk')
+    if after:
+        timestamp, pk = decode_cursor(after)
+        # (field, id) < (timestamp, pk); the redundant `field <= timestamp`
+        # is what lets the database start the index scan at the cursor
+        queryset = queryset.filter(
+            Q(**{f'{field}__lte': timestamp}),
+            Q(**{f'{field}__lt': timestamp}) | Q(pk__lt=pk),
+        )
+    # One row more than a page tells whether there is a next page
+    items = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, field), last.pk)
+    return KeysetPage(items, next_cursor)
@@ -0,0 +1,363 @@
+"""
+Opt-in request profiling (see the PROFILING setting).
+
+A request is profiled when either trigger fires:
+
+* sampling: a random SAMPLE_RATE share of requests runs under cProfile,
+  with every SQL query and its duration recorded;
+* slowness: a watchdog thread samples the stack of any other request
+  still running after SLOW_THRESHOLD seconds, every SAMPLE_INTERVAL
+  seconds until it finishes, and records its SQL from then on.
+
+Profiles go to PROFILING['PATH'] as <name>.json (request details, SQL, a
+text report and folded stacks for flame graphs) plus <name>.prof for
+cProfile runs (open with `python -m pstats` or snakeviz). Only the newest
+MAX_PROFILES are kept. Staff users can list and download them at
+/profiles/.
+
+An unsampled request costs a random() call and registering it with the
+watchdog, which sleeps until the oldest request could become slow.
+Requests are profiled in the thread serving them, i.e. under WSGI
+(runserver, gunicorn); under ASGI the middleware passes requests through.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+DEFAULT_PROFILING = {
+    'ENABLED': False,
+    'PATH': None,
+    # Share of requests profiled with cProfile
+    'SAMPLE_RATE': 0.0,
+    # Stack-sample requests running longer than this (seconds); None disables
+    'SLOW_THRESHOLD': 2.0,
+    'SAMPLE_INTERVAL': 0.005,
+    'MAX_PROFILES': 200,
+    'MAX_QUERIES': 1000,
+    'REPORT_LINES': 40,
+    'EXCLUDE_PATHS': ['/profiles/', '/metrics', '/static/'],
+}
+
+NAME_RE = re.compile(r'[0-9A-Za-z_-]+')
+
+
+def get_profiling_settings():
+    options = {**DEFAULT_PROFILING, **getattr(settings, 'PROFILING', {})}
+    if options['PATH'] is None:
+        options['PATH'] = os.path.join(settings.BASE_DIR, 'profiles')
+    return options
+
+
+class RequestRecord:
+    """What is captured about one request while it runs"""
+
+    def __init__(self, request, thread_id, deadline, profiler=None):
+        self.request = request
+        self.thread_id = thread_id
+        self.deadline = deadline
+        self.profiler = profiler
+        self.started = time.perf_counter()
+        self.started_at = datetime.now(timezone.utc)
+        # Set once the request is profiled or found slow
+        self.sql = [] if profiler else None
+        self.sql_dropped = 0
+        self.stacks = None
+        self.slow_after = None
+
+    @property
+    def captured(self):
+        return self.profiler is not None or self.stacks is not None
+
+
+_current = ContextVar('profiled_request', default=None)
+
+
+def capture_sql(execute, sql, params, many, context):
+    """Connection execute wrapper recording the SQL of captured requests"""
+    record = _current.get()
+    if record is None or record.sql is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        if len(record.sql) < _settings()['MAX_QUERIES']:
+            record.sql.append({
+                'sql': sql,
+                'params': repr(params)[:500],
+                'many': many,
+                'ms': round((time.perf_counter() - started) * 1000, 3),
+            })
+        else:
+            record.sql_dropped += 1
+
+
+def install_sql_capture(sender, connection, **kwargs):
+    """connection_created receiver: let captured requests record their SQL"""
+    if capture_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(capture_sql)
+
+
+_options = None
+
+
+def _settings():
+    global _options
+    if _options is None:
+        _options = get_profiling_settings()
+    return _options
+
+
+def reset_profiling():
+    """Re-read settings (tests)"""
+    global _options
+    _options = None
+
+
+# Slow request watchdog
+
+def _frame_name(frame):
+    code = frame.f_code
+    module = frame.f_globals.get('__name__', '?')
+    return f"{module}.{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def _folded_stack(frame, stop_code):
+    """'outer;...;inner' from the middleware down to the running frame"""
+    names = []
+    while frame is not None and frame.f_code is not stop_code:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class Watchdog:
+    """One thread per process that samples the stacks of slow requests"""
+
+    def __init__(self):
+        self.records = {}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def add(self, record):
+        with self.lock:
+            self.records[id(record)] = record
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='profiling-watchdog', daemon=True)
+                self.thread.start()
+
+    def remove(self, record):
+        with self.lock:
+            self.records.pop(id(record), None)
+
+    def run(self):
+        stop_code = ProfilingMiddleware.__call__.__code__
+        while True:
+            options = _settings()
+            now = time.perf_counter()
+            with self.lock:
+                records = list(self.records.values())
+            slow = [r for r in records if r.deadline is not None and r.deadline <= now]
+            if slow:
+                frames = sys._current_frames()
+                for record in slow:
+                    if record.stacks is None:
+                        record.slow_after = now - record.started
+                        record.stacks = Counter()
+                        if record.sql is None:
+                            record.sql = []
+                    frame = frames.get(record.thread_id)
+                    if frame is not None:
+                        record.stacks[_folded_stack(frame, stop_code)] += 1
+                del frames
+                timeout = options['SAMPLE_INTERVAL']
+            else:
+                # Requests registered from now on can't be slow before now + threshold
+                pending = [r.deadline - now for r in records if r.deadline is not None]
+                timeout = min(pending + [options['SLOW_THRESHOLD'] or 1.0])
+            time.sleep(max(timeout, options['SAMPLE_INTERVAL']))
+
+
+_watchdog = Watchdog()
+# Only one cProfile run at a time: profilers in several threads interfere
+_profiler_lock = threading.Lock()
+
+
+# Storage
+
+def profile_name(record):
+    stamp = record.started_at.strftime('%Y%m%dT%H%M%S%f')
+    return f"{stamp}-{os.getpid()}-{id(record) % 100000:05d}"
+
+
+def _stack_report(stacks, lines):
+    """Functions by share of samples: inclusive (on the stack) and self (running)"""
+    total = sum(stacks.values())
+    inclusive, own = Counter(), Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(';')
+        for name in set(frames):
+            inclusive[name] += count
+        own[frames[-1]] += count
+    out = [f"{total} samples", f"{'inclusive':>9} {'self':>6}  function"]
+    for name, count in inclusive.most_common(lines):
+        out.append(f"{count / total:>9.1%} {own[name] / total:>6.1%}  {name}")
+    return '\n'.join(out)
+
+
+def _rotate(directory, keep):
+    names = sorted(f[:-len('.json')] for f in os.listdir(directory) if f.endswith('.json'))
+    for name in names[:max(0, len(names) - keep)]:
+        for extension in ('.json', '.prof'):
+            try:
+                os.remove(os.path.join(directory, name + extension))
+            except FileNotFoundError:
+                pass
+
+
+def save_profile(record, response, duration):
+    """Write a captured request to the profile store; returns its name"""
+    options = _settings()
+    directory = options['PATH']
+    os.makedirs(directory, exist_ok=True)
+    name = profile_name(record)
+    request = record.request
+    match = getattr(request, 'resolver_match', None)
+    user = getattr(request, 'user', None)
+
+    report = ''
+    if record.profiler is not None:
+        record.profiler.dump_stats(os.path.join(directory, f"{name}.prof"))
+        stream = io.StringIO()
+        pstats.Stats(record.profiler, stream=stream).sort_stats('cumulative').print_stats(options['REPORT_LINES'])
+        report = stream.getvalue()
+    elif record.stacks:
+        report = _stack_report(record.stacks, options['REPORT_LINES'])
+
+    sql = record.sql or []
+    data = {
+        'name': name,
+        'trigger': 'sampled' if record.profiler is not None else 'slow',
+        'started_at': record.started_at.isoformat(),
+        'method': request.method,
+        'path': request.get_full_path()[:500],
+        'view': match.view_name if match else None,
+        'status': response.status_code if response is not None else None,
+        'user_id': user.pk if user is not None and user.is_authenticated else None,
+        'duration_ms': round(duration * 1000, 3),
+        'slow_after_ms': round(record.slow_after * 1000, 3) if record.slow_after is not None else None,
+        'query_count': len(sql) + record.sql_dropped,
+        'query_ms': round(sum(q['ms'] for q in sql), 3),
+        'queries': sql,
+        'report': report,
+        'stacks': dict(record.stacks or {}),
+    }
+    with open(os.path.join(directory, f"{name}.json"), 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    _rotate(directory, options['MAX_PROFILES'])
+    return name
+
+
+def list_profiles(limit=None):
+    """Summaries of stored profiles, newest first"""
+    directory = _settings()['PATH']
+    if not os.path.isdir(directory):
+        return []
+    names = sorted((f[:-len('.json')] for f in os.listdir(directory) if f.endswith('.json')), reverse=True)
+    profiles = []
+    for name in names[:limit]:
+        try:
+            with open(os.path.join(directory, f"{name}.json"), encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        data.pop('queries', None)
+        data.pop('stacks', None)
+        data.pop('report', None)
+        data['has_prof'] = os.path.exists(os.path.join(directory, f"{name}.prof"))
+        profiles.append(data)
+    return profiles
+
+
+def profile_path(name, extension):
+    """Path of a stored profile file, or None if the name is not one of ours"""
+    if not NAME_RE.fullmatch(name) or extension not in ('json', 'prof'):
+        return None
+    path = os.path.join(_settings()['PATH'], f"{name}.{extension}")
+    return path if os.path.exists(path) else None
+
+
+def folded_stacks(name):
+    """The stack samples of a profile in the folded format flame graph tools read"""
+    path = profile_path(name, 'json')
+    if path is None:
+        return None
+    with open(path, encoding='utf-8') as f:
+        stacks = json.load(f).get('stacks') or {}
+    return ''.join(f"{stack} {count}\n" for stack, count in stacks.items())
+
+
+class ProfilingMiddleware:
+    """
+    Profiles sampled and slow requests (see the module docstring). Put it
+    near the top of MIDDLEWARE so profiles include the other middleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.get_response(request)
+        options = _settings()
+        if not options['ENABLED'] or request.path.startswith(tuple(options['EXCLUDE_PATHS'])):
+            return self.get_response(request)
+
+        profiler = None
+        if options['SAMPLE_RATE'] and random.random() < options['SAMPLE_RATE'] and _profiler_lock.acquire(False):
+            profiler = cProfile.Profile()
+        threshold = options['SLOW_THRESHOLD']
+        record = RequestRecord(
+            request, threading.get_ident(),
+            deadline=time.perf_counter() + threshold if threshold is not None and profiler is None else None,
+            profiler=profiler,
+        )
+        token = _current.set(record)
+        if record.deadline is not None:
+            _watchdog.add(record)
+        response = None
+        try:
+            if profiler is not None:
+                profiler.enable()
+            response = self.get_response(request)
+            return response
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                _profiler_lock.release()
+            if record.deadline is not None:
+                _watchdog.remove(record)
+            _current.reset(token)
+            if record.captured:
+                try:
+                    save_profile(record, response, time.perf_counter() - record.started)
+                except OSError as e:
+                    print(f"Error saving request profile: {str(e)}")
@@ -0,0 +1,324 @@
+"""
+Rate limiting and admission control for OpenAI calls.
+
+Two mechanisms keep one busy class from exhausting the API quota for
+everyone:
+
+* per-student token buckets, one counting requests and one counting
+  estimated LLM tokens, checked by the chat and upload views;
+* a global concurrency limit in front of the OpenAI client. Interactive
+  requests wait at most ADMISSION_TIMEOUT for a slot and are otherwise
+  rejected with 429 + Retry-After instead of piling up blocked workers.
+
+With BACKEND 'local' state lives in the process; with 'cache' it lives in
+the Django cache so limits hold across worker processes (use a cache with
+atomic incr, such as Redis or Memcached, in that case).
+"""
+import asyncio
+import math
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.http import JsonResponse
+
+DEFAULT_RATE_LIMITS = {
+    'ENABLED': True,
+    'BACKEND': 'local',
+    'CACHE_ALIAS': 'ratelimit',
+    'STUDENT_REQUESTS_PER_MINUTE': 20,
+    'STUDENT_REQUEST_BURST': 10,
+    'STUDENT_TOKENS_PER_MINUTE': 20000,
+    'STUDENT_TOKEN_BURST': 40000,
+    'LLM_MAX_CONCURRENCY': 8,
+    'ADMISSION_TIMEOUT': 2.0,
+    'BACKGROUND_ADMISSION_TIMEOUT': 120.0,
+}
+
+SLOT_POLL_INTERVAL = 0.05
+# CacheBucketStore waits up to LOCK_ATTEMPTS * LOCK_WAIT seconds for a bucket
+LOCK_ATTEMPTS = 20
+LOCK_WAIT = 0.01
+
+
+class RateLimited(Exception):
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class LLMOverloaded(RateLimited):
+    pass
+
+
+def get_rate_limits():
+    return {**DEFAULT_RATE_LIMITS, **getattr(settings, 'RATE_LIMITS', {})}
+
+
+def estimate_tokens(*texts, completion_tokens=0):
+    """Rough token count (~4 characters per token) plus the completion budget"""
+    return sum(len(text) for text in texts if text) // 4 + completion_tokens
+
+
+class LocalBucketStore:
+    """Token buckets kept in this process"""
+
+    def __init__(self, options):
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def consume(self, key, amount, capacity, rate):
+        """
+        Take `amount` tokens from the bucket. Returns 0 on success, otherwise
+        the seconds until enough tokens will have refilled.
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens >= amount:
+                self._buckets[key] = (tokens - amount, now)
+                return 0
+            self._buckets[key] = (tokens, now)
+            return (amount - tokens) / rate
+
+
+class CacheBucketStore:
+    """Token buckets kept in the Django cache, shared by all workers"""
+
+    def __init__(self, options):
+        self.alias = options['CACHE_ALIAS']
+
+    def consume(self, key, amount, capacity, rate):
+        cache = caches[self.alias]
+        bucket_key = f"ratelimit:{key}"
+        lock_key = f"ratelimit:lock:{key}"
+        # Short mutex so concurrent workers don't both spend the same tokens;
+        # the token tells our lock apart from one taken after ours expired
+        token = uuid.uuid4().hex
+        acquired = False
+        for _ in range(LOCK_ATTEMPTS):
+            if cache.add(lock_key, token, timeout=2):
+                acquired = True
+                break
+            time.sleep(LOCK_WAIT)
+        now = time.time()
+        tokens, updated = cache.get(bucket_key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * rate)
+        retry_after = 0 if tokens >= amount else (amount - tokens) / rate
+        if not acquired:
+            # Another worker holds the bucket: answer from what it holds
+            # without writing, so contention alone never rejects a request
+            return retry_after
+        try:
+            if not retry_after:
+                tokens -= amount
+            # Keep the bucket around only as long as it takes to refill
+            cache.set(bucket_key, (tokens, now), timeout=math.ceil(capacity / rate) + 1)
+            return retry_after
+        finally:
+            if cache.get(lock_key) == token:
+                cache.delete(lock_key)
+
+
+class LocalConcurrencyLimiter:
+    """At most `limit` in-flight OpenAI calls in this process"""
+
+    def __init__(self, options):
+        self.limit = options['LLM_MAX_CONCURRENCY']
+        self._lock = threading.Lock()
+        self._active = 0
+
+    @property
+    def active(self):
+        return self._active
+
+    def try_acquire(self):
+        with self._lock:
+            if self._active >= self.limit:
+                return False
+            self._active += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self._active = max(0, self._active - 1)
+
+
+class CacheConcurrencyLimiter:
+    """At most `limit` in-flight OpenAI calls across every worker process"""
+    key = 'ratelimit:llm-active'
+    # Counts leaked by a crashed process expire instead of blocking forever
+    ttl = 600
+
+    def __init__(self, options):
+        self.limit = options['LLM_MAX_CONCURRENCY']
+        self.alias = options['CACHE_ALIAS']
+
+    @property
+    def active(self):
+        return caches[self.alias].get(self.key, 0)
+
+    def try_acquire(self):
+        cache = caches[self.alias]
+        cache.add(self.key, 0, timeout=self.ttl)
+        try:
+            active = cache.incr(self.key)
+        except ValueError:
+            # Expired between add() and incr()
+            cache.add(self.key, 1, timeout=self.ttl)
+            active = 1
+        if active > self.limit:
+            cache.decr(self.key)
+            return False
+        return True
+
+    def release(self):
+        try:
+            caches[self.alias].decr(self.key)
+        except ValueError:
+            pass
+
+
+def check_shared_cache(alias):
+    """BACKEND 'cache' only limits across processes if they share the cache"""
+    if isinstance(caches[alias], (LocMemCache, DummyCache)):
+        raise ImproperlyConfigured(
+            f"RATE_LIMITS BACKEND 'cache' needs a cache shared by all worker processes; "
+            f"CACHE_ALIAS '{alias}' is {type(caches[alias]).__name__}"
+        )
+
+
+_state_lock = threading.Lock()
+_bucket_store = None
+_limiter = None
+
+
+def _get_state():
+    global _bucket_store, _limiter
+    if _limiter is None:
+        with _state_lock:
+            if _limiter is None:
+                options = get_rate_limits()
+                if options['BACKEND'] == 'cache':
+                    check_shared_cache(options['CACHE_ALIAS'])
+                    _bucket_store = CacheBucketStore(options)
+                    _limiter = CacheConcurrencyLimiter(options)
+                else:
+                    _bucket_store = LocalBucketStore(options)
+                    _limiter = LocalConcurrencyLimiter(options)
+    return _bucket_store, _limiter
+
+
+def reset_rate_limits():
+    """Drop in-process state so it is rebuilt from settings on next use"""
+    global _bucket_store, _limiter
+    with _state_lock:
+        _bucket_store = None
+        _limiter = None
+
+
+def check_student_rate(student_key, estimated_tokens=0):
+    """
+    Charge one request and `estimated_tokens` to a student's buckets.
+    Raises RateLimited if either bucket is empty.
+    """
+    options = get_rate_limits()
+    if not options['ENABLED']:
+        return
+    store, _ = _get_state()
+
+    retry_after = store.consume(
+        f"requests:{student_key}", 1,
+        options['STUDENT_REQUEST_BURST'], options['STUDENT_REQUESTS_PER_MINUTE'] / 60,
+    )
+    if retry_after:
+        raise RateLimited('Too many requests. Please slow down.', retry_after)
+
+    if estimated_tokens:
+        capacity = options['STUDENT_TOKEN_BURST']
+        retry_after = store.consume(
+            f"tokens:{student_key}", min(estimated_tokens, capacity),
+            capacity, options['STUDENT_TOKENS_PER_MINUTE'] / 60,
+        )
+        if retry_after:
+            raise RateLimited('You have used your AI allowance for now.', retry_after)
+
+
+def llm_has_capacity():
+    """Cheap check used to reject requests before starting a stream"""
+    options = get_rate_limits()
+    if not options['ENABLED']:
+        return True
+    _, limiter = _get_state()
+    return limiter.active < limiter.limit
+
+
+@contextmanager
+def llm_slot(timeout=None):
+    """
+    Hold one of the global OpenAI concurrency slots. Waits up to `timeout`
+    seconds (BACKGROUND_ADMISSION_TIMEOUT by default) before raising
+    LLMOverloaded.
+    """
+    options = get_rate_limits()
+    if not options['ENABLED']:
+        yield
+        return
+    if timeout is None:
+        timeout = options['BACKGROUND_ADMISSION_TIMEOUT']
+    _, limiter = _get_state()
+
+    deadline = time.monotonic() + timeout
+    while not limiter.try_acquire():
+        if time.monotonic() >= deadline:
+            raise LLMOverloaded('The AI service is busy. Please try again shortly.', SLOT_POLL_INTERVAL * 20)
+        time.sleep(SLOT_POLL_INTERVAL)
+    try:
+        yield
+    finally:
+        limiter.release()
+
+
+@asynccontextmanager
+async def async_llm_slot(timeout=None):
+    """Async version of llm_slot that waits without blocking the event loop"""
+    options = get_rate_limits()
+    if not options['ENABLED']:
+        yield
+        return
+    if timeout is None:
+        timeout = options['ADMISSION_TIMEOUT']
+    _, limiter = _get_state()
+    try_acquire = sync_to_async(limiter.try_acquire) if options['BACKEND'] == 'cache' else limiter.try_acquire
+    release = sync_to_async(limiter.release) if options['BACKEND'] == 'cache' else limiter.release
+
+    deadline = time.monotonic() + timeout
+    while not await _maybe_await(try_acquire()):
+        if time.monotonic() >= deadline:
+            raise LLMOverloaded('The AI service is busy. Please try again shortly.', SLOT_POLL_INTERVAL * 20)
+        await asyncio.sleep(SLOT_POLL_INTERVAL)
+    try:
+        yield
+    finally:
+        await _maybe_await(release())
+
+
+async def _maybe_await(value):
+    if asyncio.iscoroutine(value):
+        return await value
+    return value
+
+
+def rate_limited_response(exc):
+    """429 JSON response with a Retry-After header"""
+    response = JsonResponse({"error": str(exc), "retry_after": exc.retry_after}, status=429)
+    response['Retry-After'] = str(exc.retry_after)
+    return response
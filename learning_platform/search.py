@@ -0,0 +1,247 @@
+"""
+Full-text search over each student's scripts, memorandums and study plans.
+
+Searchable text is copied into SearchDocument rows by the signals in
+signals.py whenever a script, memorandum or study plan is saved. The
+database indexes those rows:
+
+* SQLite: an external-content FTS5 table kept in sync by triggers, ranked
+  with bm25 (titles weigh more than bodies);
+* PostgreSQL: a GIN index on the documents' tsvector, ranked with
+  ts_rank_cd.
+
+The tables, triggers and indexes are created by migration 0011, and 0013
+indexes the content saved before it. Other databases fall back to an
+unranked substring scan. Rebuild everything with
+`python manage.py rebuild_search_index`.
+
+Scripts are searchable from upload; until their memorandum is saved, a hit
+links to the status of the script's processing job.
+"""
+import re
+
+from django.db import connection
+from django.urls import reverse
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .extraction import get_stored_text
+from .models import Memorandum, ProcessingJob, SearchDocument, StudyPlan, UploadedScript
+
+FTS_TABLE = 'learning_platform_searchdocument_fts'
+PAGE_SIZE = 20
+SNIPPET_WORDS = 16
+# Placeholders for the highlight markers, swapped for <mark> after escaping
+MARK_START = '\x02'
+MARK_END = '\x03'
+
+_QUERY_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+def script_document(script):
+    text = get_stored_text(script) or ''
+    body = "\n".join(filter(None, [
+        script.subject,
+        ", ".join(script.processed_topics or []),
+        text,
+    ]))
+    return {
+        'student_id': script.student_id,
+        'title': script.title,
+        'body': body,
+        'url': reverse('view_memorandum', args=[script.pk]),
+    }
+
+
+def memorandum_document(memorandum):
+    script = memorandum.script
+    return {
+        'student_id': script.student_id,
+        'title': f"Memorandum: {script.title}",
+        'body': memorandum.content,
+        'url': reverse('view_memorandum', args=[script.pk]),
+    }
+
+
+def study_plan_document(plan):
+    return {
+        'student_id': plan.student_id,
+        'title': plan.title,
+        'body': plan.content,
+        'url': reverse('view_study_plan', args=[plan.pk]),
+    }
+
+
+DOCUMENT_BUILDERS = {
+    SearchDocument.KIND_SCRIPT: script_document,
+    SearchDocument.KIND_MEMORANDUM: memorandum_document,
+    SearchDocument.KIND_STUDY_PLAN: study_plan_document,
+}
+
+
+def index_object(kind, obj):
+    """Create or refresh the search document for a script, memorandum or plan"""
+    SearchDocument.objects.update_or_create(
+        kind=kind, object_id=obj.pk, defaults=DOCUMENT_BUILDERS[kind](obj),
+    )
+
+
+def unindex_object(kind, object_id):
+    SearchDocument.objects.filter(kind=kind, object_id=object_id).delete()
+
+
+def rebuild_index(chunk_size=200):
+    """Re-create every search document from scratch. Returns the number indexed."""
+    SearchDocument.objects.all().delete()
+    sources = [
+        (SearchDocument.KIND_SCRIPT, UploadedScript.objects.all()),
+        (SearchDocument.KIND_MEMORANDUM, Memorandum.objects.select_related('script')),
+        (SearchDocument.KIND_STUDY_PLAN, StudyPlan.objects.all()),
+    ]
+    indexed = 0
+    for kind, queryset in sources:
+        batch = []
+        for obj in queryset.iterator(chunk_size=chunk_size):
+            batch.append(SearchDocument(kind=kind, object_id=obj.pk, **DOCUMENT_BUILDERS[kind](obj)))
+            if len(batch) >= chunk_size:
+                SearchDocument.objects.bulk_create(batch)
+                indexed += len(batch)
+                batch = []
+        SearchDocument.objects.bulk_create(batch)
+        indexed += len(batch)
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    return indexed
+
+
+class SearchResult:
+    def __init__(self, kind, title, url, snippet, rank):
+        self.kind = kind
+        self.title = title
+        self.url = url
+        self.snippet = snippet
+        self.rank = rank
+
+    def get_kind_display(self):
+        return dict(SearchDocument.KIND_CHOICES).get(self.kind, self.kind)
+
+    def as_dict(self):
+        return {
+            'kind': self.kind,
+            'title': self.title,
+            'url': self.url,
+            'snippet': self.snippet,
+            'rank': self.rank,
+        }
+
+
+def highlight(snippet):
+    """HTML-escape a snippet, then turn the match placeholders into <mark> tags"""
+    return mark_safe(escape(snippet).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>'))
+
+
+def fts5_query(query):
+    """
+    Turn free text into a safe FTS5 query: every word quoted (so operators
+    and punctuation in user input are literal), all required, and the last
+    word matched as a prefix so results appear while typing
+    """
+    tokens = _QUERY_TOKEN.findall(query)
+    if not tokens:
+        return None
+    terms = [f'"{token}"' for token in tokens]
+    terms[-1] += '*'
+    return " ".join(terms)
+
+
+def _search_sqlite(student_id, query, limit, offset):
+    match = fts5_query(query)
+    if match is None:
+        return []
+    sql = f"""
+        SELECT d.kind, d.object_id, d.title, d.url,
+               snippet({FTS_TABLE}, 1, %s, %s, '…', {SNIPPET_WORDS}),
+               bm25({FTS_TABLE}, 5.0, 1.0) AS score
+        FROM {FTS_TABLE}
+        JOIN learning_platform_searchdocument d ON d.id = {FTS_TABLE}.rowid
+        WHERE {FTS_TABLE} MATCH %s AND d.student_id = %s
+        ORDER BY score, d.id
+        LIMIT %s OFFSET %s
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [MARK_START, MARK_END, match, student_id, limit, offset])
+        # bm25 is lower-is-better; report higher-is-better like PostgreSQL
+        return [(kind, object_id, title, url, snippet, -score)
+                for kind, object_id, title, url, snippet, score in cursor.fetchall()]
+
+
+def _search_postgresql(student_id, query, limit, offset):
+    sql = """
+        SELECT kind, object_id, title, url,
+               ts_headline('english', body, q, %s),
+               ts_rank_cd(setweight(to_tsvector('english', title), 'A') ||
+                          setweight(to_tsvector('english', body), 'D'), q) AS score
+        FROM learning_platform_searchdocument, websearch_to_tsquery('english', %s) q
+        WHERE student_id = %s
+          AND to_tsvector('english', title || ' ' || body) @@ q
+        ORDER BY score DESC, id
+        LIMIT %s OFFSET %s
+    """
+    options = f"StartSel={MARK_START}, StopSel={MARK_END}, MaxWords={SNIPPET_WORDS * 2}, MinWords={SNIPPET_WORDS}"
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [options, query, student_id, limit, offset])
+        return cursor.fetchall()
+
+
+def _search_fallback(student_id, query, limit, offset):
+    documents = SearchDocument.objects.filter(student_id=student_id)
+    for token in _QUERY_TOKEN.findall(query):
+        documents = documents.filter(body__icontains=token) | documents.filter(title__icontains=token)
+    rows = documents.order_by('-updated_at', 'pk').values_list(
+        'kind', 'object_id', 'title', 'url', 'body')[offset:offset + limit]
+    return [(kind, object_id, title, url, body[:SNIPPET_WORDS * 8], 0.0)
+            for kind, object_id, title, url, body in rows]
+
+
+def search_documents(student_id, query, page=1, page_size=PAGE_SIZE):
+    """
+    Ranked search within one student's documents. Returns (results, has_next)
+    for the 1-based `page`.
+    """
+    query = query.strip()
+    if not query:
+        return [], False
+    page = max(1, page)
+    backend = {
+        'sqlite': _search_sqlite,
+        'postgresql': _search_postgresql,
+    }.get(connection.vendor, _search_fallback)
+    # Fetch one extra row to know whether there is a next page
+    rows = backend(student_id, query, page_size + 1, (page - 1) * page_size)
+    pending = pending_script_urls(
+        object_id for kind, object_id, *_ in rows[:page_size] if kind == SearchDocument.KIND_SCRIPT
+    )
+    results = [
+        SearchResult(kind, title, pending.get(object_id, url) if kind == SearchDocument.KIND_SCRIPT else url,
+                     highlight(snippet or ''), round(float(score), 4))
+        for kind, object_id, title, url, snippet, score in rows[:page_size]
+    ]
+    return results, len(rows) > page_size
+
+
+def pending_script_urls(script_ids):
+    """
+    Status URLs of the latest job of the scripts that have no memorandum yet
+    (queued, running or failed), whose memorandum page would be a 404
+    """
+    script_ids = set(script_ids)
+    if not script_ids:
+        return {}
+    script_ids -= set(Memorandum.objects.filter(script_id__in=script_ids).values_list('script_id', flat=True))
+    jobs = (ProcessingJob.objects.filter(script_id__in=script_ids)
+            .order_by('script_id', '-created_at', '-pk').values_list('script_id', 'job_id'))
+    urls = {}
+    for script_id, job_id in jobs:
+        urls.setdefault(script_id, reverse('job_status', args=[job_id]))
+    return urls
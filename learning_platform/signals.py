@@ -0,0 +1,173 @@
+"""
+Keep StudentStats in step with the rows it counts, invalidate each
+student's cached pages (see page_cache.py) when their content changes, and
+keep the search index (see search.py) up to date.
+
+Each handler applies a delta with an F() update, so concurrent workers can't
+lose increments. If a student has no stats row yet it is rebuilt from
+scratch instead. Bulk operations (bulk_create, queryset update/delete)
+bypass these signals; run `python manage.py rebuild_student_stats` (and
+`rebuild_search_index`) after them.
+"""
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F, QuerySet
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from .models import (
+    CareerRecommendation, Memorandum, ReportCard, SearchDocument, Student, StudentStats, StudyPlan,
+    UploadedScript,
+)
+from .page_cache import bump_student_page_version
+from .search import index_object, unindex_object
+
+
+def topics_length(topics):
+    return len(topics) if isinstance(topics, list) else 0
+
+
+def rebuild_stats(student_id):
+    student = Student.objects.filter(pk=student_id).first()
+    if student:
+        StudentStats.rebuild(student)
+
+
+def apply_stats_delta(student_id, rebuild_missing=True, **deltas):
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    updated = StudentStats.objects.filter(student_id=student_id).update(
+        **{field: F(field) + delta for field, delta in deltas.items()}
+    )
+    if not updated and rebuild_missing:
+        rebuild_stats(student_id)
+
+
+def deleting_student(origin):
+    """True when a row is being removed by a cascade from its Student or User"""
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return model in (Student, User)
+
+
+@receiver(post_save, sender=Student)
+def student_saved(sender, instance, created, **kwargs):
+    if created:
+        StudentStats.objects.get_or_create(student=instance)
+
+
+@receiver(post_init, sender=UploadedScript)
+def remember_script_topics(sender, instance, **kwargs):
+    # Saved topic count, used to work out the delta on the next save
+    if 'processed_topics' in instance.__dict__:
+        instance._saved_topics_count = topics_length(instance.processed_topics)
+    else:
+        instance._saved_topics_count = None
+
+
+@receiver(post_save, sender=UploadedScript)
+def script_saved(sender, instance, created, **kwargs):
+    topics_count = topics_length(instance.processed_topics)
+    previous = 0 if created else getattr(instance, '_saved_topics_count', 0)
+    if previous is None:
+        # Loaded with processed_topics deferred, so the delta is unknown
+        rebuild_stats(instance.student_id)
+        instance._saved_topics_count = topics_count
+        return
+    apply_stats_delta(
+        instance.student_id,
+        scripts_count=1 if created else 0,
+        topics_count=topics_count - previous,
+    )
+    instance._saved_topics_count = topics_count
+
+
+@receiver(post_delete, sender=UploadedScript)
+def script_deleted(sender, instance, origin=None, **kwargs):
+    if deleting_student(origin):
+        return
+    topics_count = getattr(instance, '_saved_topics_count', 0)
+    if topics_count is None:
+        rebuild_stats(instance.student_id)
+        return
+    apply_stats_delta(instance.student_id, rebuild_missing=False, scripts_count=-1, topics_count=-topics_count)
+
+
+@receiver(post_init, sender=StudyPlan)
+def remember_plan_active(sender, instance, **kwargs):
+    instance._saved_is_active = bool(instance.__dict__.get('is_active')) and instance.pk is not None
+
+
+@receiver(post_save, sender=StudyPlan)
+def study_plan_saved(sender, instance, created, **kwargs):
+    was_active = False if created else getattr(instance, '_saved_is_active', False)
+    apply_stats_delta(instance.student_id, plans_count=int(instance.is_active) - int(was_active))
+    instance._saved_is_active = instance.is_active
+
+
+@receiver(post_delete, sender=StudyPlan)
+def study_plan_deleted(sender, instance, origin=None, **kwargs):
+    if getattr(instance, '_saved_is_active', False) and not deleting_student(origin):
+        apply_stats_delta(instance.student_id, rebuild_missing=False, plans_count=-1)
+
+
+@receiver(post_save, sender=ReportCard)
+def report_card_saved(sender, instance, created, **kwargs):
+    if created:
+        apply_stats_delta(instance.student_id, reports_count=1)
+
+
+@receiver(post_delete, sender=ReportCard)
+def report_card_deleted(sender, instance, origin=None, **kwargs):
+    if not deleting_student(origin):
+        apply_stats_delta(instance.student_id, rebuild_missing=False, reports_count=-1)
+
+
+def invalidate_pages(student_id):
+    # After commit, so a page rendered mid-transaction can't be cached as current
+    transaction.on_commit(lambda: bump_student_page_version(student_id))
+
+
+@receiver(post_save, sender=UploadedScript)
+@receiver(post_delete, sender=UploadedScript)
+@receiver(post_save, sender=StudyPlan)
+@receiver(post_delete, sender=StudyPlan)
+@receiver(post_save, sender=ReportCard)
+@receiver(post_delete, sender=ReportCard)
+@receiver(post_save, sender=CareerRecommendation)
+@receiver(post_delete, sender=CareerRecommendation)
+def student_content_changed(sender, instance, **kwargs):
+    invalidate_pages(instance.student_id)
+
+
+@receiver(post_save, sender=Memorandum)
+@receiver(post_delete, sender=Memorandum)
+def memorandum_changed(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, UploadedScript) or deleting_student(origin):
+        return
+    student_id = UploadedScript.objects.filter(pk=instance.script_id).values_list('student_id', flat=True).first()
+    if student_id is not None:
+        invalidate_pages(student_id)
+
+
+SEARCH_KINDS = {
+    UploadedScript: SearchDocument.KIND_SCRIPT,
+    Memorandum: SearchDocument.KIND_MEMORANDUM,
+    StudyPlan: SearchDocument.KIND_STUDY_PLAN,
+}
+
+
+@receiver(post_save, sender=UploadedScript)
+@receiver(post_save, sender=Memorandum)
+@receiver(post_save, sender=StudyPlan)
+def update_search_index(sender, instance, **kwargs):
+    index_object(SEARCH_KINDS[sender], instance)
+
+
+@receiver(post_delete, sender=UploadedScript)
+@receiver(post_delete, sender=Memorandum)
+@receiver(post_delete, sender=StudyPlan)
+def remove_from_search_index(sender, instance, origin=None, **kwargs):
+    # A deleted student's documents go with it (SearchDocument cascades)
+    if not deleting_student(origin):
+        unindex_object(SEARCH_KINDS[sender], instance.pk)
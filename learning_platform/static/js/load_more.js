@@ -0,0 +1,25 @@
+// "Load more" buttons at the end of paginated lists: fetch the next page
+// (list items ending with the next button, if any) in place of the button.
+document.addEventListener('click', function (event) {
+    const button = event.target.closest('.load-more button');
+    if (!button) {
+        return;
+    }
+    const item = button.closest('.load-more');
+    button.disabled = true;
+    fetch(button.dataset.url, { headers: { 'X-Requested-With': 'XMLHttpRequest' } })
+        .then(function (response) {
+            if (!response.ok) {
+                throw new Error(response.statusText);
+            }
+            return response.text();
+        })
+        .then(function (html) {
+            item.insertAdjacentHTML('afterend', html);
+            item.remove();
+        })
+        .catch(function () {
+            button.disabled = false;
+            button.textContent = 'Could not load more. Try again';
+        });
+});
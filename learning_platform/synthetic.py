@@ -0,0 +1,279 @@
+"""
+Synthetic documents for benchmarks and parser checks.
+
+Everything is driven by a random.Random, so the same seed always produces
+the same documents. Report cards come with the grades a correct parser
+should find. PDFs are written directly (one Helvetica font, text lines and
+ruled tables) so no PDF library is needed to produce them.
+"""
+import io
+import random
+
+from .grades import LETTER_SCORES
+
+SCRIPT_FORMATS = ('pdf', 'docx', 'txt')
+# Roughly what fits on one printed page
+PARAGRAPHS_PER_PAGE = 10
+
+# (name as printed on the card, canonical name the parser should return)
+REPORT_CARD_SUBJECTS = [
+    ('Mathematics', 'Mathematics'),
+    ('Maths', 'Mathematics'),
+    ('Mathematical Literacy', 'Mathematical Literacy'),
+    ('English Home Language', 'English Home Language'),
+    ('English', 'English'),
+    ('Afrikaans First Additional Language', 'Afrikaans First Additional Language'),
+    ('Physical Sciences', 'Physical Sciences'),
+    ('Life Sciences', 'Life Sciences'),
+    ('Biology', 'Biology'),
+    ('Chemistry', 'Chemistry'),
+    ('Geography', 'Geography'),
+    ('History', 'History'),
+    ('Accounting', 'Accounting'),
+    ('Business Studies', 'Business Studies'),
+    ('Economics', 'Economics'),
+    ('Computer Science', 'Computer Science'),
+    ('Information Technology', 'Information Technology'),
+    ('Life Orientation', 'Life Orientation'),
+    ('Visual Arts', 'Visual Arts'),
+    ('Music', 'Music'),
+    ('Tourism', 'Tourism'),
+    ('Engineering Graphics and Design', 'Engineering Graphics and Design'),
+]
+
+REPORT_CARD_LAYOUTS = ('colon', 'columns', 'letters', 'fractions', 'table')
+
+FIRST_NAMES = ['Thandi', 'Liam', 'Ayesha', 'Sipho', 'Emma', 'Kabelo', 'Noah', 'Lerato', 'Mia', 'Johan']
+LAST_NAMES = ['Nkosi', 'Smith', 'Patel', 'Dlamini', 'van Wyk', 'Naidoo', 'Botha', 'Mokoena']
+
+COMMENTS = [
+    "Shows steady progress and participates well in class discussions.",
+    "Needs to spend more time on homework and revision before tests.",
+    "A pleasure to teach; consistently hands in careful, complete work.",
+    "Has improved markedly since the start of the year.",
+    "Should ask for help sooner when a topic is unclear.",
+]
+
+SCRIPT_TOPICS = [
+    "photosynthesis", "cellular respiration", "quadratic equations", "trigonometric identities",
+    "Newton's laws of motion", "chemical bonding", "the French Revolution", "supply and demand",
+    "plate tectonics", "probability", "electric circuits", "genetics and inheritance",
+    "linear programming", "the water cycle", "organic chemistry", "financial statements",
+]
+
+SCRIPT_SENTENCES = [
+    "Explain how {topic} relates to the examples discussed in class.",
+    "Question {n}: Describe the main stages of {topic} and give one real-world application.",
+    "Use a labelled diagram to show the key features of {topic}.",
+    "Calculate the values required and show all working for the problem on {topic}.",
+    "Compare {topic} with {other}, giving two similarities and two differences.",
+    "Learners often confuse {topic} with {other}; state the difference clearly.",
+]
+
+
+def _letter_for(score):
+    for letter, minimum in sorted(LETTER_SCORES.items(), key=lambda item: -item[1]):
+        if score >= minimum:
+            return letter
+    return 'F'
+
+
+def report_card(rng, layout=None, subject_count=None, comment_lines=2):
+    """
+    Build one synthetic report card. Returns a dict with the card's `text`,
+    the `table` (header row plus data rows) for PDF rendering, and the
+    `expected` {subject: score} a parser should extract.
+    """
+    layout = layout or rng.choice(REPORT_CARD_LAYOUTS)
+    subject_count = subject_count or rng.randint(6, 9)
+    chosen = {}
+    for printed, canonical in rng.sample(REPORT_CARD_SUBJECTS, len(REPORT_CARD_SUBJECTS)):
+        if canonical not in chosen:
+            chosen[canonical] = printed
+        if len(chosen) == subject_count:
+            break
+
+    lines = [
+        "Riverside High School",
+        f"Learner Name: {rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+        f"Grade {rng.randint(8, 12)}   Term {rng.randint(1, 4)}   Year {rng.randint(2019, 2026)}",
+        f"Date: {rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(2019, 2026)}",
+        "",
+    ]
+    expected = {}
+    table = None
+    if layout == 'colon':
+        for canonical, printed in chosen.items():
+            score = rng.randint(30, 99)
+            lines.append(f"{printed}: {score}%")
+            expected[canonical] = score
+    elif layout == 'letters':
+        for canonical, printed in chosen.items():
+            letter = _letter_for(rng.randint(40, 99))
+            lines.append(f"{printed}  {letter}")
+            expected[canonical] = LETTER_SCORES[letter]
+    elif layout == 'fractions':
+        for canonical, printed in chosen.items():
+            total = rng.choice([50, 75, 100, 150])
+            mark = rng.randint(total // 3, total)
+            lines.append(f"{printed} - {mark}/{total}")
+            value = round(mark * 100 / total, 1)
+            expected[canonical] = int(value) if value.is_integer() else value
+    else:
+        # Term columns and a final mark, plus the achievement level
+        rows = [["Subject", "Term 1", "Term 2", "Final Mark", "Level"]]
+        for canonical, printed in chosen.items():
+            terms = [rng.randint(30, 99) for _ in range(2)]
+            final = rng.randint(30, 99)
+            level = min(7, max(1, (final - 20) // 10))
+            rows.append([printed, str(terms[0]), str(terms[1]), str(final), str(level)])
+            expected[canonical] = final
+        lines.extend("  ".join(row) for row in rows)
+        # 'columns' is the same data as plain text lines; 'table' is drawn as a grid in PDFs
+        table = rows if layout == 'table' else None
+
+    lines.append("")
+    lines.append(f"Days Absent: {rng.randint(0, 15)}")
+    lines.append(f"Overall Average: {rng.randint(40, 90)}%")
+    lines.extend(rng.choice(COMMENTS) for _ in range(comment_lines))
+    return {
+        'layout': layout,
+        'text': "\n".join(lines),
+        'header': lines[:4],
+        'table': table,
+        'expected': expected,
+    }
+
+
+def script_text(rng, paragraphs=20):
+    """Plausible exam-script text: numbered questions about a few topics"""
+    topics = rng.sample(SCRIPT_TOPICS, 4)
+    blocks = []
+    for n in range(1, paragraphs + 1):
+        sentences = [
+            rng.choice(SCRIPT_SENTENCES).format(topic=rng.choice(topics), other=rng.choice(SCRIPT_TOPICS), n=n)
+            for _ in range(rng.randint(2, 5))
+        ]
+        blocks.append(" ".join(sentences))
+    return "\n\n".join(blocks)
+
+
+def _pdf_string(text):
+    text = text.encode('latin-1', 'replace').decode('latin-1')
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def _text_ops(lines, x, y, size=10, leading=13):
+    ops = [f"BT /F1 {size} Tf {x} {y} Td {leading} TL"]
+    ops.extend(f"({_pdf_string(line)}) '" for line in lines)
+    ops.append("ET")
+    return ops
+
+
+def _table_ops(table, x, y, first_width=190, column_width=65, row_height=18, size=9):
+    """Draw a ruled grid with the cell text inside, top-left corner at (x, y)"""
+    columns = max(len(row) for row in table)
+    edges = [x] + [x + first_width + c * column_width for c in range(columns)]
+    height = len(table) * row_height
+    ops = ["0.5 w"]
+    for r in range(len(table) + 1):
+        ops.append(f"{x} {y - r * row_height} m {edges[-1]} {y - r * row_height} l S")
+    for edge in edges:
+        ops.append(f"{edge} {y} m {edge} {y - height} l S")
+    for r, row in enumerate(table):
+        for c, cell in enumerate(row):
+            ops.append(
+                f"BT /F1 {size} Tf {edges[c] + 4} {y - (r + 1) * row_height + 5} Td "
+                f"({_pdf_string(cell)}) Tj ET"
+            )
+    return ops
+
+
+def pdf_bytes(pages, table=None):
+    """
+    A minimal PDF with one page per list of text lines. `table` (rows of
+    cell strings) is drawn as a ruled grid below the first page's text.
+    """
+    objects = [b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>", b""]
+    kids = []
+    for index, lines in enumerate(pages or [[]]):
+        ops = _text_ops(lines[:56], 50, 800)
+        if table and index == 0:
+            ops.extend(_table_ops(table, 50, 790 - 13 * min(len(lines), 56) - 20))
+        stream = "\n".join(ops).encode('latin-1')
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents %d 0 R "
+            b"/Resources << /Font << /F1 1 0 R >> >> >>" % len(objects)
+        )
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % k for k in kids), len(kids))
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, len(objects), xref)
+    return bytes(out)
+
+
+def paginate(text, lines_per_page=50, width=95):
+    """Wrap text into pages of lines for pdf_bytes"""
+    lines = []
+    for paragraph in text.split("\n"):
+        while len(paragraph) > width:
+            cut = paragraph.rfind(" ", 0, width)
+            cut = cut if cut > 0 else width
+            lines.append(paragraph[:cut])
+            paragraph = paragraph[cut:].lstrip()
+        lines.append(paragraph)
+    return [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+
+
+def docx_bytes(text):
+    """A .docx with one paragraph per line of `text`"""
+    import docx
+
+    document = docx.Document()
+    for line in text.split("\n"):
+        document.add_paragraph(line)
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def script_file(rng, file_format='pdf', pages=2):
+    """
+    A synthetic script upload of about `pages` pages. Returns
+    (filename, bytes, text).
+    """
+    text = script_text(rng, paragraphs=max(1, pages * PARAGRAPHS_PER_PAGE))
+    name = f"script-{rng.getrandbits(32):08x}.{file_format}"
+    if file_format == 'pdf':
+        return name, pdf_bytes(paginate(text)), text
+    if file_format == 'docx':
+        return name, docx_bytes(text), text
+    if file_format == 'txt':
+        return name, text.encode('utf-8'), text
+    raise ValueError(f"Unknown script format: {file_format}")
+
+
+def report_card_pdf(card):
+    """PDF bytes for a report_card(); tabular layouts get a ruled table"""
+    if card['table']:
+        text_lines = card['header'] + [""]
+        footer = card['text'].split("\n")[len(card['header']) + 1 + len(card['table']):]
+        return pdf_bytes([text_lines, footer], table=card['table'])
+    return pdf_bytes(paginate(card['text']))
+
+
+def report_cards(count, seed=0, **kwargs):
+    """`count` report cards from a fixed seed"""
+    rng = random.Random(seed)
+    return [report_card(rng, **kwargs) for _ in range(count)]
@@ -1,3 +1,265 @@
-from django.test import TestCase
+import re
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .jobs import claim_next_job, requeue_stale_jobs, run_job
+from .llm_stub import AsyncStubOpenAI, StubOpenAI
+from .metrics import get_metrics_settings, reset_metrics
+from .models import DocumentBlob, Memorandum, ProcessingJob, Student, StudyPlan, UploadedScript
+from .ratelimit import (
+    CacheBucketStore, LLMOverloaded, check_student_rate, get_rate_limits, llm_slot, reset_rate_limits,
+)
+
+SCRIPT_TEXT = (
+    b"Photosynthesis converts light energy into chemical energy in the chloroplast. "
+    b"Chlorophyll absorbs light, water is split and oxygen is released. "
+    b"The Calvin cycle fixes carbon dioxide into glucose."
+)
+
+
+class PlatformTestCase(TransactionTestCase):
+    """
+    Temporary media, index and metrics directories, the stub OpenAI client
+    in place of the API, and no LLM cache or rate limits
+    """
+
+    def setUp(self):
+        directory = tempfile.mkdtemp(prefix='learning_platform_tests_')
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        overrides = override_settings(
+            MEDIA_ROOT=f"{directory}/media",
+            VECTOR_INDEX={**getattr(settings, 'VECTOR_INDEX', {}), 'PATH': f"{directory}/vector_index"},
+            LLM_CACHE={**getattr(settings, 'LLM_CACHE', {}), 'ENABLED': False},
+            RATE_LIMITS={**getattr(settings, 'RATE_LIMITS', {}), 'ENABLED': False},
+            METRICS={**getattr(settings, 'METRICS', {}), 'PATH': f"{directory}/metrics"},
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        reset_metrics()
+        self.addCleanup(reset_metrics)
+        for name, stub in (('get_openai_client', StubOpenAI()), ('get_async_openai_client', AsyncStubOpenAI())):
+            patcher = mock.patch(f'learning_platform.views.{name}', return_value=stub)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.user = User.objects.create_user(username='student', password='secret-password')
+        self.student = Student.objects.create(user=self.user, grade_level='Grade 11')
+        self.client.force_login(self.user)
+
+    def upload_script(self, content=SCRIPT_TEXT, name='notes.txt'):
+        return self.client.post(
+            reverse('upload_script'),
+            {'title': name, 'subject': 'Biology', 'script_file': SimpleUploadedFile(name, content)},
+            HTTP_ACCEPT='application/json',
+        )
+
+
+class ProcessingJobTests(PlatformTestCase):
+
+    def run_next_job(self):
+        job = claim_next_job()
+        self.assertIsNotNone(job)
+        return run_job(job)
+
+    def test_upload_returns_202_and_queued_job(self):
+        response = self.upload_script()
+
+        self.assertEqual(response.status_code, 202)
+        data = response.json()
+        self.assertEqual(data['status'], ProcessingJob.STATUS_QUEUED)
+        status = self.client.get(data['status_url']).json()
+        self.assertEqual(status['status'], ProcessingJob.STATUS_QUEUED)
+        self.assertEqual(status['attempts'], 0)
+
+    def test_worker_runs_job_to_done(self):
+        status_url = self.upload_script().json()['status_url']
+
+        job = self.run_next_job()
+
+        self.assertEqual(job.status, ProcessingJob.STATUS_DONE, job.error)
+        self.assertIsNone(claim_next_job())
+        status = self.client.get(status_url).json()
+        self.assertEqual(status['status'], ProcessingJob.STATUS_DONE)
+        self.assertEqual(status['result_url'], reverse('view_memorandum', args=[job.script_id]))
+        self.assertEqual(self.client.get(status['result_url']).status_code, 200)
+
+    def test_requeued_job_keeps_one_memorandum_and_study_plan(self):
+        self.upload_script()
+        job = self.run_next_job()
+        # A worker that died mid-run leaves the job running; it is requeued
+        ProcessingJob.objects.filter(pk=job.pk).update(status=ProcessingJob.STATUS_RUNNING)
+        self.assertEqual(requeue_stale_jobs(stale_after=-1), 1)
+
+        job = self.run_next_job()
+
+        self.assertEqual(job.status, ProcessingJob.STATUS_DONE, job.error)
+        self.assertEqual(job.attempts, 2)
+        self.assertEqual(Memorandum.objects.filter(script=job.script).count(), 1)
+        self.assertEqual(StudyPlan.objects.filter(student=self.student).count(), 1)
+        response = self.client.get(reverse('view_memorandum', args=[job.script_id]))
+        self.assertEqual(response.status_code, 200)
+
+    def test_identical_upload_reuses_blob(self):
+        self.upload_script(name='first.txt')
+        self.run_next_job()
+        self.upload_script(name='second.txt')
+
+        self.assertEqual(DocumentBlob.objects.count(), 1)
+        blob = DocumentBlob.objects.get()
+        self.assertTrue(blob.is_analyzed)
+        self.assertEqual(set(UploadedScript.objects.values_list('blob_id', flat=True)), {blob.pk})
+        job = self.run_next_job()
+        self.assertEqual(job.status, ProcessingJob.STATUS_DONE, job.error)
+        self.assertEqual(job.script.processed_topics, blob.processed_topics)
+
+
+class RateLimitTests(PlatformTestCase):
+
+    def rate_limits(self, **options):
+        """Turn rate limits on with `options` for the rest of the test"""
+        overrides = override_settings(RATE_LIMITS={**get_rate_limits(), 'ENABLED': True, **options})
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        reset_rate_limits()
+        self.addCleanup(reset_rate_limits)
+
+    def chat(self):
+        return self.client.post(reverse('chatbot'), {'message': 'What is photosynthesis?'})
+
+    def assert_chat_burst_limited(self):
+        responses = [self.chat() for _ in range(4)]
+
+        self.assertEqual([response.status_code for response in responses], [200, 200, 429, 429])
+        self.assertEqual(responses[2]['Retry-After'], '60')
+        self.assertEqual(responses[2].json()['retry_after'], 60)
+
+    def test_requests_beyond_burst_get_429_with_retry_after(self):
+        self.rate_limits(STUDENT_REQUEST_BURST=2, STUDENT_REQUESTS_PER_MINUTE=1)
+        self.assert_chat_burst_limited()
+
+    def test_cache_backend_limits_with_shared_cache(self):
+        self.rate_limits(BACKEND='cache', CACHE_ALIAS='ratelimit',
+                         STUDENT_REQUEST_BURST=2, STUDENT_REQUESTS_PER_MINUTE=1)
+        self.addCleanup(caches['ratelimit'].clear)
+        self.assert_chat_burst_limited()
+
+    def test_cache_backend_rejects_per_process_cache(self):
+        self.rate_limits(BACKEND='cache', CACHE_ALIAS='default')
+        with self.assertRaises(ImproperlyConfigured):
+            check_student_rate(self.user.pk)
+
+    def test_cache_bucket_lock_contention_does_not_reject(self):
+        store = CacheBucketStore({'CACHE_ALIAS': 'ratelimit'})
+        cache = caches['ratelimit']
+        self.addCleanup(cache.clear)
+        cache.set('ratelimit:lock:contended', 'other-worker', timeout=5)
+
+        self.assertEqual(store.consume('contended', 1, capacity=2, rate=1 / 60), 0)
+        # The other worker's lock and bucket are left alone
+        self.assertEqual(cache.get('ratelimit:lock:contended'), 'other-worker')
+        self.assertIsNone(cache.get('ratelimit:contended'))
+        self.assertGreater(store.consume('contended', 5, capacity=2, rate=1 / 60), 0)
+
+    def test_llm_slots_are_admitted_up_to_max_concurrency(self):
+        self.rate_limits(LLM_MAX_CONCURRENCY=1)
+        with llm_slot(timeout=0):
+            with self.assertRaises(LLMOverloaded) as raised:
+                with llm_slot(timeout=0):
+                    pass
+            self.assertGreaterEqual(raised.exception.retry_after, 1)
+        with llm_slot(timeout=0):
+            pass
+
+
+class MetricsAccessTests(PlatformTestCase):
+
+    def test_localhost_is_not_trusted_by_default(self):
+        # What every request looks like behind a reverse proxy on the same host
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='127.0.0.1').status_code, 403)
+
+    def test_staff_and_token_can_read(self):
+        with self.settings(METRICS={**settings.METRICS, 'PATH': get_metrics_settings()['PATH'], 'TOKEN': 's3cret'}):
+            self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer s3cret')
+            self.assertEqual(response.status_code, 200)
+            self.assertIn(b'# TYPE', response.content)
+
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+
+class SearchTests(PlatformTestCase):
+
+    def search(self, query):
+        response = self.client.get(reverse('search'), {'q': query}, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        return {result['kind']: result['url'] for result in response.json()['results']}
+
+    def test_script_hits_link_to_job_status_until_memorandum_exists(self):
+        status_url = self.upload_script().json()['status_url']
+
+        urls = self.search('biology')
+        self.assertEqual(urls, {'script': status_url})
+        self.assertEqual(self.client.get(urls['script']).status_code, 200)
+
+        job = run_job(claim_next_job())
+        self.assertEqual(job.status, ProcessingJob.STATUS_DONE, job.error)
+        urls = self.search('biology')
+        self.assertEqual(urls['script'], reverse('view_memorandum', args=[job.script_id]))
+        self.assertEqual(self.client.get(urls['script']).status_code, 200)
+
+
+class LoadMoreTests(PlatformTestCase):
+
+    def create_scripts(self, count, distinct_timestamps):
+        now = timezone.now()
+        for i in range(count):
+            script = UploadedScript.objects.create(student=self.student, title=f"Script {i}", file='scripts/x.txt')
+            # Many scripts share an upload time, so pages split ties
+            UploadedScript.objects.filter(pk=script.pk).update(
+                uploaded_at=now - timedelta(minutes=i % distinct_timestamps))
+
+    def walk(self, kind):
+        """Follow load_more from the first page to the last; returns the pages' ids"""
+        pages = []
+        url = reverse('load_more', args=[kind])
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            html = response.content.decode()
+            pages.append([int(pk) for pk in re.findall(r'/view-memorandum/(\d+)/', html)])
+            next_url = re.search(r'data-url="([^"]+)"', html)
+            url = next_url.group(1) if next_url else None
+        return pages
+
+    def test_walk_yields_every_row_once_with_timestamp_ties(self):
+        self.create_scripts(25, distinct_timestamps=3)
+
+        pages = self.walk('scripts')
+
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        ids = [pk for page in pages for pk in page]
+        self.assertEqual(len(ids), len(set(ids)))
+        expected = list(UploadedScript.objects.filter(student=self.student)
+                        .order_by('-uploaded_at', '-pk').values_list('pk', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_malformed_cursor_is_bad_request(self):
+        self.create_scripts(3, distinct_timestamps=1)
+        for cursor in ('not a cursor', '!!!', 'bm90LWEtZGF0ZXwx'):
+            response = self.client.get(reverse('load_more', args=['scripts']), {'after': cursor})
+            self.assertEqual(response.status_code, 400, cursor)
+
+    def test_unknown_list_is_not_found(self):
+        self.assertEqual(self.client.get(reverse('load_more', args=['secrets'])).status_code, 404)
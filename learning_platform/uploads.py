@@ -0,0 +1,81 @@
+"""
+Content-addressed storage for uploaded scripts.
+
+The upload handlers below hash each file while Django streams it into
+memory or a temporary file, so by the time a view sees the upload its
+sha256 is already known. store_script_blob() then reuses an existing
+DocumentBlob for byte-identical files instead of writing another copy.
+"""
+import hashlib
+import os
+
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from django.db import IntegrityError
+
+from .models import DocumentBlob
+
+
+class HashingUploadMixin:
+    """Compute a sha256 of each file as its chunks arrive"""
+
+    def new_file(self, *args, **kwargs):
+        # Set up first: the memory handler raises StopFutureHandlers from new_file
+        self.sha256 = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        # The memory handler passes large files on to the next handler
+        if getattr(self, 'activated', True):
+            self.sha256.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.sha256 = self.sha256.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(HashingUploadMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadMixin, TemporaryFileUploadHandler):
+    pass
+
+
+def file_sha256(file):
+    """
+    Return the sha256 of an uploaded/Django File, using the digest computed
+    by the upload handlers when available
+    """
+    digest = getattr(file, 'sha256', None)
+    if digest:
+        return digest
+    sha256 = hashlib.sha256()
+    for chunk in file.chunks():
+        sha256.update(chunk)
+    file.seek(0)
+    return sha256.hexdigest()
+
+
+def store_script_blob(uploaded_file):
+    """
+    Return the DocumentBlob for this file's content, saving the file to disk
+    only if no byte-identical file has been stored before
+    """
+    sha256 = file_sha256(uploaded_file)
+    blob = DocumentBlob.objects.filter(sha256=sha256).first()
+    if blob:
+        return blob
+
+    blob = DocumentBlob(sha256=sha256, size=uploaded_file.size)
+    extension = os.path.splitext(uploaded_file.name)[1].lower()
+    blob.file.save(f"{sha256}{extension}", uploaded_file, save=False)
+    try:
+        blob.save()
+    except IntegrityError:
+        # Another upload of the same file won the race; keep theirs
+        blob.file.delete(save=False)
+        blob = DocumentBlob.objects.get(sha256=sha256)
+    return blob
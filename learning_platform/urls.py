@@ -7,11 +7,18 @@ urlpatterns = [
     path('register/', views.register, name='register'),
     path('dashboard/', views.dashboard, name='dashboard'),
     path('study-plan/', views.study_plan, name='study_plan'),
+    path('more/<slug:kind>/', views.load_more, name='load_more'),
     path('ai-chat/', views.ai_chat, name='ai_chat'),
     path('api/chatbot/', views.chatbot, name='chatbot'),
+    path('api/chatbot/stream/', views.chatbot_stream, name='chatbot_stream'),
     path('upload-script/', views.upload_script, name='upload_script'),
     path('upload-report-card/', views.upload_report_card, name='upload_report_card'),
+    path('api/jobs/<uuid:job_id>/', views.job_status, name='job_status'),
+    path('search/', views.search, name='search'),
     path('view-memorandum/<int:script_id>/', views.view_memorandum, name='view_memorandum'),
     path('view-study-plan/<int:plan_id>/', views.view_study_plan, name='view_study_plan'),
     path('view-career-recommendations/<int:rec_id>/', views.view_career_recommendations, name='view_career_recommendations'),
+    path('metrics', views.metrics, name='metrics'),
+    path('profiles/', views.profiles, name='profiles'),
+    path('profiles/<slug:name>.<str:kind>', views.download_profile, name='download_profile'),
 ]
\ No newline at end of file
@@ -0,0 +1,348 @@
+"""
+Embedding index over uploaded scripts, used to find related material.
+
+Each script's extracted text and processed topics are embedded into a
+fixed-size, L2-normalized float32 vector. By default the embedding is local
+and deterministic (signed feature hashing of word unigrams and bigrams), so
+it needs no network; set VECTOR_INDEX['BACKEND'] to 'openai' to use the
+OpenAI embeddings API instead.
+
+The index is two append-only files in VECTOR_INDEX['PATH']:
+
+    vectors.f32   row-major float32 matrix, one row per script
+    ids.i64       the script id of each row
+
+plus meta.json recording the backend and dimensions. Files are
+memory-mapped on load and queried with one matrix-vector product (rows are
+normalized, so that is cosine similarity). A script that is re-analyzed
+gets a new row; older rows for the same id are ignored and dropped by
+`python manage.py rebuild_vector_index`.
+"""
+import json
+import os
+import threading
+import zlib
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from .extraction import get_stored_text
+from .keyphrases import STOPWORDS, condense_text, tokenize
+from .metrics import observe_llm_call
+from .openai_client import get_openai_client
+from .ratelimit import llm_slot
+
+DEFAULT_VECTOR_INDEX = {
+    'BACKEND': 'hashing',
+    'PATH': None,
+    'DIMENSIONS': 512,
+    'OPENAI_MODEL': 'text-embedding-3-small',
+    # Topics say more about a script than any single sentence
+    'TOPIC_WEIGHT': 3.0,
+}
+
+VECTORS_FILE = 'vectors.f32'
+IDS_FILE = 'ids.i64'
+META_FILE = 'meta.json'
+LOCK_FILE = '.lock'
+# Characters of text sent to the embeddings API (about 8k tokens)
+OPENAI_MAX_CHARS = 30000
+
+
+def get_vector_index_settings():
+    options = {**DEFAULT_VECTOR_INDEX, **getattr(settings, 'VECTOR_INDEX', {})}
+    if options['PATH'] is None:
+        options['PATH'] = os.path.join(settings.BASE_DIR, 'vector_index')
+    return options
+
+
+class HashingEmbedder:
+    """
+    Signed feature hashing of word unigrams and bigrams with sublinear term
+    frequency. Deterministic across processes and Python versions (crc32,
+    not hash()).
+    """
+    name = 'hashing'
+
+    def __init__(self, options):
+        self.dimensions = options['DIMENSIONS']
+        self.topic_weight = options['TOPIC_WEIGHT']
+
+    def _features(self, text):
+        words = [token for token in tokenize(text) if token[0].isalpha() and token not in STOPWORDS]
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def _accumulate(self, vector, features, weight):
+        if not features:
+            return
+        hashes = np.fromiter((zlib.crc32(f.encode('utf-8')) for f in features), dtype=np.uint32, count=len(features))
+        hashes, counts = np.unique(hashes, return_counts=True)
+        # The top bit picks the sign, so bucket collisions cancel out on average
+        signs = np.where(hashes >> 31, -1.0, 1.0)
+        np.add.at(vector, hashes % self.dimensions, weight * signs * (1 + np.log(counts)))
+
+    def embed(self, texts_and_topics):
+        vectors = np.zeros((len(texts_and_topics), self.dimensions), dtype=np.float32)
+        for row, (text, topics) in enumerate(texts_and_topics):
+            self._accumulate(vectors[row], self._features(text or ''), 1.0)
+            self._accumulate(vectors[row], self._features(" . ".join(topics or [])), self.topic_weight)
+        return vectors
+
+
+class OpenAIEmbedder:
+    """Embeddings from the OpenAI API, through the shared client and admission control"""
+    name = 'openai'
+
+    def __init__(self, options):
+        self.dimensions = options['DIMENSIONS']
+        self.model = options['OPENAI_MODEL']
+
+    def embed(self, texts_and_topics):
+        client = get_openai_client()
+        if client is None:
+            raise RuntimeError('VECTOR_INDEX BACKEND is "openai" but no OpenAI API key is configured')
+        inputs = [
+            "\n".join(topics or []) + "\n\n" + condense_text(text or '', OPENAI_MAX_CHARS)
+            for text, topics in texts_and_topics
+        ]
+        with llm_slot(), observe_llm_call(self.model, 'embeddings') as call:
+            response = client.embeddings.create(model=self.model, input=inputs, dimensions=self.dimensions)
+            call.usage = response.usage
+        return np.array([item.embedding for item in response.data], dtype=np.float32)
+
+
+EMBEDDERS = {
+    HashingEmbedder.name: HashingEmbedder,
+    OpenAIEmbedder.name: OpenAIEmbedder,
+}
+
+
+def get_embedder(options=None):
+    options = options or get_vector_index_settings()
+    return EMBEDDERS[options['BACKEND']](options)
+
+
+def normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def script_embedding_input(script):
+    return get_stored_text(script) or '', script.processed_topics or []
+
+
+@contextmanager
+def _locked(path):
+    """Exclusive lock on the index directory, shared by every process"""
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, LOCK_FILE), 'a+b') as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        else:
+            lock.seek(0)
+            msvcrt.locking(lock.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+            else:
+                lock.seek(0)
+                msvcrt.locking(lock.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _meta(options):
+    return {'backend': options['BACKEND'], 'dimensions': options['DIMENSIONS']}
+
+
+class VectorIndex:
+    """A memory-mapped view of the index files, reopened when they grow"""
+
+    def __init__(self, path, meta):
+        self.path = path
+        self.meta = meta
+        self.dimensions = meta['dimensions']
+        self._lock = threading.Lock()
+        self._rows = (0, np.zeros((0, self.dimensions), dtype=np.float32), np.zeros(0, dtype=np.int64))
+        self._state = (0, None)
+
+    def _file_state(self):
+        """(row count, file identity); a rebuild swaps in new files"""
+        try:
+            vectors = os.stat(os.path.join(self.path, VECTORS_FILE))
+            ids = os.stat(os.path.join(self.path, IDS_FILE))
+        except FileNotFoundError:
+            return 0, None
+        # A row counts once both its vector and its id are fully written
+        count = min(vectors.st_size // (4 * self.dimensions), ids.st_size // 8)
+        return count, (vectors.st_ino, vectors.st_mtime_ns)
+
+    def rows(self):
+        """
+        (count, vectors, ids) for the rows written so far. Superseded rows
+        have id -1.
+        """
+        count, identity = self._file_state()
+        with self._lock:
+            if (count, identity) != self._state:
+                self._rows = self._load(count)
+                self._state = (count, identity)
+            return self._rows
+
+    def _load(self, count):
+        if not count:
+            return 0, np.zeros((0, self.dimensions), dtype=np.float32), np.zeros(0, dtype=np.int64)
+        vectors = np.memmap(os.path.join(self.path, VECTORS_FILE), dtype=np.float32, mode='r',
+                            shape=(count, self.dimensions))
+        ids = np.array(np.memmap(os.path.join(self.path, IDS_FILE), dtype=np.int64, mode='r', shape=(count,)))
+        # Only the latest row for each script is live
+        _, last_from_end = np.unique(ids[::-1], return_index=True)
+        live = np.zeros(count, dtype=bool)
+        live[count - 1 - last_from_end] = True
+        ids[~live] = -1
+        return count, vectors, ids
+
+    def vector_for(self, script_id):
+        count, vectors, ids = self.rows()
+        rows = np.nonzero(ids == script_id)[0]
+        return np.array(vectors[rows[-1]]) if len(rows) else None
+
+    def query(self, vector, k=5, exclude_ids=()):
+        """Return [(script_id, cosine similarity)] of the k nearest live rows"""
+        count, vectors, ids = self.rows()
+        if not count:
+            return []
+        scores = vectors @ vector.astype(np.float32)
+        scores[ids < 0] = -np.inf
+        if exclude_ids:
+            scores[np.isin(ids, list(exclude_ids))] = -np.inf
+        k = min(k, count)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(ids[i]), float(scores[i])) for i in top if np.isfinite(scores[i])]
+
+
+_index_lock = threading.Lock()
+_index = None
+
+
+def get_index():
+    """The index for the current settings, or None if it is missing or was built differently"""
+    global _index
+    options = get_vector_index_settings()
+    path = options['PATH']
+    with _index_lock:
+        if _index is None or _index.path != path or _index.meta != _meta(options):
+            try:
+                with open(os.path.join(path, META_FILE)) as f:
+                    meta = json.load(f)
+            except FileNotFoundError:
+                return None
+            if meta != _meta(options):
+                # Built with another backend or size: needs rebuild_vector_index
+                return None
+            _index = VectorIndex(path, meta)
+        return _index
+
+
+def reset_index():
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def append_scripts(scripts, embedder=None):
+    """Embed scripts and append them to the index, creating it if needed"""
+    scripts = list(scripts)
+    if not scripts:
+        return 0
+    options = get_vector_index_settings()
+    embedder = embedder or get_embedder(options)
+    vectors = normalize(embedder.embed([script_embedding_input(script) for script in scripts]))
+    ids = np.array([script.pk for script in scripts], dtype=np.int64)
+
+    path = options['PATH']
+    with _locked(path):
+        meta_path = os.path.join(path, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                if json.load(f) != _meta(options):
+                    raise RuntimeError('Vector index settings changed; run `manage.py rebuild_vector_index`')
+        else:
+            with open(meta_path, 'w') as f:
+                json.dump(_meta(options), f)
+        vectors_path = os.path.join(path, VECTORS_FILE)
+        ids_path = os.path.join(path, IDS_FILE)
+        # Drop any partial row left by a writer that crashed mid-append
+        count, _ = VectorIndex(path, _meta(options))._file_state()
+        for file_path, row_bytes in ((vectors_path, 4 * options['DIMENSIONS']), (ids_path, 8)):
+            if os.path.exists(file_path) and os.path.getsize(file_path) != count * row_bytes:
+                os.truncate(file_path, count * row_bytes)
+        # Vectors first: a row only becomes visible once its id is written
+        with open(vectors_path, 'ab') as f:
+            f.write(vectors.astype(np.float32).tobytes())
+        with open(ids_path, 'ab') as f:
+            f.write(ids.tobytes())
+    return len(scripts)
+
+
+def rebuild(scripts, batch_size=64):
+    """
+    Write a fresh index for `scripts` next to the current one and swap it in.
+    Appends wait until it is done. Returns the number of scripts indexed.
+    """
+    options = get_vector_index_settings()
+    embedder = get_embedder(options)
+    path = options['PATH']
+    os.makedirs(path, exist_ok=True)
+    tmp = {name: os.path.join(path, f"{name}.tmp") for name in (VECTORS_FILE, IDS_FILE, META_FILE)}
+
+    indexed = 0
+    # Hold the lock throughout so rows appended meanwhile aren't lost in the swap
+    with _locked(path):
+        with open(tmp[VECTORS_FILE], 'wb') as vectors_file, open(tmp[IDS_FILE], 'wb') as ids_file:
+            batch = []
+            for script in scripts:
+                batch.append(script)
+                if len(batch) >= batch_size:
+                    indexed += _write_batch(embedder, batch, vectors_file, ids_file)
+                    batch = []
+            indexed += _write_batch(embedder, batch, vectors_file, ids_file)
+        with open(tmp[META_FILE], 'w') as f:
+            json.dump(_meta(options), f)
+
+        for name in (VECTORS_FILE, IDS_FILE, META_FILE):
+            os.replace(tmp[name], os.path.join(path, name))
+    reset_index()
+    return indexed
+
+
+def _write_batch(embedder, scripts, vectors_file, ids_file):
+    if not scripts:
+        return 0
+    vectors = normalize(embedder.embed([script_embedding_input(script) for script in scripts]))
+    vectors_file.write(vectors.astype(np.float32).tobytes())
+    ids_file.write(np.array([script.pk for script in scripts], dtype=np.int64).tobytes())
+    return len(scripts)
+
+
+def related_script_ids(script, k=10):
+    """
+    Ids of the scripts most similar to `script`, best first, as
+    [(script_id, similarity)]. Empty when the index hasn't been built.
+    """
+    index = get_index()
+    if index is None:
+        return []
+    vector = index.vector_for(script.pk)
+    if vector is None:
+        # Not indexed yet (e.g. analysis still running): embed on the fly
+        vector = normalize(get_embedder().embed([script_embedding_input(script)]))[0]
+    return index.query(vector, k=k, exclude_ids=[script.pk])
@@ -1,29 +1,48 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
+from asgiref.sync import sync_to_async
+from django.utils import timezone
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import login, authenticate
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
-from django.http import JsonResponse
+from django.http import (
+    FileResponse, Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse,
+    StreamingHttpResponse,
+)
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
 from django.core.files.storage import default_storage
 from django.contrib import messages
 from .models import *
 from .forms import *
+from .jobs import enqueue_script, enqueue_report_card
+from .pipeline import Stage, run_pipeline
+from .llm_cache import cached_chat_completion, stream_chat_completion
+from .openai_client import get_openai_client, get_async_openai_client
+from .ratelimit import (
+    LLMOverloaded, RateLimited, check_student_rate, estimate_tokens, get_rate_limits,
+    llm_has_capacity, rate_limited_response,
+)
+from .uploads import store_script_blob
+from .extraction import REPORT_CARD_MAX_CHARS, extract_tables_from_file, get_document_text
+from .grades import parse_report_card
+from .careers import get_career_scoring_settings, score_careers
+from .page_cache import student_page_cache
+from .pagination import InvalidCursor, keyset_page
+from .metrics import can_read_metrics, get_metrics_settings, record_error, render as render_metrics
+from .profiling import folded_stacks, list_profiles, profile_path
+from .search import search_documents
+from .vector_index import append_scripts, related_script_ids
+from .keyphrases import condense_text, extract_keyphrases, get_keyphrase_settings
+from .chunking import (
+    get_chunked_analysis_settings, group_sections, map_chunks, merge_topics, plan_chunks, CHARS_PER_TOKEN,
+)
 import json
 import os
-from openai import OpenAI
-import docx
-import pdfplumber
 from io import BytesIO
-import re
-
-
-def get_openai_client():
-    """Get OpenAI client with current API key from settings"""
-    api_key = getattr(settings, 'OPENAI_API_KEY', '')
-    if not api_key or api_key == 'your-openai-api-key-here':
-        return None
-    return OpenAI(api_key=api_key)
 
 
 def home(request):
@@ -60,47 +79,94 @@ def register(request):
 
 
 @login_required
+@student_page_cache
 def dashboard(request):
-    student = Student.objects.get(user=request.user)
-    scripts = UploadedScript.objects.filter(student=student)
-    study_plans = StudyPlan.objects.filter(student=student, is_active=True)
-    report_cards = ReportCard.objects.filter(student=student)
-    
-    # Count topics from all scripts
-    topics_count = 0
-    for script in scripts:
-        if script.processed_topics:
-            topics_count += len(script.processed_topics) if isinstance(script.processed_topics, list) else 0
+    # Counters come from one denormalized row instead of scanning every script
+    stats = StudentStats.objects.select_related('student').filter(student__user=request.user).first()
+    if stats is None:
+        stats = StudentStats.rebuild(Student.objects.get(user=request.user))
+    student = stats.student
 
     context = {
         'student': student,
-        'scripts': scripts,
-        'study_plans': study_plans,
-        'report_cards': report_cards,
-        'scripts_count': scripts.count(),
-        'plans_count': study_plans.count(),
-        'reports_count': report_cards.count(),
-        'topics_count': topics_count,
+        # First pages only; the rest load on demand from load_more
+        'scripts': student_list_page('scripts', student),
+        'study_plans': student_list_page('study_plans', student),
+        'report_cards': student_list_page('report_cards', student),
+        'scripts_count': stats.scripts_count,
+        'plans_count': stats.plans_count,
+        'reports_count': stats.reports_count,
+        'topics_count': stats.topics_count,
     }
     return render(request, 'learning_platform/dashboard.html', context)
 
 
 @login_required
+@student_page_cache
 def study_plan(request):
     student = Student.objects.get(user=request.user)
-    study_plans = StudyPlan.objects.filter(student=student, is_active=True)
-    
+
     context = {
-        'study_plans': study_plans,
+        'study_plans': student_list_page('study_plans', student),
     }
     return render(request, 'learning_platform/study_plan.html', context)
 
 
+STUDENT_LISTS = ('scripts', 'study_plans', 'report_cards')
+
+
+def student_list(kind, student):
+    """The queryset behind one of a student's paginated lists and the timestamp it is ordered by"""
+    if kind == 'scripts':
+        return UploadedScript.objects.filter(student=student).defer('extracted_text_compressed'), 'uploaded_at'
+    if kind == 'study_plans':
+        return StudyPlan.objects.filter(student=student, is_active=True).defer('content'), 'created_at'
+    if kind == 'report_cards':
+        latest_recommendation = (CareerRecommendation.objects
+                                 .filter(report_card=OuterRef('pk'))
+                                 .order_by('-created_at')
+                                 .values('pk')[:1])
+        return (ReportCard.objects.filter(student=student)
+                .defer('extracted_text_compressed', 'grades_data')
+                .annotate(recommendation_id=Subquery(latest_recommendation))), 'uploaded_at'
+    raise ValueError(f"Unknown list: {kind}")
+
+
+def student_list_page(kind, student, after=None):
+    queryset, field = student_list(kind, student)
+    return keyset_page(queryset, field, after)
+
+
+@login_required
+@student_page_cache
+def load_more(request, kind):
+    """The next page of one of the dashboard lists, as an HTML fragment"""
+    if kind not in STUDENT_LISTS:
+        raise Http404("Unknown list")
+    student = get_object_or_404(Student, user=request.user)
+    try:
+        page = student_list_page(kind, student, after=request.GET.get('after'))
+    except InvalidCursor as e:
+        return HttpResponseBadRequest(str(e))
+    return render(request, f'learning_platform/fragments/{kind}.html', {kind: page})
+
+
 @login_required
 def ai_chat(request):
     return render(request, 'learning_platform/ai_chat.html')
 
 
+CHAT_MODEL = "gpt-4o-mini"
+CHAT_PARAMS = {"max_tokens": 500, "temperature": 0.7}
+
+
+def chat_messages(user_message):
+    return [
+        {"role": "system", "content": "You are a helpful AI Study Assistant. Help students with their questions about various subjects, explain concepts clearly, provide study tips, and create quiz questions when asked. Be encouraging and supportive."},
+        {"role": "user", "content": user_message}
+    ]
+
+
 @login_required
 @csrf_exempt
 def chatbot(request):
@@ -111,30 +177,97 @@ def chatbot(request):
             if not user_message:
                 return JsonResponse({"error": "No message provided"}, status=400)
 
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "You are a helpful AI Study Assistant. Help students with their questions about various subjects, explain concepts clearly, provide study tips, and create quiz questions when asked. Be encouraging and supportive."},
-                    {"role": "user", "content": user_message}
-                ],
-                max_tokens=500,
-                temperature=0.7
+            client = get_openai_client()
+            if not client:
+                return JsonResponse({"error": "The AI assistant is not configured"}, status=503)
+
+            check_student_rate(request.user.pk, estimate_tokens(user_message, completion_tokens=CHAT_PARAMS["max_tokens"]))
+
+            response = cached_chat_completion(
+                client,
+                model=CHAT_MODEL,
+                messages=chat_messages(user_message),
+                admission_timeout=get_rate_limits()['ADMISSION_TIMEOUT'],
+                **CHAT_PARAMS
             )
 
             return JsonResponse({
-                "reply": response.choices[0].message.content
+                "reply": response
             })
+        except RateLimited as e:
+            return rate_limited_response(e)
         except Exception as e:
             return JsonResponse({"error": str(e)}, status=500)
     
     return JsonResponse({"error": "Invalid request method"}, status=405)
 
 
+def sse_event(data, event=None):
+    """Format one Server-Sent Event"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+@login_required
+@csrf_exempt
+async def chatbot_stream(request):
+    """
+    Streaming version of `chatbot`: relays tokens to the browser as
+    Server-Sent Events while they are generated. Serve the project through
+    school_app.asgi so responses are not buffered.
+    """
+    if request.method != 'POST':
+        return JsonResponse({"error": "Invalid request method"}, status=405)
+
+    user_message = request.POST.get("message")
+    if not user_message:
+        return JsonResponse({"error": "No message provided"}, status=400)
+
+    client = get_async_openai_client()
+    if not client:
+        return JsonResponse({"error": "The AI assistant is not configured"}, status=503)
+
+    user = await request.auser()
+    try:
+        await sync_to_async(check_student_rate)(
+            user.pk, estimate_tokens(user_message, completion_tokens=CHAT_PARAMS["max_tokens"])
+        )
+        # Reject up front rather than opening a stream that can't get a slot
+        if not await sync_to_async(llm_has_capacity)():
+            raise LLMOverloaded('The AI service is busy. Please try again shortly.', 1)
+    except RateLimited as e:
+        return rate_limited_response(e)
+
+    async def event_stream():
+        try:
+            async for delta in stream_chat_completion(
+                client,
+                model=CHAT_MODEL,
+                messages=chat_messages(user_message),
+                **CHAT_PARAMS
+            ):
+                yield sse_event({"delta": delta})
+        except Exception as e:
+            yield sse_event({"error": str(e)}, event="error")
+        yield "data: [DONE]\n\n"
+
+    response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx and similar proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @login_required
 def upload_script(request):
     from .forms import ScriptUploadForm
     
     if request.method == 'POST' and request.FILES.get('script_file'):
+        try:
+            check_student_rate(request.user.pk, SCRIPT_PIPELINE_TOKENS)
+        except RateLimited as e:
+            return upload_rate_limited(request, e, 'upload_script')
+
         student = Student.objects.get(user=request.user)
 
         # Save the uploaded file
@@ -143,177 +276,441 @@ def upload_script(request):
         subject = request.POST.get('subject', '')
         grade_level = request.POST.get('grade_level', '')
 
+        # Byte-identical files (e.g. a shared handout) are stored only once
+        blob = store_script_blob(uploaded_file)
+
         # Create UploadedScript object
         script = UploadedScript.objects.create(
             student=student,
             title=title,
-            file=uploaded_file,
+            file=blob.file.name,
+            blob=blob,
             subject=subject,
             grade_level=grade_level
         )
 
-        # Process the script to extract topics and identify challenging areas
-        process_uploaded_script(script)
+        # Queue the script so topics, memorandum and study plan are generated
+        # by the background workers instead of blocking this request
+        job = enqueue_script(script)
 
-        messages.success(request, 'Script uploaded and processed successfully!')
+        if wants_json(request):
+            return job_accepted_response(job)
+        messages.success(request, 'Script uploaded! It is being processed and will appear shortly.')
         return redirect('dashboard')
 
     form = ScriptUploadForm()
     return render(request, 'learning_platform/upload_script.html', {'form': form})
 
 
+# Rough LLM token cost of processing one upload, charged to the student's
+# token bucket when the file is accepted
+SCRIPT_PIPELINE_TOKENS = 5000
+REPORT_CARD_TOKENS = 600
+
+
+def upload_rate_limited(request, exc, retry_view):
+    if wants_json(request):
+        return rate_limited_response(exc)
+    messages.error(request, f'{exc} Please try again in {exc.retry_after} seconds.')
+    return redirect(retry_view)
+
+
+def wants_json(request):
+    """True for AJAX/API clients that want a job id instead of a redirect"""
+    return (request.headers.get('x-requested-with') == 'XMLHttpRequest'
+            or 'application/json' in request.headers.get('accept', ''))
+
+
+def job_accepted_response(job):
+    return JsonResponse({
+        'job_id': str(job.job_id),
+        'status': job.status,
+        'status_url': reverse('job_status', args=[job.job_id]),
+    }, status=202)
+
+
+@login_required
+def job_status(request, job_id):
+    job = get_object_or_404(ProcessingJob, job_id=job_id, student__user=request.user)
+
+    data = {
+        'job_id': str(job.job_id),
+        'kind': job.kind,
+        'status': job.status,
+        'attempts': job.attempts,
+        'created_at': job.created_at.isoformat(),
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'timings': job.timings,
+    }
+    if job.status == ProcessingJob.STATUS_DONE:
+        if job.script_id:
+            data['result_url'] = reverse('view_memorandum', args=[job.script_id])
+        elif job.report_card_id:
+            career_rec = CareerRecommendation.objects.filter(report_card_id=job.report_card_id).first()
+            if career_rec:
+                data['result_url'] = reverse('view_career_recommendations', args=[career_rec.id])
+    elif job.status == ProcessingJob.STATUS_FAILED:
+        data['error'] = 'Processing failed. Please try uploading the file again.'
+    return JsonResponse(data)
+
+
 def process_uploaded_script(script):
     """
     Process the uploaded script to extract topics and identify challenging areas
-    using AI analysis
+    using AI analysis. Independent stages run concurrently; returns the
+    per-stage timings in seconds.
     """
+    student = script.student
+    blob = script.blob
+    # Stages that fell back to a local or placeholder result instead of an
+    # LLM answer; such an analysis is not shared with later uploads
+    fallbacks = set()
+    # Page count, workers and per-page seconds when a PDF is parsed
+    extract_stats = {}
+
+    if blob and blob.is_analyzed:
+        # The same file was already analyzed for another upload: reuse the
+        # topics and memorandum and only build this student's study plan
+        stages = [
+            Stage('topics', lambda: blob.processed_topics),
+            Stage('challenging', lambda: blob.challenging_topics),
+            Stage('memorandum', lambda: blob.memorandum),
+        ]
+    else:
+        stages = [
+            # Extract text from the uploaded file
+            Stage('extract', lambda: get_document_text(script, stats=extract_stats)),
+            # Long documents: analyze each chunk separately (None for short ones)
+            Stage('chunks', lambda text: analyze_document_chunks(text, fallbacks), deps=['extract']),
+            # Use AI to analyze the content and identify topics
+            Stage('topics', lambda text, chunks: (
+                merge_chunk_topics(chunks) if chunks else analyze_document_topics(text, fallbacks)
+            ), deps=['extract', 'chunks']),
+            # Identify potentially challenging topics based on complexity
+            Stage('challenging', lambda topics, text, chunks: (
+                identify_challenging_topics(topics, chunk_digest(chunks), condensed=True, fallbacks=fallbacks)
+                if chunks else identify_challenging_topics(topics, text, fallbacks=fallbacks)
+            ), deps=['topics', 'extract', 'chunks']),
+            # Generate a memorandum for the script (independent of challenging topics)
+            Stage('memorandum', lambda text, topics, chunks: (
+                merge_memorandum_sections(chunks, topics, fallbacks) if chunks
+                else generate_memorandum(text, topics, fallbacks)
+            ), deps=['extract', 'topics', 'chunks']),
+        ]
+    # Generate a study plan based on challenging topics
+    stages.append(Stage('study_plan', lambda challenging: generate_study_plan(student, challenging),
+                        deps=['challenging']))
+
     try:
-        # Extract text from the uploaded file
-        text_content = extract_text_from_file(script.file.path)
+        results, timings = run_pipeline(stages, max_workers=getattr(settings, 'PIPELINE_MAX_WORKERS', 3))
+        if extract_stats:
+            timings['extract_pages'] = extract_stats
+
+        script.processed_topics = results['topics']
+        script.challenging_topics = results['challenging']
+        # A requeued job (worker crash, or a run past JOB_STALE_AFTER) processes
+        # the script again: replace its memorandum, and only add a study plan
+        # the first time
+        with transaction.atomic():
+            _, created = Memorandum.objects.update_or_create(
+                script=script, defaults={'content': results['memorandum']},
+            )
+            script.save()
+            if created:
+                results['study_plan'].save()
 
-        # Use AI to analyze the content and identify topics
-        topics = analyze_document_topics(text_content)
-        script.processed_topics = topics
+        try:
+            append_scripts([script])
+        except Exception as e:
+            # Related material is a nice-to-have; never fail the upload over it
+            print(f"Error updating related-material index: {str(e)}")
+            record_error('related_index', e)
+
+        if blob and not blob.is_analyzed and not fallbacks:
+            DocumentBlob.objects.filter(pk=blob.pk, analyzed_at__isnull=True).update(
+                processed_topics=results['topics'],
+                challenging_topics=results['challenging'],
+                memorandum=results['memorandum'],
+                analyzed_at=timezone.now(),
+            )
+        return timings
+    except Exception as e:
+        print(f"Error processing script: {str(e)}")
+        record_error('process_script', e)
+        raise
 
-        # Identify potentially challenging topics based on complexity
-        challenging_topics = identify_challenging_topics(topics, text_content)
-        script.challenging_topics = challenging_topics
 
-        # Generate a memorandum for the script
-        memorandum_content = generate_memorandum(text_content, topics)
-        Memorandum.objects.create(script=script, content=memorandum_content)
+def note_fallback(fallbacks, stage):
+    """Record in `fallbacks` (when given) that `stage` did not get an LLM answer"""
+    if fallbacks is not None:
+        fallbacks.add(stage)
+
+
+def analyze_document_chunks(content, fallbacks=None):
+    """
+    Map step for documents too long for a single prompt: split the text into
+    token-budgeted chunks and analyze them concurrently. Returns a list of
+    {"topics": [...], "summary": "..."} dicts, or None when the document fits
+    in one request (or no API key is available).
+    """
+    if not get_openai_client():
+        return None
+    chunks = plan_chunks(content)
+    if not chunks:
+        return None
+    results = map_chunks(analyze_chunk, chunks)
+    if not all(results):
+        note_fallback(fallbacks, 'chunks')
+    results = [result for result in results if result]
+    return results or None
 
-        # Generate a study plan based on challenging topics
-        generate_study_plan(script.student, challenging_topics)
 
-        script.save()
+def analyze_chunk(chunk):
+    """
+    Use AI to extract the topics and a short summary of one part of a document
+    """
+    client = get_openai_client()
+    try:
+        response = cached_chat_completion(
+            client,
+            model="gpt-3.5-turbo",
+            messages=[
+                {"role": "system", "content": "You are a helpful assistant that analyzes one part of a longer educational document. List the main topics covered, one per line starting with '- '. Then write a line 'SUMMARY:' followed by a short summary of this part."},
+                {"role": "user", "content": chunk}
+            ],
+            max_tokens=350,
+            temperature=0.3
+        )
+
+        topics_str, _, summary = response.strip().partition('SUMMARY:')
+        topics = [topic.strip('- ') for topic in topics_str.split('\n') if topic.strip()]
+        return {"topics": topics, "summary": summary.strip()}
     except Exception as e:
-        print(f"Error processing script: {str(e)}")
+        print(f"Error analyzing document chunk: {str(e)}")
+        record_error('analyze_chunk', e)
+        return None
+
+
+def merge_chunk_topics(chunk_results):
+    """
+    Reduce step: combine per-chunk topics into one ranked, de-duplicated list
+    """
+    return merge_topics([result["topics"] for result in chunk_results])
+
+
+def chunk_digest(chunk_results):
+    """
+    The chunk summaries in document order, standing in for the full text
+    """
+    return "\n\n".join(result["summary"] for result in chunk_results if result["summary"])
+
+
+def merge_memorandum_sections(chunk_results, topics, fallbacks=None):
+    """
+    Reduce step: merge the per-chunk summaries into a single memorandum
+    """
+    sections = chunk_digest(chunk_results)
+    client = get_openai_client()
+    if not client or not sections:
+        note_fallback(fallbacks, 'memorandum')
+        return sections or f"This memorandum summarizes the key topics: {', '.join(topics[:5])}."
+
+    # Keep the prompt within one chunk budget by merging summaries in groups first
+    max_chars = get_chunked_analysis_settings()['CHUNK_TOKENS'] * CHARS_PER_TOKEN
+    if len(sections) > max_chars:
+        sections = reduce_sections([result["summary"] for result in chunk_results if result["summary"]],
+                                   max_chars, fallbacks)
+    try:
+        response = cached_chat_completion(
+            client,
+            model="gpt-3.5-turbo",
+            messages=[
+                {"role": "system", "content": "You are an educational assistant that creates concise memorandums summarizing educational content."},
+                {"role": "user", "content": f"These are summaries of consecutive parts of one document. Merge them into a single concise memorandum focusing on these key topics: {topics}. Summaries:\n\n{sections}"}
+            ],
+            max_tokens=500,
+            temperature=0.4
+        )
+
+        return response.strip()
+    except Exception as e:
+        print(f"Error merging memorandum sections: {str(e)}")
+        record_error('merge_memorandum', e)
+        note_fallback(fallbacks, 'memorandum')
+        return sections
 
 
-def extract_text_from_file(file_path):
+def reduce_sections(sections, max_chars, fallbacks=None):
     """
-    Extract text from various file formats (PDF, DOCX, TXT)
+    Merge consecutive summaries level by level, each group that fits in one
+    prompt into one summary, until all of them fit in `max_chars`
     """
-    text = ""
+    while len("\n\n".join(sections)) > max_chars:
+        groups = group_sections(sections, max_chars)
+        if len(groups) >= len(sections):
+            break
+        sections = map_chunks(lambda group: condense_sections(group, fallbacks), groups)
+    return "\n\n".join(sections)[:max_chars]
+
 
-    if file_path.endswith('.pdf'):
-        with pdfplumber.open(file_path) as pdf:
-            for page in pdf.pages:
-                text += page.extract_text() or ""
-    elif file_path.endswith('.docx'):
-        doc = docx.Document(file_path)
-        for para in doc.paragraphs:
-            text += para.text + "\n"
-    elif file_path.endswith('.txt'):
-        with open(file_path, 'r', encoding='utf-8') as f:
-            text = f.read()
+def condense_sections(sections, fallbacks=None):
+    """
+    Use AI to condense summaries of consecutive parts of a document into one
+    """
+    joined = "\n\n".join(sections)
+    client = get_openai_client()
+    try:
+        response = cached_chat_completion(
+            client,
+            model="gpt-3.5-turbo",
+            messages=[
+                {"role": "system", "content": "You are an educational assistant that condenses summaries of educational content."},
+                {"role": "user", "content": f"These are summaries of consecutive parts of one document. Condense them into one summary that keeps every key point, in order:\n\n{joined}"}
+            ],
+            max_tokens=500,
+            temperature=0.3
+        )
 
-    return text
+        return response.strip()
+    except Exception as e:
+        print(f"Error condensing memorandum sections: {str(e)}")
+        record_error('condense_sections', e)
+        note_fallback(fallbacks, 'memorandum')
+        return joined
 
 
-def analyze_document_topics(content):
+def prompt_excerpt(content, limit):
+    """
+    The part of `content` to send to the LLM: with the key phrase pre-pass
+    on, the most relevant paragraphs that fit in `limit` characters rather
+    than just the first `limit` characters
+    """
+    if limit is None or len(content) <= limit:
+        return content
+    if get_keyphrase_settings()['PREPASS']:
+        return condense_text(content, limit)
+    return content[:limit]
+
+
+def prompt_chars():
+    """Characters of a document sent in a single prompt; longer ones are chunked"""
+    return get_chunked_analysis_settings()['PROMPT_CHARS']
+
+
+def analyze_document_topics(content, fallbacks=None):
     """
     Use AI to analyze document content and extract topics
     """
     client = get_openai_client()
     if not client:
-        # Return a basic topic extraction if no API key is available
-        # This is a fallback for demonstration purposes
-        words = content.split()
-        # Simple keyword extraction - in a real app, use proper NLP
-        keywords = [word for word in set(words) if len(word) > 5 and word.isalpha()]
-        return keywords[:10]  # Return top 10 keywords
+        # No API key: rank key phrases locally with TF-IDF
+        note_fallback(fallbacks, 'topics')
+        return extract_keyphrases(content, top_k=10)
 
     try:
-        response = client.chat.completions.create(
+        response = cached_chat_completion(
+            client,
             model="gpt-3.5-turbo",
             messages=[
                 {"role": "system", "content": "You are a helpful assistant that identifies key topics in educational documents. Extract the main topics covered in the following content."},
-                {"role": "user", "content": f"Identify the main topics in this educational content: {content[:4000]}"}  # Limit content length
+                {"role": "user", "content": f"Identify the main topics in this educational content: {prompt_excerpt(content, prompt_chars())}"}  # Limit content length
             ],
             max_tokens=200,
             temperature=0.3
         )
 
-        topics_str = response.choices[0].message.content.strip()
+        topics_str = response.strip()
         # Parse the response to extract topics
         topics = [topic.strip('- ') for topic in topics_str.split('\n') if topic.strip()]
         return topics
     except Exception as e:
         print(f"Error calling OpenAI API: {str(e)}")
+        record_error('analyze_topics', e)
+        note_fallback(fallbacks, 'topics')
         return []
 
 
-def identify_challenging_topics(topics, content):
+def identify_challenging_topics(topics, content, condensed=False, fallbacks=None):
     """
-    Identify topics that might be challenging for the student
+    Identify topics that might be challenging for the student. Pass
+    condensed=True when `content` is already condensed (chunk summaries)
+    rather than the document text.
     """
     client = get_openai_client()
     if not client:
         # Fallback for demo purposes
+        note_fallback(fallbacks, 'challenging')
         return topics[:3]  # Return first 3 topics as challenging
 
     try:
-        response = client.chat.completions.create(
+        response = cached_chat_completion(
+            client,
             model="gpt-3.5-turbo",
             messages=[
                 {"role": "system", "content": "You are an educational assistant that identifies complex or challenging topics in educational content."},
-                {"role": "user", "content": f"Based on this educational content, identify which of these topics might be most challenging for a student: {topics}. Content: {content[:3000]}"}
+                {"role": "user", "content": f"Based on this educational content, identify which of these topics might be most challenging for a student: {topics}. Content: {content if condensed else prompt_excerpt(content, prompt_chars())}"}
             ],
             max_tokens=150,
             temperature=0.3
         )
 
-        challenging_str = response.choices[0].message.content.strip()
+        challenging_str = response.strip()
         # Parse the response to extract challenging topics
         challenging_topics = [topic.strip('- ') for topic in challenging_str.split('\n') if topic.strip() and any(t.lower() in challenging_str.lower() for t in topics)]
         return challenging_topics if challenging_topics else topics[:2]
     except Exception as e:
         print(f"Error identifying challenging topics: {str(e)}")
+        record_error('challenging_topics', e)
+        note_fallback(fallbacks, 'challenging')
         return topics[:2]
 
 
-def generate_memorandum(content, topics):
+def generate_memorandum(content, topics, fallbacks=None):
     """
     Generate a memorandum for the uploaded script
     """
     client = get_openai_client()
     if not client:
         # Fallback for demo purposes
+        note_fallback(fallbacks, 'memorandum')
         return f"This memorandum summarizes the key topics: {', '.join(topics[:5])}."
 
     try:
-        response = client.chat.completions.create(
+        response = cached_chat_completion(
+            client,
             model="gpt-3.5-turbo",
             messages=[
                 {"role": "system", "content": "You are an educational assistant that creates concise memorandums summarizing educational content."},
-                {"role": "user", "content": f"Create a concise memorandum summarizing this educational content focusing on these key topics: {topics}. Content: {content[:4000]}"}
+                {"role": "user", "content": f"Create a concise memorandum summarizing this educational content focusing on these key topics: {topics}. Content: {prompt_excerpt(content, prompt_chars())}"}
             ],
             max_tokens=300,
             temperature=0.4
         )
 
-        return response.choices[0].message.content.strip()
+        return response.strip()
     except Exception as e:
         print(f"Error generating memorandum: {str(e)}")
+        record_error('memorandum', e)
+        note_fallback(fallbacks, 'memorandum')
         return f"Memorandum for topics: {', '.join(topics[:5])}"
 
 
 def generate_study_plan(student, challenging_topics):
     """
-    Generate a personalized study plan based on challenging topics
+    Generate a personalized study plan based on challenging topics. Returns
+    the plan unsaved; the caller saves it with the rest of the results.
     """
     client = get_openai_client()
     if not client or not challenging_topics:
         # Create a basic study plan for demo purposes
         plan_title = f"Study Plan for {', '.join(challenging_topics[:3])}"
         plan_content = f"Focus on these challenging topics: {', '.join(challenging_topics)}. Spend extra time practicing problems related to these concepts."
-        StudyPlan.objects.create(student=student, title=plan_title, content=plan_content)
-        return
+        return StudyPlan(student=student, title=plan_title, content=plan_content)
 
     try:
-        response = client.chat.completions.create(
+        response = cached_chat_completion(
+            client,
             model="gpt-3.5-turbo",
             messages=[
                 {"role": "system", "content": "You are an educational advisor that creates personalized study plans focusing on challenging topics."},
@@ -323,16 +720,17 @@ def generate_study_plan(student, challenging_topics):
             temperature=0.5
         )
 
-        plan_content = response.choices[0].message.content.strip()
+        plan_content = response.strip()
         plan_title = f"Personalized Study Plan for {student.user.username}"
 
-        StudyPlan.objects.create(student=student, title=plan_title, content=plan_content)
+        return StudyPlan(student=student, title=plan_title, content=plan_content)
     except Exception as e:
         print(f"Error generating study plan: {str(e)}")
+        record_error('study_plan', e)
         # Create a basic study plan as fallback
         plan_title = f"Study Plan for {', '.join(challenging_topics[:3])}"
         plan_content = f"Focus on these challenging topics: {', '.join(challenging_topics)}. Spend extra time practicing problems related to these concepts."
-        StudyPlan.objects.create(student=student, title=plan_title, content=plan_content)
+        return StudyPlan(student=student, title=plan_title, content=plan_content)
 
 
 @login_required
@@ -340,6 +738,11 @@ def upload_report_card(request):
     from .forms import ReportCardUploadForm
     
     if request.method == 'POST' and request.FILES.get('report_card_file'):
+        try:
+            check_student_rate(request.user.pk, REPORT_CARD_TOKENS)
+        except RateLimited as e:
+            return upload_rate_limited(request, e, 'upload_report_card')
+
         student = Student.objects.get(user=request.user)
 
         # Save the uploaded file
@@ -355,10 +758,12 @@ def upload_report_card(request):
             term=term
         )
 
-        # Process the report card to extract grades and recommend careers
-        process_report_card(report_card)
+        # Queue the report card for grade extraction and career recommendations
+        job = enqueue_report_card(report_card)
 
-        messages.success(request, 'Report card uploaded and processed successfully!')
+        if wants_json(request):
+            return job_accepted_response(job)
+        messages.success(request, 'Report card uploaded! Your career recommendations are being prepared.')
         return redirect('dashboard')
 
     form = ReportCardUploadForm()
@@ -370,11 +775,12 @@ def process_report_card(report_card):
     Process the uploaded report card to extract grades and recommend careers
     """
     try:
-        # Extract text from the uploaded file
-        text_content = extract_text_from_file(report_card.file.path)
+        # Extract text from the uploaded file (reusing stored text if present)
+        text_content = get_document_text(report_card, max_chars=REPORT_CARD_MAX_CHARS)
 
-        # Extract grades data from the report card
-        grades_data = extract_grades_from_text(text_content)
+        # Extract grades data from the report card, preferring its tables
+        tables = extract_tables_from_file(report_card.file.path)
+        grades_data = extract_grades_from_text(text_content, tables)
         report_card.grades_data = grades_data
 
         # Generate career recommendations based on grades
@@ -392,87 +798,135 @@ def process_report_card(report_card):
         report_card.save()
     except Exception as e:
         print(f"Error processing report card: {str(e)}")
+        record_error('process_report_card', e)
+        raise
 
 
-def extract_grades_from_text(content):
+def extract_grades_from_text(content, tables=None):
     """
-    Extract grades from report card text
+    Extract grades from report card text (and any tables pdfplumber found
+    in it) as {subject: score out of 100}. See grades.py.
     """
-    # Simple regex to extract subject-grade pairs
-    # This is a simplified version - real implementation would need more robust parsing
-    pattern = r'([A-Za-z\s]+?)\s*:?\s*([A-D][+-]?|F|[0-9]{1,3}%|[0-9]{1,3})'
-    matches = re.findall(pattern, content, re.IGNORECASE)
+    return parse_report_card(content, tables)
 
-    grades = {}
-    for match in matches:
-        subject = match[0].strip()
-        grade = match[1].strip()
-        if subject and grade:
-            grades[subject] = grade
 
-    return grades
+def generate_career_recommendations(grades_data):
+    """
+    Generate career recommendations based on grades. Scoring is local (see
+    careers.py); with CAREER_SCORING['LLM_ENRICHMENT'] on, the LLM may
+    re-order the shortlist and suggest one more career.
+    """
+    recommendations = score_careers(grades_data)
+    if recommendations['careers'] and get_career_scoring_settings()['LLM_ENRICHMENT']:
+        recommendations['careers'] = enrich_career_shortlist(grades_data, recommendations['careers'])
+    return recommendations
 
 
-def generate_career_recommendations(grades_data):
+def enrich_career_shortlist(grades_data, careers):
     """
-    Generate career recommendations based on grades
+    Ask the LLM to re-rank the locally scored careers. Falls back to the
+    local order if there is no client or the reply can't be used.
     """
     client = get_openai_client()
-    if not client or not grades_data:
-        # Fallback for demo purposes
-        return {
-            'careers': ['Teacher', 'Engineer', 'Doctor'],
-            'strengths': ['Mathematics', 'Science'],
-            'areas_for_improvement': ['Writing', 'History']
-        }
+    if not client:
+        return careers
 
     try:
         subjects_grades = ', '.join([f"{subject}: {grade}" for subject, grade in grades_data.items()])
+        shortlist = "\n".join(careers)
 
-        response = client.chat.completions.create(
+        response = cached_chat_completion(
+            client,
             model="gpt-3.5-turbo",
             messages=[
-                {"role": "system", "content": "You are a career counselor that recommends careers based on academic performance and identifies strengths and areas for improvement."},
-                {"role": "user", "content": f"Based on these academic results: {subjects_grades}, recommend suitable careers, identify strengths, and suggest areas for improvement."}
+                {"role": "system", "content": "You are a career counselor that recommends careers based on academic performance."},
+                {"role": "user", "content": f"Academic results: {subjects_grades}\n\nShortlisted careers:\n{shortlist}\n\nList the shortlisted careers from most to least suitable, one per line with no numbering or explanation. You may add one career that is not on the shortlist."}
             ],
-            max_tokens=400,
-            temperature=0.5
+            max_tokens=150,
+            temperature=0.3
         )
 
-        analysis = response.choices[0].message.content.strip()
-
-        # This is a simplified parsing - in a real app, you'd want more sophisticated parsing
-        careers = ["Software Developer", "Data Analyst", "Teacher"]  # Placeholder
-        strengths = ["Mathematics", "Science"]  # Placeholder
-        areas_for_improvement = ["Writing", "Communication"]  # Placeholder
-
-        return {
-            'careers': careers,
-            'strengths': strengths,
-            'areas_for_improvement': areas_for_improvement
-        }
+        ranked = []
+        for line in response.splitlines():
+            career = line.strip().lstrip('-*0123456789.) ').strip()
+            if career and career not in ranked:
+                ranked.append(career)
+        # Keep the local results if the reply dropped most of the shortlist
+        if len(set(ranked) & set(careers)) < len(careers) // 2 + 1:
+            return careers
+        return ranked[:len(careers) + 1]
     except Exception as e:
-        print(f"Error generating career recommendations: {str(e)}")
-        return {
-            'careers': ['Teacher', 'Engineer', 'Doctor'],
-            'strengths': ['Mathematics', 'Science'],
-            'areas_for_improvement': ['Writing', 'History']
-        }
+        print(f"Error enriching career recommendations: {str(e)}")
+        record_error('career_enrichment', e)
+        return careers
 
 
 @login_required
+@student_page_cache
 def view_memorandum(request, script_id):
     script = get_object_or_404(UploadedScript, id=script_id, student__user=request.user)
-    memorandum = get_object_or_404(Memorandum, script=script)
+    # Scripts processed twice before processing was idempotent have two
+    memorandum = Memorandum.objects.filter(script=script).order_by('-created_at', '-pk').first()
+    if memorandum is None:
+        raise Http404("No memorandum yet")
+
+    related_scripts, related_memorandums = related_material(script)
 
     context = {
         'script': script,
         'memorandum': memorandum,
+        'related_scripts': related_scripts,
+        'related_memorandums': related_memorandums,
     }
     return render(request, 'learning_platform/view_memorandum.html', context)
 
 
+RELATED_MIN_SIMILARITY = 0.2
+
+
+def related_material(script, limit=5):
+    """
+    The student's own scripts most similar to this one, and other students'
+    memorandums on the same material (one per distinct file)
+    """
+    try:
+        neighbours = related_script_ids(script, k=limit * 4)
+    except Exception as e:
+        print(f"Error finding related material: {str(e)}")
+        record_error('related_material', e)
+        return [], []
+    ids = [script_id for script_id, similarity in neighbours if similarity >= RELATED_MIN_SIMILARITY]
+    scripts = UploadedScript.objects.defer('extracted_text_compressed').in_bulk(ids)
+
+    # Copies of the same file (including this one) are only listed once
+    seen_files = {script.blob_id}
+    related_scripts = []
+    other_ids = []
+    for script_id in ids:
+        other = scripts.get(script_id)
+        if other is None or (other.blob_id and other.blob_id in seen_files):
+            continue
+        if other.student_id == script.student_id:
+            seen_files.add(other.blob_id)
+            related_scripts.append(other)
+        else:
+            other_ids.append(script_id)
+
+    latest = {}
+    for memo in Memorandum.objects.filter(script_id__in=other_ids).select_related('script').order_by('created_at'):
+        latest[memo.script_id] = memo
+    related_memorandums = []
+    for script_id in other_ids:
+        memo = latest.get(script_id)
+        if memo is None or (memo.script.blob_id and memo.script.blob_id in seen_files):
+            continue
+        seen_files.add(memo.script.blob_id)
+        related_memorandums.append(memo)
+    return related_scripts[:limit], related_memorandums[:limit]
+
+
 @login_required
+@student_page_cache
 def view_study_plan(request, plan_id):
     study_plan = get_object_or_404(StudyPlan, id=plan_id, student__user=request.user)
 
@@ -482,6 +936,37 @@ def view_study_plan(request, plan_id):
     return render(request, 'learning_platform/view_study_plan.html', context)
 
 
+@login_required
+def search(request):
+    """Ranked full-text search over the student's scripts, memorandums and study plans"""
+    query = request.GET.get('q', '').strip()[:200]
+    try:
+        page = max(1, int(request.GET.get('page', 1)))
+    except ValueError:
+        page = 1
+
+    student_id = Student.objects.filter(user=request.user).values_list('pk', flat=True).first()
+    results, has_next = search_documents(student_id, query, page) if student_id else ([], False)
+
+    if wants_json(request):
+        return JsonResponse({
+            'query': query,
+            'page': page,
+            'has_next': has_next,
+            'results': [result.as_dict() for result in results],
+        })
+
+    context = {
+        'query': query,
+        'results': results,
+        'page': page,
+        'has_next': has_next,
+        'previous_page': page - 1 if page > 1 else None,
+        'next_page': page + 1 if has_next else None,
+    }
+    return render(request, 'learning_platform/search.html', context)
+
+
 @login_required
 def view_career_recommendations(request, rec_id):
     career_rec = get_object_or_404(CareerRecommendation, id=rec_id, student__user=request.user)
@@ -490,3 +975,41 @@ def view_career_recommendations(request, rec_id):
         'career_rec': career_rec,
     }
     return render(request, 'learning_platform/view_career_recommendations.html', context)
+
+
+def metrics(request):
+    """
+    Prometheus metrics of every process on this host. Readable by staff
+    users, with METRICS['TOKEN'] as a bearer token, and by the addresses in
+    METRICS['ALLOWED_IPS'].
+    """
+    if not get_metrics_settings()['ENABLED']:
+        raise Http404
+    if not can_read_metrics(request):
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@staff_member_required
+def profiles(request):
+    """Stored request profiles (see learning_platform/profiling.py), newest first"""
+    return render(request, 'learning_platform/profiles.html', {
+        'profiles': list_profiles(limit=500),
+        'title': 'Request profiles',
+    })
+
+
+@staff_member_required
+def download_profile(request, name, kind):
+    """A stored profile as JSON, cProfile data (.prof) or folded stacks"""
+    if kind == 'folded':
+        stacks = folded_stacks(name)
+        if stacks is None:
+            raise Http404
+        response = HttpResponse(stacks, content_type='text/plain; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{name}.folded"'
+        return response
+    path = profile_path(name, kind)
+    if path is None:
+        raise Http404
+    return FileResponse(open(path, 'rb'), as_attachment=kind == 'prof', filename=f"{name}.{kind}")
@@ -43,6 +43,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'learning_platform.metrics.MetricsMiddleware',
+    'learning_platform.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -83,6 +85,71 @@ DATABASES = {
     }
 }
 
+# SQLite production profile: the web server and the job workers write to
+# the same file, so use write-ahead logging (readers don't block the writer),
+# wait for locks instead of failing with "database is locked", and start
+# write transactions with BEGIN IMMEDIATE so they queue on the busy timeout
+# instead of failing on lock upgrade. Pragmas are applied to every new
+# connection. Compare with SQLITE_PROFILE=default using
+# `python manage.py benchmark_sqlite_writes`.
+SQLITE_PROFILE = os.environ.get('SQLITE_PROFILE', 'production')
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    # Durable at each checkpoint rather than each commit; safe with WAL
+    'synchronous': 'NORMAL',
+    # Negative values are KiB
+    'cache_size': -int(os.environ.get('SQLITE_CACHE_SIZE_KB', 20000)),
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 20000)),
+    'temp_store': 'MEMORY',
+}
+
+if SQLITE_PROFILE == 'production' and DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    DATABASES['default']['OPTIONS'] = {
+        'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+        'transaction_mode': 'IMMEDIATE',
+    }
+    # Reuse connections between requests (set 0 when serving through ASGI)
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', 600))
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+
+# Caches
+# The "llm" and "pages" caches live in SQLite so they are shared between
+# processes. Create their tables with `python manage.py createcachetable`.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'llm': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'llm_response_cache',
+        'TIMEOUT': 60 * 60 * 24 * 7,
+        'OPTIONS': {
+            'MAX_ENTRIES': 50000,
+        },
+    },
+    # Per-student rendered pages and their version tokens (see
+    # learning_platform/page_cache.py); must be shared by web and worker processes
+    'pages': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'page_cache',
+        'TIMEOUT': 60 * 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 20000,
+        },
+    },
+    # Rate limit buckets and the OpenAI concurrency count when RATE_LIMITS
+    # BACKEND is 'cache'; must be shared by all worker processes (prefer Redis
+    # or Memcached, which have atomic incr)
+    'ratelimit': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'ratelimit_cache',
+        'TIMEOUT': 60 * 60,
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -128,5 +195,123 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Hash uploads while they stream in so duplicate files can be detected
+FILE_UPLOAD_HANDLERS = [
+    'learning_platform.uploads.HashingMemoryFileUploadHandler',
+    'learning_platform.uploads.HashingTemporaryFileUploadHandler',
+]
+
 # OpenAI Configuration
 OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY', 'your-openai-api-key-here')
+
+# Shared OpenAI client (see learning_platform/openai_client.py). Connections are
+# kept alive and reused across calls; timeouts are in seconds.
+OPENAI_TIMEOUT = float(os.environ.get('OPENAI_TIMEOUT', 60))
+OPENAI_CONNECT_TIMEOUT = float(os.environ.get('OPENAI_CONNECT_TIMEOUT', 5))
+OPENAI_MAX_CONNECTIONS = int(os.environ.get('OPENAI_MAX_CONNECTIONS', 20))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get('OPENAI_MAX_KEEPALIVE_CONNECTIONS', 10))
+OPENAI_MAX_RETRIES = int(os.environ.get('OPENAI_MAX_RETRIES', 2))
+# Another OpenAI-compatible API, e.g. the load-test stub: http://127.0.0.1:8001/v1
+OPENAI_BASE_URL = os.environ.get('OPENAI_BASE_URL', '')
+
+# Background processing (see `python manage.py run_workers`)
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 4))
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 1.0))
+JOB_STALE_AFTER = int(os.environ.get('JOB_STALE_AFTER', 900))
+
+# Maximum number of pipeline stages (LLM calls) run concurrently per upload
+PIPELINE_MAX_WORKERS = int(os.environ.get('PIPELINE_MAX_WORKERS', 3))
+
+# Documents longer than PROMPT_CHARS, the excerpt a single prompt sends,
+# are analyzed in chunks of CHUNK_TOKENS and the results merged (see
+# learning_platform/chunking.py). MAX_CHUNKS and MAX_TOKENS_PER_DOCUMENT
+# bound the cost of a single huge upload.
+CHUNKED_ANALYSIS = {
+    'ENABLED': os.environ.get('CHUNKED_ANALYSIS_ENABLED', '1') == '1',
+    'PROMPT_CHARS': int(os.environ.get('CHUNK_PROMPT_CHARS', 4000)),
+    'CHUNK_TOKENS': int(os.environ.get('CHUNK_TOKENS', 3000)),
+    'MAX_CHUNKS': int(os.environ.get('CHUNK_MAX_CHUNKS', 16)),
+    'MAX_TOKENS_PER_DOCUMENT': int(os.environ.get('CHUNK_MAX_TOKENS_PER_DOCUMENT', 48000)),
+    'MAX_CONCURRENCY': int(os.environ.get('CHUNK_MAX_CONCURRENCY', 4)),
+}
+
+# Local TF-IDF key phrase extraction (see learning_platform/keyphrases.py):
+# the topic fallback without an API key, and with PREPASS a filter that picks
+# the most relevant paragraphs to send to the LLM
+KEYPHRASES = {
+    'PREPASS': os.environ.get('KEYPHRASE_PREPASS', '1') == '1',
+    'MAX_NGRAM': 3,
+    'MAX_TERMS': 200000,
+}
+
+# Related-material index (see learning_platform/vector_index.py). BACKEND is
+# 'hashing' (local, no network) or 'openai'; after changing BACKEND or
+# DIMENSIONS run `python manage.py rebuild_vector_index`.
+VECTOR_INDEX = {
+    'BACKEND': os.environ.get('VECTOR_INDEX_BACKEND', 'hashing'),
+    'PATH': os.environ.get('VECTOR_INDEX_PATH', BASE_DIR / 'vector_index'),
+    'DIMENSIONS': int(os.environ.get('VECTOR_INDEX_DIMENSIONS', 512)),
+}
+
+# Career recommendations are scored locally from report card grades (see
+# learning_platform/careers.py). AFFINITY_FILE defaults to
+# learning_platform/data/career_affinity.json; LLM_ENRICHMENT lets the LLM
+# re-order the local shortlist.
+CAREER_SCORING = {
+    'AFFINITY_FILE': os.environ.get('CAREER_AFFINITY_FILE') or None,
+    'TOP_CAREERS': int(os.environ.get('CAREER_TOP_CAREERS', 5)),
+    'LLM_ENRICHMENT': os.environ.get('CAREER_LLM_ENRICHMENT', '0') == '1',
+}
+
+# OpenAI response cache (see learning_platform/llm_cache.py)
+LLM_CACHE = {
+    'ENABLED': os.environ.get('LLM_CACHE_ENABLED', '1') == '1',
+    'TTL': int(os.environ.get('LLM_CACHE_TTL', 60 * 60 * 24 * 7)),
+    'MAX_ENTRIES': int(os.environ.get('LLM_CACHE_MAX_ENTRIES', 1024)),
+}
+
+# PDF extraction: PDFs with at least PDF_PARALLEL_MIN_PAGES pages are split
+# across a pool of PDF_EXTRACT_WORKERS processes (default: one per CPU)
+PDF_EXTRACT_WORKERS = int(os.environ.get('PDF_EXTRACT_WORKERS', 0)) or None
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get('PDF_PARALLEL_MIN_PAGES', 20))
+
+# Prometheus metrics at /metrics (see learning_platform/metrics.py). Each
+# process writes its totals to PATH every FLUSH_INTERVAL seconds; /metrics
+# adds up all processes on the host. Staff users can read it; give scrapers
+# METRICS_TOKEN (sent as "Authorization: Bearer <token>") or list their
+# addresses in METRICS_ALLOWED_IPS. Behind a proxy on the same host every
+# request arrives from 127.0.0.1, so don't allow localhost there.
+METRICS = {
+    'ENABLED': os.environ.get('METRICS_ENABLED', '1') == '1',
+    'PATH': os.environ.get('METRICS_PATH', BASE_DIR / 'metrics'),
+    'FLUSH_INTERVAL': float(os.environ.get('METRICS_FLUSH_INTERVAL', 5)),
+    'TOKEN': os.environ.get('METRICS_TOKEN', ''),
+    'ALLOWED_IPS': [ip for ip in os.environ.get('METRICS_ALLOWED_IPS', '').split(',') if ip],
+}
+
+# Request profiling (see learning_platform/profiling.py), off by default.
+# SAMPLE_RATE of requests run under cProfile; requests slower than
+# SLOW_THRESHOLD seconds are stack-sampled. Staff can browse them at /profiles/.
+PROFILING = {
+    'ENABLED': os.environ.get('PROFILING_ENABLED', '0') == '1',
+    'PATH': os.environ.get('PROFILING_PATH', BASE_DIR / 'profiles'),
+    'SAMPLE_RATE': float(os.environ.get('PROFILING_SAMPLE_RATE', 0.0)),
+    'SLOW_THRESHOLD': float(os.environ.get('PROFILING_SLOW_THRESHOLD', 2.0)),
+    'MAX_PROFILES': int(os.environ.get('PROFILING_MAX_PROFILES', 200)),
+}
+
+# Per-student rate limits and global OpenAI admission control (see
+# learning_platform/ratelimit.py). Use BACKEND 'cache' when running several
+# worker processes; CACHE_ALIAS must name a shared cache, not LocMemCache.
+RATE_LIMITS = {
+    'ENABLED': os.environ.get('RATE_LIMITS_ENABLED', '1') == '1',
+    'BACKEND': os.environ.get('RATE_LIMIT_BACKEND', 'local'),
+    'CACHE_ALIAS': os.environ.get('RATE_LIMIT_CACHE_ALIAS', 'ratelimit'),
+    'STUDENT_REQUESTS_PER_MINUTE': 20,
+    'STUDENT_REQUEST_BURST': 10,
+    'STUDENT_TOKENS_PER_MINUTE': 20000,
+    'STUDENT_TOKEN_BURST': 40000,
+    'LLM_MAX_CONCURRENCY': int(os.environ.get('LLM_MAX_CONCURRENCY', 8)),
+    'ADMISSION_TIMEOUT': 2.0,
+    'BACKGROUND_ADMISSION_TIMEOUT': 120.0,
+}
@@ -0,0 +1,159 @@
+"""
+Correctness checks for the report card grade parser (learning_platform/grades.py)
+Run with: python test_grade_parser.py (or pytest test_grade_parser.py)
+"""
+import os
+import sys
+
+# Add the project directory to Python path
+sys.path.append(os.path.join(os.path.dirname(__file__)))
+
+from learning_platform.grades import parse_grades_tables, parse_grades_text, parse_report_card
+from learning_platform.synthetic import report_cards
+
+TEXT_CASES = [
+    (
+        "colon and percent",
+        "Mathematics: 78%\nEnglish Home Language: 64%\nLife Orientation: 81%",
+        {'Mathematics': 78, 'English Home Language': 64, 'Life Orientation': 81},
+    ),
+    (
+        "letter grades",
+        "Physical Sciences  B+\nHistory  A-\nGeography  C\nAccounting F",
+        {'Physical Sciences': 87, 'History': 90, 'Geography': 73, 'Accounting': 45},
+    ),
+    (
+        "fractions become percentages",
+        "Maths - 42/50\nBiology 3/4\nChemistry 100/150",
+        {'Mathematics': 84, 'Biology': 75, 'Chemistry': 66.7},
+    ),
+    (
+        "aliases",
+        "MATHS LIT 55\nPhys Sci 61\nEMS: 70%\nLO 88",
+        {'Mathematical Literacy': 55, 'Physical Sciences': 61, 'Economic and Management Sciences': 70,
+         'Life Orientation': 88},
+    ),
+    (
+        "header lines are not subjects",
+        "Learner Name: Sipho Dlamini\nGrade 11   Term 2   Year 2024\nDate: 12/06/2024\n"
+        "Days Absent: 4\nOverall Average: 67%\nPosition in class: 12\nMathematics 72",
+        {'Mathematics': 72},
+    ),
+    (
+        "final column chosen from the header",
+        "Subject  Term 1  Term 2  Final Mark  Level\nMathematics  55  61  64  5\nEnglish  70  72  75  6",
+        {'Mathematics': 64, 'English': 75},
+    ),
+    (
+        "mark column before the level",
+        "Learning Area   Mark (%)   Level\nAccounting   58   4\nTourism   91   7",
+        {'Accounting': 58, 'Tourism': 91},
+    ),
+    (
+        "blank line ends the header's table",
+        "Subject  Term 1  Final\nHistory  50  60\n\nComments\nMusic: 77%",
+        {'History': 60, 'Music': 77},
+    ),
+    (
+        "achievement levels alone are not marks",
+        "Mathematics 6\nEnglish 5\nGeography 70",
+        {'Geography': 70},
+    ),
+    (
+        "prose is ignored unless it names a subject",
+        "She scored 85 on her last test and improved by 12 points.\nHe did very well in maths 91",
+        {'Mathematics': 91},
+    ),
+    (
+        "several subjects on one line",
+        "Mathematics: 71%, English: 64%; History: 80%",
+        {'Mathematics': 71, 'English': 64, 'History': 80},
+    ),
+    (
+        "unknown capitalized subjects are kept",
+        "Robotics: 88%\nMarine Biology Studies 74",
+        {'Robotics': 88, 'Marine Biology Studies': 74},
+    ),
+    (
+        "out of range and decimal values",
+        "Mathematics 105\nEnglish 72.5%\nHistory 200/100",
+        {'English': 72.5},
+    ),
+    (
+        "first score for a repeated subject wins",
+        "Mathematics 60\nMathematics 90",
+        {'Mathematics': 60},
+    ),
+    ("empty text", "", {}),
+]
+
+TABLE_CASES = [
+    (
+        "header picks the final column",
+        [[["Subject", "Term 1", "Term 2", "Final Mark", "Level"],
+          ["Mathematics", "55", "61", "64", "5"],
+          ["Life\nSciences", "70", "72", "75", "6"]]],
+        {'Mathematics': 64, 'Life Sciences': 75},
+    ),
+    (
+        "no header row",
+        [[["Accounting", "B", None], ["Music", "", "81%"]]],
+        {'Accounting': 83, 'Music': 81},
+    ),
+    (
+        "short rows and empty cells",
+        [[["Subject", "Average"], ["History"], [None, None], ["Geography", "66"]]],
+        {'Geography': 66},
+    ),
+]
+
+
+def run_cases(cases, parse):
+    failures = 0
+    for name, given, expected in cases:
+        try:
+            found = parse(given)
+        except Exception as e:
+            found = f"{type(e).__name__}: {e}"
+        if found == expected:
+            print(f"[OK] {name}")
+        else:
+            failures += 1
+            print(f"[ERROR] {name}: expected {expected}, got {found}")
+    return failures
+
+
+def synthetic_failures(count=500):
+    failures = 0
+    for card in report_cards(count, seed=17):
+        if parse_report_card(card['text']) != card['expected']:
+            failures += 1
+    if failures:
+        print(f"[ERROR] {failures} of {count} synthetic report cards parsed incorrectly")
+    else:
+        print(f"[OK] {count} synthetic report cards parsed correctly")
+    return failures
+
+
+def grade_parser_failures():
+    print("Testing the report card grade parser...")
+    failures = run_cases(TEXT_CASES, parse_grades_text)
+    failures += run_cases(TABLE_CASES, parse_grades_tables)
+    failures += synthetic_failures()
+    return failures
+
+
+def test_synthetic_report_cards():
+    assert synthetic_failures() == 0
+
+
+def test_grade_parser():
+    assert grade_parser_failures() == 0
+
+
+if __name__ == '__main__':
+    if grade_parser_failures() == 0:
+        print("\n[SUCCESS] All grade parser tests passed!")
+    else:
+        print("\n[FAILED] Some grade parser tests failed.")
+        sys.exit(1)